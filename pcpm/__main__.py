@@ -3,13 +3,28 @@
 import argparse
 import logging
 import sys
+from pathlib import Path
 
+from .ds import TRACE_PATH
 from .cmds.build import build
 from .cmds.init import init
 from .cmds.install import install
 from .cmds.run import run
 from .cmds.remove import remove
 from .cmds.set_template import set_template
+from .cmds.index import index
+from .cmds.stats import stats
+from .cmds.analyze import analyze, SORT_KEYS
+from .cmds.daemon import daemon
+from .cmds.watch import watch
+from .cmds.pgo import pgo
+from .cmds.pack import pack
+from .cmds.worker import worker
+from .cmds.test import test
+from .cmds.bench import bench
+from .dist import DEFAULT_LISTEN
+from .daemon import build_via_daemon
+from .utils import set_profile
 
 logging.basicConfig(
     level=logging.INFO,
@@ -64,6 +79,17 @@ def main():
         action='store_true',
         help='Принудительно переустановить пакеты, игнорируя текущее состояние'
     )
+    install_parser.add_argument(
+        '--verify',
+        action='store_true',
+        help='Без сети проверить, что пакеты из pcpm.lock есть в хранилище и установлены'
+    )
+    install_parser.add_argument(
+        '-j', '--jobs',
+        type=int,
+        metavar='N',
+        help='Сколько пакетов скачивать одновременно (по умолчанию install_workers из конфига или 4)'
+    )
     install_parser.add_argument(
         'pkg_names',
         nargs='*',
@@ -75,6 +101,54 @@ def main():
         aliases=['b'],
         help='Собрать проект'
     )
+    build_parser.add_argument(
+        '-f', '--force',
+        action='store_true',
+        help='Полная пересборка, игнорируя манифест инкрементальной сборки'
+    )
+    build_parser.add_argument(
+        '-j', '--jobs',
+        type=int,
+        metavar='N',
+        help='Общий лимит параллельных задач сборки (по умолчанию workers из конфига)'
+    )
+    build_parser.add_argument(
+        '--trace',
+        nargs='?',
+        const=str(TRACE_PATH),
+        metavar='FILE',
+        help=f'Записать таймлайн сборки в формате Chrome trace (по умолчанию {TRACE_PATH})'
+    )
+    build_parser.add_argument(
+        '--hot',
+        action='store_true',
+        help='Hot-reload: хост + код проекта отдельной библиотекой, запущенный хост подхватывает новую версию'
+    )
+    build_parser.add_argument(
+        '--unity',
+        action='store_true',
+        help='Unity-сборка: склеить исходники в пачки (настройки - ключ unity в конфиге)'
+    )
+    build_parser.add_argument(
+        '--profile',
+        metavar='NAME',
+        help='Профиль сборки из "profiles" в конфиге (свои флаги и build/<профиль>/)'
+    )
+    build_parser.add_argument(
+        '--lto',
+        action='store_true',
+        help='Link-time optimization (gcc: -flto=auto, clang: ThinLTO), даже если lto не включен в конфиге'
+    )
+    build_parser.add_argument(
+        '--pgo',
+        action='store_true',
+        help='Сборка с PGO: инструментированная сборка, обучающие запуски (ключ pgo в конфиге), пересборка по профилю'
+    )
+    build_parser.add_argument(
+        '--no-daemon',
+        action='store_true',
+        help='Собрать в этом процессе, даже если запущен демон сборки'
+    )
     build_subparsers = build_parser.add_subparsers(
         dest='build_subcommand',
         help='Подкоманды сборки'
@@ -96,6 +170,16 @@ def main():
         parents=[common],
         help='Запустить проект'
     )
+    run_parser.add_argument(
+        '--hot',
+        action='store_true',
+        help='Собрать в режиме hot-reload, запустить хост и пересобирать библиотеку при изменениях без перезапуска'
+    )
+    run_parser.add_argument(
+        '--profile',
+        metavar='NAME',
+        help='Профиль сборки из "profiles" в конфиге (свои флаги и build/<профиль>/)'
+    )
     run_parser.add_argument(
         'run_args',
         nargs='*',
@@ -119,25 +203,290 @@ def main():
         help='Создать или обновить шаблон конфигурационного файла config.json'
     )
 
+    index_parser = subparsers.add_parser(
+        'index',
+        help='Создать index.json (размеры и sha256 архивов) для директории-зеркала'
+    )
+    index_parser.add_argument(
+        'mirror_dir',
+        help='Директория с <пакет>.tar.gz'
+    )
+
+    pack_parser = subparsers.add_parser(
+        'pack',
+        help='Упаковать готовые артефакты пакетов из последней сборки для зеркала'
+    )
+    pack_parser.add_argument(
+        'mirror_dir',
+        help='Директория зеркала (артефакты - в prebuilt/<пакет>/)'
+    )
+    pack_parser.add_argument(
+        'pkg_names',
+        nargs='*',
+        help='Пакеты (по умолчанию - все из dependencies)'
+    )
+
+    test_parser = subparsers.add_parser(
+        'test',
+        aliases=['t'],
+        help='Собрать и запустить тесты из tests/ (каждый файл - отдельный бинарник)'
+    )
+    test_parser.add_argument(
+        'patterns',
+        nargs='*',
+        help='Только тесты, чьи имена подходят под glob (например net/*)'
+    )
+    test_parser.add_argument(
+        '-f', '--force',
+        action='store_true',
+        help='Полная пересборка (игнорировать манифест)'
+    )
+    test_parser.add_argument(
+        '-j', '--jobs',
+        type=int,
+        metavar='N',
+        help='Лимит параллельных задач сборки и тестов (по умолчанию workers из конфига)'
+    )
+    test_parser.add_argument(
+        '--shard',
+        metavar='I/N',
+        help='Запустить только i-ю из n частей тестов (для нескольких машин CI)'
+    )
+    test_parser.add_argument(
+        '--junit',
+        metavar='FILE',
+        help='Куда записать JUnit XML (по умолчанию build/tests/junit.xml)'
+    )
+    test_parser.add_argument(
+        '--timeout',
+        type=float,
+        metavar='SEC',
+        help='Таймаут одного теста в секундах (по умолчанию tests.timeout из конфига или 60)'
+    )
+    test_parser.add_argument(
+        '--profile',
+        metavar='NAME',
+        help='Профиль сборки из "profiles" в конфиге (свои флаги и build/<профиль>/)'
+    )
+
+    bench_parser = subparsers.add_parser(
+        'bench',
+        help='Замеры производительности цели (release) со сравнением с базовой линией'
+    )
+    bench_parser.add_argument(
+        'cases',
+        nargs='*',
+        help='Случаи из bench.cases (по умолчанию все)'
+    )
+    bench_parser.add_argument(
+        '-n', '--runs',
+        type=int,
+        metavar='N',
+        help='Замеряемых запусков на случай (по умолчанию bench.runs или 10)'
+    )
+    bench_parser.add_argument(
+        '--warmup',
+        type=int,
+        metavar='N',
+        help='Прогревочных запусков (по умолчанию bench.warmup или 1)'
+    )
+    bench_parser.add_argument(
+        '--cpus',
+        type=lambda v: [int(c) for c in v.split(',')],
+        metavar='0,2',
+        help='Привязать запуски к ядрам (linux)'
+    )
+    bench_parser.add_argument(
+        '--profile',
+        metavar='NAME',
+        help='Профиль сборки (по умолчанию bench.profile или release, если он есть)'
+    )
+    bench_parser.add_argument(
+        '--save',
+        action='store_true',
+        help='Записать замеры как базовую линию'
+    )
+    bench_parser.add_argument(
+        '--threshold',
+        type=float,
+        metavar='PCT',
+        help='Рост медианы в %%, после которого - регрессия (по умолчанию bench.threshold или 5)'
+    )
+    bench_parser.add_argument(
+        '--no-build',
+        action='store_true',
+        help='Не собирать перед замерами'
+    )
+    bench_parser.add_argument(
+        '-j', '--jobs',
+        type=int,
+        metavar='N',
+        help='Общий лимит параллельных задач сборки (по умолчанию workers из конфига)'
+    )
+
+    stats_parser = subparsers.add_parser(
+        'stats',
+        help='Статистика по последним сборкам: долгие TU и пакеты, кэш, тренды'
+    )
+    stats_parser.add_argument(
+        '-n',
+        type=int,
+        default=20,
+        metavar='N',
+        help='Сколько последних сборок учитывать (по умолчанию 20)'
+    )
+
+    analyze_parser = subparsers.add_parser(
+        'analyze',
+        help='Какие заголовки дороже всего обходятся сборке (по depfile и -ftime-trace)'
+    )
+    analyze_parser.add_argument(
+        '-n',
+        type=int,
+        default=20,
+        metavar='N',
+        help='Сколько заголовков показать (по умолчанию 20)'
+    )
+    analyze_parser.add_argument(
+        '--profile',
+        metavar='NAME',
+        help='Профиль сборки из "profiles" в конфиге (свои флаги и build/<профиль>/)'
+    )
+    analyze_parser.add_argument(
+        '--sort',
+        choices=SORT_KEYS,
+        default='cost',
+        help='cost - ожидаемое время пересборки, tus - число зависимых TU, time - время фронтенда'
+    )
+
+    daemon_parser = subparsers.add_parser(
+        'daemon',
+        help='Фоновый демон сборки проекта: держит конфиг, модули пакетов и состояние файлов в памяти'
+    )
+    daemon_parser.add_argument(
+        'action',
+        choices=['start', 'stop', 'status', 'serve'],
+        help='serve - работать в текущем процессе (start запускает его в фоне)'
+    )
+    daemon_parser.add_argument(
+        '--polling',
+        action='store_true',
+        help='Отслеживать файлы опросом вместо inotify'
+    )
+
+    worker_parser = subparsers.add_parser(
+        'worker',
+        help='Воркер распределенной сборки: компилирует TU, присланные другими машинами'
+    )
+    worker_parser.add_argument(
+        '--listen',
+        default=DEFAULT_LISTEN,
+        metavar='ADDR',
+        help=f'host:port или unix:/путь (по умолчанию {DEFAULT_LISTEN}; только доверенная сеть)'
+    )
+    worker_parser.add_argument(
+        '--slots',
+        type=int,
+        metavar='N',
+        help='Сколько TU компилировать одновременно (по умолчанию число ядер)'
+    )
+
+    watch_parser = subparsers.add_parser(
+        'watch',
+        aliases=['w'],
+        help='Пересобирать и перезапускать проект при изменении файлов'
+    )
+    watch_parser.add_argument(
+        '--no-run',
+        action='store_true',
+        help='Только пересобирать, не запуская цель'
+    )
+    watch_parser.add_argument(
+        '-j', '--jobs',
+        type=int,
+        metavar='N',
+        help='Общий лимит параллельных задач сборки (по умолчанию workers из конфига)'
+    )
+    watch_parser.add_argument(
+        '--hot',
+        action='store_true',
+        help='Пересобирать в режиме hot-reload: цель не перезапускается, а подгружает новую библиотеку'
+    )
+    watch_parser.add_argument(
+        '--profile',
+        metavar='NAME',
+        help='Профиль сборки из "profiles" в конфиге (свои флаги и build/<профиль>/)'
+    )
+    watch_parser.add_argument(
+        '--polling',
+        action='store_true',
+        help='Отслеживать файлы опросом вместо inotify'
+    )
+    watch_parser.add_argument(
+        'run_args',
+        nargs='*',
+        help='Аргументы, передаваемые приложению'
+    )
+
     if len(sys.argv) == 1:
         parser.print_help()
         sys.exit(0)
 
     args = parser.parse_args()
 
+    # профиль нужен и командам после сборки (build run), и тем, что только читают build/<профиль>/
+    if getattr(args, "profile", None) is not None and not set_profile(args.profile):
+        sys.exit(1)
+
     if args.command == 'init':
         init(name=args.name, dir=args.dir)
     elif args.command == 'install' or args.command == 'i':
-        install(args.pkg_names, True if args.force is not None else False)
+        if not install(args.pkg_names, args.force, args.jobs, args.verify):
+            sys.exit(1)
     elif args.command == 'build' or args.command == 'b':
-        if build() and args.build_subcommand == 'run':
+        trace: Path|None = Path(args.trace) if args.trace else None
+        if args.pgo:
+            # три стадии со своими флагами и запуск цели - всегда в этом процессе
+            ok: bool|None = pgo(args.force, args.jobs, args.profile, args.lto)
+        else:
+            ok = None if args.no_daemon else build_via_daemon(args.force, args.jobs, trace, args.hot, args.unity, args.profile, args.lto)
+            if ok is None: ok = build(args.force, args.jobs, trace, args.hot, args.unity, args.profile, args.lto)
+        if not ok: sys.exit(1)
+        if args.build_subcommand == 'run':
+            run(args.run_args)
+    elif args.command == 'run' or args.command == 'r':
+        if args.hot:
+            if not watch(args.run_args, hot=True, profile=args.profile): sys.exit(1)
+        else:
             run(args.run_args)
-    elif args.command == 'run':
-        run(args.run_args)
     elif args.command == "remove":
         remove(args.remove_args)
     elif args.command == "set_template":
         set_template()
+    elif args.command == "index":
+        if not index(args.mirror_dir): sys.exit(1)
+    elif args.command == "pack":
+        if not pack(args.mirror_dir, args.pkg_names): sys.exit(1)
+    elif args.command == "test" or args.command == "t":
+        junit: Path|None = Path(args.junit) if args.junit else None
+        if not test(args.patterns, args.force, args.jobs, args.shard, junit, args.timeout, args.profile): sys.exit(1)
+    elif args.command == "bench":
+        if not bench(args.cases, args.runs, args.warmup, args.cpus, args.profile, args.save, args.threshold, not args.no_build, args.jobs):
+            sys.exit(1)
+    elif args.command == "stats":
+        if not stats(args.n): sys.exit(1)
+    elif args.command == "analyze":
+        if not analyze(args.n, args.sort): sys.exit(1)
+    elif args.command == "watch" or args.command == "w":
+        if not watch(args.run_args, not args.no_run, args.jobs, args.polling, args.hot, args.profile): sys.exit(1)
+    elif args.command == "daemon":
+        if not daemon(args.action, args.polling): sys.exit(1)
+    elif args.command == "worker":
+        if not worker(args.listen, args.slots): sys.exit(1)
     
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    try:
+        main()
+    except KeyboardInterrupt:
+        # Ctrl-C или отмена сборки из pcpm watch
+        sys.exit(130)
\ No newline at end of file
@@ -0,0 +1,251 @@
+from pathlib import Path
+import json
+import logging
+import math
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from .ds import BENCH_PATH, ROOT_PATH, BenchCase, BenchConfig, BenchStats, BenchSummary, Config
+from .utils import get_compiler
+
+logger = logging.getLogger(__name__)
+
+BASELINE_VERSION = 1
+DEFAULT_BASELINE = ROOT_PATH/"bench_baseline.json"
+DEFAULT_PROFILE = "release"
+DEFAULT_RUNS = 10
+DEFAULT_WARMUP = 1
+DEFAULT_THRESHOLD = 5.0
+CI_LEVEL = 0.95
+
+LAUNCHER_C = r'''// сгенерировано pcpm (pcpm bench), не редактировать
+#define _GNU_SOURCE
+#include <errno.h>
+#include <fcntl.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <time.h>
+#include <unistd.h>
+#include <sys/resource.h>
+#include <sys/wait.h>
+#ifdef __linux__
+#include <sched.h>
+#endif
+
+/* launcher <ядра через запятую или -> <программа> [аргументы...]
+ * печатает: <код|-сигнал> <wall нс> <user мкс> <sys мкс> <maxrss> */
+int main(int argc, char **argv) {
+    if (argc < 3) return 2;
+#ifdef __linux__
+    if (strcmp(argv[1], "-") != 0) {
+        cpu_set_t set;
+        CPU_ZERO(&set);
+        for (char *p = argv[1]; *p;) {
+            CPU_SET((int)strtol(p, &p, 10), &set);
+            if (*p == ',') p++;
+        }
+        if (sched_setaffinity(0, sizeof(set), &set) != 0) {
+            perror("sched_setaffinity");
+            return 2;
+        }
+    }
+#endif
+    struct timespec t0, t1;
+    clock_gettime(CLOCK_MONOTONIC, &t0);
+    pid_t pid = fork();
+    if (pid < 0) {
+        perror("fork");
+        return 2;
+    }
+    if (pid == 0) {
+        int null = open("/dev/null", O_WRONLY);
+        if (null >= 0) dup2(null, 1);
+        execvp(argv[2], argv + 2);
+        perror(argv[2]);
+        _exit(127);
+    }
+    int status;
+    struct rusage ru;
+    while (wait4(pid, &status, 0, &ru) < 0) {
+        if (errno != EINTR) {
+            perror("wait4");
+            return 2;
+        }
+    }
+    clock_gettime(CLOCK_MONOTONIC, &t1);
+    int code = WIFEXITED(status) ? WEXITSTATUS(status) : -WTERMSIG(status);
+    printf("%d %lld %lld %lld %ld\n", code,
+        (long long)(t1.tv_sec - t0.tv_sec) * 1000000000LL + (t1.tv_nsec - t0.tv_nsec),
+        (long long)ru.ru_utime.tv_sec * 1000000LL + ru.ru_utime.tv_usec,
+        (long long)ru.ru_stime.tv_sec * 1000000LL + ru.ru_stime.tv_usec,
+        (long)ru.ru_maxrss);
+    return 0;
+}
+'''
+
+class Sample:
+    def __init__(self, wall: float, user_time: float, sys_time: float, rss: float):
+        self.wall = wall
+        self.user = user_time
+        self.sys = sys_time
+        self.rss = rss
+
+def bench_config(config: Config) -> BenchConfig:
+    return config.get("bench", {})
+
+def bench_cases(conf: BenchConfig) -> dict[str, BenchCase]:
+    cases = conf.get("cases")
+    if not cases: return {"default": {}}
+    return {name: {"args": case} if isinstance(case, list) else case for name, case in cases.items()}
+
+def bench_profile(config: Config, conf: BenchConfig) -> str|None:
+    if "profile" in conf: return conf["profile"]
+    return DEFAULT_PROFILE if DEFAULT_PROFILE in config.get("profiles", {}) else None
+
+def baseline_path(conf: BenchConfig) -> Path:
+    return Path(conf["baseline"]) if "baseline" in conf else DEFAULT_BASELINE
+
+def bench_supported() -> bool:
+    return os.name == "posix"
+
+def affinity_supported() -> bool:
+    return sys.platform.startswith("linux")
+
+def ensure_launcher() -> Path|None:
+    """
+    build/bench/launcher: маленький процесс, который сам запускает цель и замеряет ее.
+    замерять из python нельзя: при exec ребенок наследует пиковый RSS родителя
+    (ядро переносит его из старого адресного пространства), и для маленьких программ
+    ru_maxrss показывал бы размер интерпретатора
+    """
+    src: Path = BENCH_PATH/"launcher.c"
+    exe: Path = BENCH_PATH/"launcher"
+    if exe.exists() and src.exists() and src.read_text() == LAUNCHER_C: return exe
+    cc: str|None = get_compiler()
+    if cc is None: return None
+    src.parent.mkdir(parents=True, exist_ok=True)
+    src.write_text(LAUNCHER_C)
+    exe.unlink(missing_ok=True)
+    if subprocess.run([cc, "-O2", "-o", str(exe), str(src)]).returncode != 0:
+        logger.error(f"не удалось собрать {exe}")
+        return None
+    return exe
+
+def measure(launcher: Path, cmd: list[str], cwd: Path, cpus: list[int]|None, timeout: float|None) -> Sample|str:
+    """
+    один запуск через launcher: wall по монотонным часам вокруг fork/wait4, user/sys и пиковый RSS цели.
+    return Sample или текст ошибки
+    """
+    argv: list[str] = [str(launcher.resolve()), ",".join(map(str, cpus)) if cpus else "-"]+cmd
+    with tempfile.TemporaryFile() as err:
+        try:
+            # своя сессия: по таймауту убиваем и launcher, и цель
+            proc = subprocess.Popen(argv, cwd=cwd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=err, start_new_session=True)
+        except OSError as e:
+            return str(e)
+        try:
+            out, _ = proc.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            os.killpg(proc.pid, signal.SIGKILL)
+            proc.communicate()
+            return f"не завершился за {timeout:g}с"
+        err.seek(0)
+        tail: str = err.read()[-2048:].decode(errors="replace").strip()
+
+    try:
+        code, wall_ns, user_us, sys_us, maxrss = (int(x) for x in out.split())
+    except ValueError:
+        return f"launcher завершился с кодом {proc.returncode}" + (f": {tail}" if tail else "")
+    if code < 0:
+        try:
+            return f"убит сигналом {signal.Signals(-code).name}"
+        except ValueError:
+            return f"убит сигналом {-code}"
+    if code != 0: return f"код возврата {code}" + (f": {tail}" if tail else "")
+    # ru_maxrss: KB на linux, байты на macOS
+    rss: float = maxrss / (1024*1024 if sys.platform == "darwin" else 1024)
+    return Sample(wall_ns/1e9, user_us/1e6, sys_us/1e6, rss)
+
+def median_ci(xs: list[float], level: float = CI_LEVEL) -> tuple[float, float]:
+    """
+    доверительный интервал медианы без предположений о распределении: порядковые статистики
+    x(k)..x(n-k+1), k - наибольшее, при котором P(Bin(n, 1/2) <= k-1) <= (1-level)/2.
+    при n < 6 уровень недостижим, интервал - весь размах
+    """
+    xs = sorted(xs)
+    n: int = len(xs)
+    alpha: float = (1-level)/2
+    k: int = 1
+    cdf: float = 0.0
+    for j in range(1, n//2+1):
+        cdf += math.comb(n, j-1) / 2**n
+        if cdf > alpha: break
+        k = j
+    return xs[k-1], xs[n-k]
+
+def stats(xs: list[float]) -> BenchStats:
+    med: float = statistics.median(xs)
+    low, high = median_ci(xs)
+    return {"median": med, "mad": statistics.median(abs(x - med) for x in xs), "ci": [low, high]}
+
+def summarize(samples: list[Sample]) -> BenchSummary:
+    return {
+        "runs": len(samples),
+        "wall": stats([s.wall for s in samples]),
+        "user": stats([s.user for s in samples]),
+        "sys": stats([s.sys for s in samples]),
+        "rss": stats([s.rss for s in samples]),
+        "samples": [round(s.wall, 6) for s in samples],
+    }
+
+def load_baseline(pth: Path) -> dict[str, BenchSummary]:
+    if not pth.exists(): return {}
+    try:
+        with open(pth) as fd:
+            data: dict = json.load(fd)
+    except (OSError, ValueError) as e:
+        logger.warning(f"базовая линия '{pth}' повреждена: {e}")
+        return {}
+    if data.get("version") != BASELINE_VERSION: return {}
+    return data.get("cases", {})
+
+def save_baseline(pth: Path, cases: dict[str, BenchSummary], meta: dict):
+    """
+    обновляет только прогнанные сейчас случаи, остальные остаются из файла
+    """
+    merged: dict[str, BenchSummary] = {**load_baseline(pth), **cases}
+    pth.parent.mkdir(parents=True, exist_ok=True)
+    tmp: Path = pth.with_suffix(".tmp")
+    with open(tmp, "w") as fd:
+        json.dump({"version": BASELINE_VERSION, **meta, "cases": merged}, fd, indent=4)
+    os.replace(tmp, pth)
+
+def regression(current: BenchSummary, base: BenchSummary, threshold: float) -> float|None:
+    """
+    return рост медианы wall в %, если это регрессия: медиана выросла больше threshold
+    и весь доверительный интервал текущей медианы выше базовой (не шум)
+    """
+    base_med: float = base["wall"]["median"]
+    if base_med <= 0: return None
+    delta: float = (current["wall"]["median"] - base_med) / base_med * 100
+    if delta > threshold and current["wall"]["ci"][0] > base_med: return delta
+    return None
+
+def fmt_time(seconds: float) -> str:
+    if seconds < 1e-3: return f"{seconds*1e6:.1f}мкс"
+    if seconds < 1: return f"{seconds*1e3:.2f}мс"
+    return f"{seconds:.3f}с"
+
+def describe(summary: BenchSummary) -> str:
+    w: BenchStats = summary["wall"]
+    return (
+        f"wall {fmt_time(w['median'])} ± {fmt_time(w['mad'])} "
+        f"(CI {CI_LEVEL:.0%} {fmt_time(w['ci'][0])}..{fmt_time(w['ci'][1])}), "
+        f"user {fmt_time(summary['user']['median'])}, sys {fmt_time(summary['sys']['median'])}, "
+        f"RSS {summary['rss']['median']:.1f}MB, запусков {summary['runs']}"
+    )
@@ -0,0 +1,70 @@
+from pathlib import Path
+import logging
+import statistics
+
+from ..ds import MANIFEST_PATH, TIMINGS_PATH
+from ..includes import load_include_graph, load_time_trace, to_src_path
+from ..scheduler import BuildTimings
+from ..utils import profile_path
+
+logger = logging.getLogger(__name__)
+
+SORT_KEYS = ("cost", "tus", "time")
+
+def analyze(n: int = 20, sort: str = "cost") -> bool:
+    """
+    рейтинг заголовков по влиянию на сборку:
+        tus  - сколько TU пересоберется при изменении заголовка,
+        time - суммарное время фронтенда на заголовок (только clang с -ftime-trace),
+        cost - ожидаемое время пересборки: сумма времен компиляции зависимых TU
+               по build/timings.json
+    """
+    graph: dict[str, list[str]] = load_include_graph()
+    if not graph:
+        logger.error(f"граф включений пуст ({profile_path(MANIFEST_PATH)}): нужна инкрементальная сборка (pcpm build)")
+        return False
+
+    timings = BuildTimings(profile_path(TIMINGS_PATH))
+    known: list[float] = [t for t in (timings.get(deps[0]) for deps in graph.values()) if t is not None]
+    default_tu_time: float = statistics.median(known) if known else 0.0
+
+    dependents: dict[str, set[str]] = {}
+    frontend: dict[str, float] = {}
+    traced: int = 0
+    for obj, deps in graph.items():
+        tu: str = deps[0]
+        headers: set[str] = set(deps[1:])
+
+        # clang -ftime-trace кладет obj.json рядом с объектником
+        trace: dict[str, float] = load_time_trace(Path(obj).with_suffix(".json"))
+        if trace: traced += 1
+        for header, seconds in trace.items():
+            if header == tu: continue
+            headers.add(header)
+            frontend[header] = frontend.get(header, 0.0) + seconds
+
+        for header in headers:
+            dependents.setdefault(header, set()).add(tu)
+
+    if not dependents:
+        logger.info("ни один TU не подключает заголовков")
+        return True
+
+    rows: list[tuple[str, int, float|None, float]] = []
+    for header, tus in dependents.items():
+        cost: float = sum(t if (t := timings.get(tu)) is not None else default_tu_time for tu in tus)
+        rows.append((header, len(tus), frontend.get(header), cost))
+
+    index: int = {"tus": 1, "time": 2, "cost": 3}[sort]
+    rows.sort(key=lambda r: (r[index] or 0.0, r[1]), reverse=True)
+
+    logger.info(
+        f"TU: {len(graph)}, заголовков: {len(dependents)}, "
+        f"с -ftime-trace: {traced}{'' if traced else ' (время фронтенда - только clang с -ftime-trace в compilation_args)'}"
+    )
+    logger.info(f"{'TU':>5}  {'фронтенд':>9}  {'пересборка':>10}  заголовок")
+    for header, tus, ftime, cost in rows[:n]:
+        logger.info(
+            f"{tus:>5}  {f'{ftime:.3f}с' if ftime is not None else '-':>9}  {cost:>9.3f}с  {to_src_path(header)}"
+        )
+    return True
@@ -0,0 +1,122 @@
+from pathlib import Path
+import logging
+import time
+
+from ..bench import DEFAULT_RUNS, DEFAULT_THRESHOLD, DEFAULT_WARMUP, Sample, affinity_supported, bench_supported, ensure_launcher, baseline_path, bench_cases, bench_config, bench_profile, describe, fmt_time, load_baseline, measure, regression, save_baseline, summarize
+from ..ds import BIN_PATH, BenchCase, BenchConfig, BenchSummary, Config
+from ..utils import get_arch, get_bin_suffix, get_compiler, get_compiler_id, get_platform, get_profile, load_config, profile_path, set_profile
+from .build import build
+
+logger = logging.getLogger(__name__)
+
+def run_case(launcher: Path, name: str, case: BenchCase, config: Config, runs: int, warmup: int, cpus: list[int]|None, timeout: float|None) -> BenchSummary|None:
+    exe: Path = profile_path(BIN_PATH)/(case.get("bin", config["target_name"])+get_bin_suffix())
+    if not exe.exists():
+        logger.error(f"{name}: '{exe}' не найден")
+        return None
+    cmd: list[str] = [str(exe.resolve())]+case.get("args", [])
+
+    samples: list[Sample] = []
+    for i in range(warmup+runs):
+        result: Sample|str = measure(launcher, cmd, profile_path(BIN_PATH), cpus, timeout)
+        if isinstance(result, str):
+            logger.error(f"{name}: запуск {i+1}: {result}")
+            return None
+        # прогревочные запуски (кэши, page cache, частота CPU) в статистику не идут
+        if i >= warmup: samples.append(result)
+    return summarize(samples)
+
+def bench(
+    names: list[str],
+    runs: int|None = None,
+    warmup: int|None = None,
+    cpus: list[int]|None = None,
+    profile: str|None = None,
+    save: bool = False,
+    threshold: float|None = None,
+    build_first: bool = True,
+    jobs: int|None = None,
+) -> bool:
+    """
+    собирает профиль (по умолчанию release) и гоняет случаи из "bench": {"cases": ...}:
+    warmup прогревочных и runs замеряемых запусков, медиана, MAD и доверительный интервал медианы
+    по wall, user, sys и пиковому RSS. с базовой линией (bench_baseline.json) сравнивается медиана wall,
+    рост больше threshold % (и вне шума) - регрессия и return False. save - записать замеры как базовую линию
+    """
+    if not bench_supported():
+        logger.error("pcpm bench работает только на POSIX (linux, macOS)")
+        return False
+    config: Config|None = load_config()
+    if config is None: return False
+    conf: BenchConfig = bench_config(config)
+
+    prof: str|None = profile if profile is not None else bench_profile(config, conf)
+    if prof is None:
+        logger.warning('профиль "release" не задан в profiles, замеры на обычной сборке')
+    prev_profile: str|None = get_profile()
+    if not set_profile(prof): return False
+    try:
+        if build_first and not build(False, jobs, profile=prof): return False
+
+        launcher: Path|None = ensure_launcher()
+        if launcher is None: return False
+
+        cases: dict[str, BenchCase] = bench_cases(conf)
+        unknown: list[str] = [n for n in names if n not in cases]
+        if unknown:
+            logger.error(f"нет случаев {', '.join(unknown)} в bench.cases, есть: {', '.join(cases)}")
+            return False
+        if names: cases = {n: c for n, c in cases.items() if n in names}
+
+        runs = runs if runs is not None else conf.get("runs", DEFAULT_RUNS)
+        warmup = warmup if warmup is not None else conf.get("warmup", DEFAULT_WARMUP)
+        if runs < 1 or warmup < 0:
+            logger.error("нужен хотя бы один замеряемый запуск и неотрицательный warmup")
+            return False
+        cpus = cpus if cpus is not None else conf.get("cpus")
+        if cpus and not affinity_supported():
+            logger.warning("привязка к ядрам не поддерживается на этой платформе, запуски без нее")
+            cpus = None
+        limit: float = threshold if threshold is not None else conf.get("threshold", DEFAULT_THRESHOLD)
+
+        pth: Path = baseline_path(conf)
+        baseline: dict[str, BenchSummary] = load_baseline(pth)
+        results: dict[str, BenchSummary] = {}
+        regressions: list[str] = []
+        logger.info(f"bench: запусков {runs} (+{warmup} прогревочных){', ядра ' + ','.join(map(str, cpus)) if cpus else ''}")
+        for name, case in cases.items():
+            summary: BenchSummary|None = run_case(launcher, name, case, config, runs, warmup, cpus, conf.get("timeout"))
+            if summary is None: return False
+            results[name] = summary
+
+            base: BenchSummary|None = baseline.get(name)
+            if base is None:
+                logger.info(f"{name}: {describe(summary)}")
+                continue
+            base_med: float = base["wall"]["median"]
+            delta: float = (summary["wall"]["median"] - base_med) / base_med * 100 if base_med > 0 else 0.0
+            line: str = f"{name}: {describe(summary)}; базовая {fmt_time(base_med)} ({delta:+.1f}%)"
+            if regression(summary, base, limit) is not None:
+                regressions.append(name)
+                logger.error(f"{line} - регрессия, порог {limit:g}%")
+            else:
+                logger.info(line)
+
+        if save:
+            cc: str|None = get_compiler()
+            save_baseline(pth, results, {
+                "time": time.time(),
+                "profile": prof,
+                "arch": get_arch(),
+                "platform": get_platform(),
+                "compiler": get_compiler_id(cc).split(" | ")[-1] if cc is not None else None,
+            })
+            logger.info(f"базовая линия записана в {pth}")
+            # новые замеры и есть новая базовая линия
+            return True
+        if regressions:
+            logger.error(f"регрессии: {', '.join(regressions)}")
+            return False
+        return True
+    finally:
+        set_profile(prev_profile)
@@ -3,19 +3,77 @@ import os
 from pathlib import Path
 import subprocess
 import shutil
+import functools
+import time
+from types import ModuleType
 
-from ..ds import BIN_PATH, TMP_SRC_PATH, COMPILE_ARGS, Config, BuildArgs, BUILD_PATHS, PKGS_PATH, BuildFuncType, TMP_SRC_PATH, SRC_PATH, OBJS_PATH
-from ..utils import get_compiler, get_module, load_config, get_linker, compile
+from ..ds import BuildRecord, BIN_PATH, TMP_SRC_PATH, COMPILE_ARGS, Config, BuildArgs, BUILD_PATHS, PKGS_PATH, BuildFuncType, TMP_SRC_PATH, SRC_PATH, OBJS_PATH, MANIFEST_PATH, TIMINGS_PATH, HOOKS_PATH, HookSpec, PackageConfig, SpecFuncType, HOT_PATH, HOT_OBJS_PATH, UNITY_PATH, BUILD_PATH, UnityConfig
+from ..utils import get_compiler, get_module, load_config, get_profile, set_profile, profile_path, config_overlay, get_linker, compile, get_compiler_id, get_object_cache, get_workers, load_pkg_config, run_measured, get_memory_budget, copy_tree
+from ..hookcache import HookCache, toolchain_id
+from ..manifest import BuildManifest
+from ..scheduler import BuildTimings, Node, Scheduler
+from ..dist import DistPool, connect_workers, set_dist_pool
+from ..jobserver import JobServer, make_jobserver, jobserver_env
+from ..objcache import ObjectCache
+from ..trace import Tracer, set_tracer, span
+from ..history import HISTORY_TOP_TUS, append_history
+from ..unity import estimate_costs, is_excluded, map_diagnostics, plan_batches, unity_config, write_batches
+from ..pch import prepare_pch
+from ..optimize import lto_overlay
+from ..linking import archive_package, link_overlay
+from ..prebuilt import try_prebuilt
+from ..testing import test_bin, test_obj, without_main
+from ..hot import HOT_ARGS, current_version, host_args, hot_supported, lib_suffix, publish, shared_args, write_host
 
 logger = logging.getLogger(__name__)
 
 def make_build_folder():
-    if TMP_SRC_PATH.exists():
-        shutil.rmtree(TMP_SRC_PATH)
-        
+    # build/tmp_src не удаляется: copy_tree обновляет только изменившиеся файлы и убирает лишние
     for dir in BUILD_PATHS:
-        os.makedirs(dir, exist_ok=True) 
+        os.makedirs(profile_path(dir), exist_ok=True) 
     
+def get_hook_spec(p: str, main_mod: ModuleType, conf: dict) -> HookSpec|None:
+    pkg_config: PackageConfig|None = load_pkg_config(p)
+    if pkg_config is not None and "hook" in pkg_config:
+        return pkg_config["hook"]
+    spec_fn: SpecFuncType|None = getattr(main_mod, "spec", None)
+    if spec_fn is None: return None
+    return spec_fn(TMP_SRC_PATH, PKGS_PATH/p, conf)
+
+def build_pkg(p: str, conf: dict, build_args: BuildArgs) -> bool:
+    try:
+        main_mod = get_module(p)
+        if main_mod is None: return False
+
+        spec: HookSpec|None = get_hook_spec(p, main_mod, conf)
+        hook_cache: HookCache|None = HookCache(HOOKS_PATH/p) if spec is not None else None
+        fingerprint: str = ""
+        ba: BuildArgs|None = None
+        if hook_cache is not None and spec is not None:
+            fingerprint = hook_cache.fingerprint(p, PKGS_PATH/p, conf, spec, toolchain_id(load_config() or {}))
+            ba = hook_cache.restore(fingerprint, TMP_SRC_PATH)
+            if ba is not None: logger.info(f"{p}: входы хука не изменились, результат из кэша")
+            else: ba = try_prebuilt(p, conf, spec, hook_cache, fingerprint, TMP_SRC_PATH)
+
+        if ba is None:
+            build_fn: BuildFuncType = main_mod.build
+            ba = build_fn(TMP_SRC_PATH, PKGS_PATH/p, conf)
+            if ba is None: raise Exception("BuildArgs is None")
+            if hook_cache is not None and spec is not None:
+                hook_cache.store(fingerprint, TMP_SRC_PATH, spec, ba)
+    except Exception as e:
+        logger.error(f"Ошибка сборки модуля {p} e: {e}")
+        return False
+
+    # объектники пакета линкуются одним архивом, который пересобирается только вместе с пакетом
+    objs: list[str]|None = archive_package(p, ba["objs"])
+    if objs is None: return False
+
+    build_args["link"] += ba["link"]
+    build_args["source"] += ba["source"]
+    build_args["objs"] += objs
+    return True
+
 def build_pkgs(config: Config) -> BuildArgs|None:
     all_ba: BuildArgs = {"link":[],"objs":[],"source":[]}
     
@@ -25,27 +83,15 @@ def build_pkgs(config: Config) -> BuildArgs|None:
         return None
 
     for p in dependencies.keys():
-        try:
-            main_mod = get_module(p)
-            if main_mod is None: return None
-            build_fn: BuildFuncType = main_mod.build
-            ba: BuildArgs|None = build_fn(TMP_SRC_PATH, PKGS_PATH/p, dependencies[p])
-            if ba is None: raise Exception("BuildArgs is None")
-        except Exception as e:
-            logger.error(f"Ошибка сборки модуля {p} e: {e}")
-            return None
-
-        all_ba["link"] += ba["link"]
-        all_ba["source"] += ba["source"]
-        all_ba["objs"] += ba["objs"]
-
+        if not build_pkg(p, dependencies[p], all_ba): return None
     
     return all_ba
 
-def build_src(source_args: list[str]) -> list[str] | None:
+def build_src(source_args: list[str], objs_path: Path|None = None, unity: bool = False) -> list[str] | None:
     config: Config | None = load_config()
     if config is None:
         return None
+    if objs_path is None: objs_path = profile_path(OBJS_PATH)
     src_s = list(TMP_SRC_PATH.rglob("*.c"))
     dst_s: list[Path] = []
 
@@ -55,13 +101,41 @@ def build_src(source_args: list[str]) -> list[str] | None:
         else COMPILE_ARGS
     )
 
+    unity_conf: UnityConfig|None = unity_config(config, unity)
+    if unity_conf is not None:
+        return build_unity(src_s, unity_conf, config, compilation_args+source_args, objs_path)
+
     for src in src_s:
         rel_path: Path = src.relative_to(TMP_SRC_PATH)
-        obj_file: Path = OBJS_PATH / rel_path.with_suffix(".o")
+        obj_file: Path = objs_path / rel_path.with_suffix(".o")
         obj_file.parent.mkdir(parents=True, exist_ok=True)
         dst_s.append(obj_file)
 
-    return compile(src_s, dst_s, compilation_args+source_args)
+    args: list[str] = compilation_args+source_args
+    return compile(src_s, dst_s, args, prepare_pch(config, args, dst_s, objs_path))
+
+def build_unity(src_s: list[Path], unity_conf: UnityConfig, config: Config, args: list[str], objs_path: Path) -> list[str] | None:
+    """
+    unity-сборка: TU склеиваются в пачки build/unity/unity_<i>.c, сбалансированные по временам
+    из прошлых сборок; файлы из exclude компилируются как обычно
+    """
+    exclude: list[str] = unity_conf.get("exclude", [])
+    single: list[Path] = [src for src in src_s if is_excluded(src, exclude)]
+    merged: list[Path] = [src for src in src_s if not is_excluded(src, exclude)]
+
+    costs = estimate_costs(merged, BuildTimings(profile_path(TIMINGS_PATH)))
+    batches: list[Path] = write_batches(plan_batches(merged, costs, unity_conf.get("batches", get_workers(config)))) if merged else []
+    logger.info(f"unity: {len(merged)} файлов в {len(batches)} пачках, отдельно {len(single)}")
+
+    unity_objs: Path = UNITY_PATH/objs_path.relative_to(BUILD_PATH)
+    unity_objs.mkdir(parents=True, exist_ok=True)
+    dst_s: list[Path] = [unity_objs/b.with_suffix(".o").name for b in batches]
+    for src in single:
+        obj_file: Path = objs_path / src.relative_to(TMP_SRC_PATH).with_suffix(".o")
+        obj_file.parent.mkdir(parents=True, exist_ok=True)
+        dst_s.append(obj_file)
+
+    return compile(batches+single, dst_s, args, prepare_pch(config, args, dst_s, objs_path), map_diagnostics)
 
 def build_assets(assets: list[str]):
     for asset in assets:
@@ -70,7 +144,7 @@ def build_assets(assets: list[str]):
         if not src.exists():
             raise FileNotFoundError(f"Asset not found: {src}")
 
-        dst = BIN_PATH / src.name
+        dst = profile_path(BIN_PATH) / src.name
 
         if src.is_dir():
             if dst.exists():
@@ -83,45 +157,283 @@ def build_assets(assets: list[str]):
             dst.parent.mkdir(parents=True, exist_ok=True)
             shutil.copy2(src, dst)
 
-def build() -> bool:
-    make_build_folder()
+def link_inputs(cmd: list[str]) -> list[str]:
+    inputs: list[str] = []
+    for arg in cmd[1:]:
+        # пути внутри -Wl,...: -Wl,-force_load,<архив> на macOS, -Wl,--version-script,<файл>
+        for part in arg.split(",")[1:] if arg.startswith("-Wl,") else [arg]:
+            if os.path.isfile(part): inputs.append(part)
+    return inputs
 
-    config: Config|None = load_config()
-    if config is None: return False
-    
-    shutil.copytree(SRC_PATH, TMP_SRC_PATH, dirs_exist_ok=True)
+def link_cmd(config: Config, ln: str, target: Path, objs: list[str], build_args: BuildArgs) -> list[str]:
+    cmd: list[str] = [ln, "-o", str(target)]
+    cmd += objs
+    cmd += build_args["source"]
+    cmd += build_args["link"]
+    cmd += config["linking_args"] if "linking_args" in config else [] 
+    cmd += ["-Wl,-rpath,$ORIGIN/"+config["origin"]] if "origin" in config else []
+    return cmd
 
-    build_args: BuildArgs = {"link":[],"objs":[],"source":[]}
+def link_target(config: Config, ln: str, cmd: list[str], target: str) -> bool:
+    manifest: BuildManifest|None = BuildManifest(profile_path(MANIFEST_PATH)) if config.get("incremental", True) else None
+    ln_id: str = get_compiler_id(ln) if manifest is not None else ""
 
-    if not (config.get("dependencies") is None):
-        ba = build_pkgs(config)
-        if ba is None: return False
-        build_args["link"] += ba["link"]
-        build_args["source"] += ba["source"]
-        build_args["objs"] += ba["objs"]
+    if manifest is not None and manifest.is_fresh(target, cmd, ln_id):
+        logger.info(f"линковка {target} не нужна, входы не изменились")
+        return True
 
-    obj_files = build_src(build_args["source"])
-    if obj_files is None: return False
-    build_args["objs"] += obj_files
+    if run_measured(cmd) != 0:
+        logger.error(f"Ошибка линковки!")
+        logger.info(cmd)
+        if manifest is not None:
+            manifest.forget(target)
+            manifest.save()
+        return False
+    if manifest is not None:
+        manifest.record(target, cmd, ln_id, link_inputs(cmd))
+        manifest.save()
+    return True
 
+def link(config: Config, build_args: BuildArgs) -> bool:
     logger.info("ЛИНКУЕМ ВСЕ!!!")
     ln: str|None = get_linker()
     if ln is None: return False
 
-    cmd: list[str] = [ln, "-o", str(BIN_PATH/config['target_name'])]
-    cmd += build_args["objs"]
-    cmd += build_args["source"]
-    cmd += build_args["link"]
-    cmd += config["linking_args"] if "linking_args" in config else [] 
-    cmd += ["-Wl,-rpath,$ORIGIN/"+config["origin"]] if "origin" in config else []
+    target: Path = profile_path(BIN_PATH)/config['target_name']
+    return link_target(config, ln, link_cmd(config, ln, target, build_args["objs"], build_args), str(target))
 
-    result = subprocess.run(cmd, text=True)
-    if result.returncode != 0:
-        logger.error(f"Ошибка линковки!")
-        logger.info(cmd)
+def build_tests(config: Config, tests: list[Path], source_args: list[str]) -> bool:
+    """
+    TU тестов - с флагами проекта и пакетов; заголовки проекта ищутся в build/tmp_src
+    """
+    compilation_args: list[str] = config.get("compilation_args", COMPILE_ARGS)
+    dst_s: list[Path] = [test_obj(config, t) for t in tests]
+    for dst in dst_s: dst.parent.mkdir(parents=True, exist_ok=True)
+    return compile(tests, dst_s, compilation_args+source_args+["-I", str(TMP_SRC_PATH)]) is not None
+
+def link_test(config: Config, test: Path, app_objs: list[str], build_args: BuildArgs) -> bool:
+    """
+    тест = его объектник + объектники проекта без main + пакеты, все уже собранное переиспользуется
+    """
+    ln: str|None = get_linker()
+    if ln is None: return False
+
+    target: Path = test_bin(config, test)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    return link_target(config, ln, link_cmd(config, ln, target, [str(test_obj(config, test))]+app_objs, build_args), str(target))
+
+def link_hot_host(config: Config, host_obj: list[str], build_args: BuildArgs) -> bool:
+    """
+    хост hot-reload: сгенерированный main + код пакетов (их состояние переживает перезагрузки)
+    """
+    ln: str|None = get_linker()
+    if ln is None: return False
+
+    target: Path = profile_path(BIN_PATH)/config['target_name']
+    cmd: list[str] = link_cmd(config, ln, target, host_obj+build_args["objs"], build_args)+host_args()
+    return link_target(config, ln, cmd, str(target))
+
+def link_hot_lib(config: Config, objs: list[str], build_args: BuildArgs) -> bool:
+    """
+    пользовательский код - в библиотеку; новая версия публикуется, только если библиотека перелинковалась
+    """
+    ln: str|None = get_linker()
+    if ln is None: return False
+
+    lib: Path = profile_path(HOT_PATH)/f"lib{config['target_name']}{lib_suffix()}"
+    mtime: int|None = lib.stat().st_mtime_ns if lib.exists() else None
+    cmd: list[str] = link_cmd(config, ln, lib, objs, build_args)+shared_args()
+    if not link_target(config, ln, cmd, str(lib)): return False
+
+    if mtime is not None and lib.stat().st_mtime_ns == mtime and current_version() is not None:
+        return True
+    name: str|None = publish(lib, config['target_name'])
+    if name is None: return False
+    logger.info(f"hot-reload: опубликован {name}")
+    return True
+
+def build_record(sched: Scheduler, started: float, ok: bool, force: bool, cache: ObjectCache|None) -> BuildRecord:
+    tus: dict[str, float] = {}
+    hooks: dict[str, float] = {}
+    record: BuildRecord = {
+        "time": started,
+        "ok": ok,
+        "wall": round(time.time() - started, 3),
+        "jobs": sched.workers,
+        "force": force,
+        "compiled": 0,
+        "tus": tus,
+        "hooks": hooks,
+    }
+    for node in sched.nodes.values():
+        if node.duration is None: continue
+        if node.name.startswith("cc:"):
+            record["compiled"] += 1
+            tus[node.key] = round(node.duration, 3)
+        elif node.name.startswith("hook:"):
+            hooks[node.name[len("hook:"):]] = round(node.duration, 3)
+        elif node.name == "link":
+            record["link"] = round(node.duration, 3)
+    record["tus"] = dict(sorted(tus.items(), key=lambda kv: kv[1], reverse=True)[:HISTORY_TOP_TUS])
+    if get_profile() is not None:
+        record["profile"] = get_profile()
+    if cache is not None:
+        record["cache"] = {"hits": cache.hits, "secondary_hits": cache.secondary_hits, "misses": cache.misses}
+    return record
+
+def build(force: bool = False, jobs: int|None = None, trace: Path|None = None, hot: bool = False, unity: bool = False, profile: str|None = None, lto: bool = False, tests: list[Path]|None = None) -> bool:
+    """
+    trace   - куда записать таймлайн сборки (Chrome trace JSON)
+    hot     - хост + пользовательский код отдельной библиотекой для hot-reload (см. pcpm/hot.py)
+    unity   - unity-сборка, даже если она не включена в конфиге (см. pcpm/unity.py)
+    profile - профиль из "profiles": его флаги добавляются к общим, объектники, бинарники
+              и манифест - в build/<профиль>/, так что профили не пересобирают друг друга
+    lto     - LTO для компиляции и линковки, даже если "lto" не включен в конфиге (см. pcpm/optimize.py)
+    tests   - исходники тестов: каждый собирается в build/[<профиль>/]tests/bin/ (см. pcpm/testing.py)
+    """
+    if hot and not hot_supported():
+        logger.error("hot-reload требует dlopen (linux, macOS)")
         return False
+    prev_profile: str|None = get_profile()
+    if not set_profile(profile): return False
+    tracer: Tracer|None = Tracer() if trace is not None else None
+    set_tracer(tracer)
+    try:
+        with config_overlay(lto_overlay(lto, jobs)), config_overlay(link_overlay()):
+            return _build(force, jobs, hot, unity, tests)
+    finally:
+        set_tracer(None)
+        if tracer is not None and trace is not None: tracer.save(trace)
+        set_profile(prev_profile)
+
+def _build(force: bool, jobs: int|None, hot: bool = False, unity: bool = False, tests: list[Path]|None = None) -> bool:
+    """
+    сборка одним графом (см. Scheduler):
+        hook:<pkg> -> hook:<pkg> -> ... -> src (компиляция TU) -> link
+        assets - параллельно со всем остальным
+    хуки идут цепочкой в порядке dependencies, как и раньше: они пишут в общий tmp_src
+    и добавляют флаги для всех TU. компиляции из build_sf_libs внутри хуков и
+    пользовательские TU попадают в тот же граф и делят одни слоты воркеров,
+    готовые TU запускаются от самых долгих по прошлым сборкам (build/timings.json).
+    пиковый RSS каждого TU тоже пишется туда, и при memory_budget одновременно
+    запускается столько TU, сколько помещается в бюджет памяти.
+    pcpm выступает jobserver'ом GNU make: компиляции и make внутри хуков
+    берут токены из одного пула на `workers` (или `-j`) задач.
+    с "distributed" в конфиге у графа есть еще слоты удаленных воркеров (см. DistPool):
+    TU, которым не хватило локального слота, компилируются там.
+    hot: src -> link собирает build/hot/lib<target>.so из TU проекта (-fPIC, без main),
+    а host-cc -> host-link - хост с кодом пакетов, который подгружает новые версии библиотеки.
+    tests: hook:<pkg> -> tests-cc, src -> tests-objs (объектники проекта без main),
+    tests-cc + tests-objs -> test-link:<тест>
+    """
+    started: float = time.time()
+    with span("prepare", "prepare"):
+        make_build_folder()
+
+    with span("config", "config"):
+        config: Config|None = load_config()
+    if config is None: return False
+
+    manifest_path: Path = profile_path(MANIFEST_PATH)
+    if force:
+        if manifest_path.exists(): os.remove(manifest_path)
+        # иначе хуки пакетов взяли бы результат из кэша
+        if HOOKS_PATH.exists(): shutil.rmtree(HOOKS_PATH)
+
+    cache = get_object_cache(config)
+    if cache is not None: cache.reset_stats()
+    
+    with span("tmp_src", "prepare"):
+        copy_tree(SRC_PATH, TMP_SRC_PATH)
+
+    build_args: BuildArgs = {"link":[],"objs":[],"source":[]}
+
+    workers: int = jobs if jobs is not None and jobs > 0 else get_workers(config)
+    timings = BuildTimings(profile_path(TIMINGS_PATH))
+    js: JobServer|None = make_jobserver(workers, config.get("jobserver", "auto"))
+    cc: str|None = get_compiler()
+    pool: DistPool|None = connect_workers(config, cc, workers) if cc is not None else None
+    sched = Scheduler(workers, timings, js, get_memory_budget(config), pool.capacity if pool is not None else 0)
+
+    def build_assets_node() -> bool:
+        build_assets(config["assets"])
+        return True
+
+    hot_objs: list[str] = []
+    host_objs: list[str] = []
+    src_objs: list[str] = []
+    app_objs: list[str] = []
+
+    def build_src_node() -> bool:
+        if hot:
+            obj_files = build_src(build_args["source"]+HOT_ARGS, profile_path(HOT_OBJS_PATH), unity)
+            if obj_files is None: return False
+            hot_objs.extend(obj_files)
+            return True
+        obj_files = build_src(build_args["source"], unity=unity)
+        if obj_files is None: return False
+        src_objs.extend(obj_files)
+        build_args["objs"] += obj_files
+        return True
+
+    def tests_objs_node() -> bool:
+        ln: str|None = get_linker()
+        if ln is None: return False
+        pkg_objs: list[str] = [o for o in build_args["objs"] if o not in src_objs]
+        own: list[str] = without_main(src_objs, ln)
+        batched: list[str] = [o for o in src_objs if o not in own and UNITY_PATH in Path(o).parents]
+        if batched:
+            # вместе с main из теста выпал бы и остальной код пачки
+            logger.error(f"main собран в unity-пачке {batched[0]}: добавьте файл с main в unity.exclude")
+            return False
+        app_objs.extend(pkg_objs+own)
+        return True
+
+    def build_host_node() -> bool:
+        hot_path: Path = profile_path(HOT_PATH)
+        obj_files = compile([write_host(hot_path/"host.c")], [hot_path/"host.o"], [])
+        if obj_files is None: return False
+        host_objs.extend(obj_files)
+        return True
+
+    if "assets" in config:
+        sched.add(Node("assets", build_assets_node, cpu=False))
+
+    prev: list[str] = []
+    for p, conf in (config.get("dependencies") or {}).items():
+        sched.add(Node(f"hook:{p}", functools.partial(build_pkg, p, conf, build_args), prev, cpu=False, job=True))
+        prev = [f"hook:{p}"]
+
+    sched.add(Node("src", build_src_node, prev, cpu=False))
+    if hot:
+        sched.add(Node("host-cc", build_host_node, prev, cpu=False))
+        sched.add(Node("host-link", lambda: link_hot_host(config, host_objs, build_args), ["host-cc"]))
+        sched.add(Node("link", lambda: link_hot_lib(config, hot_objs, build_args), ["src"]))
+    else:
+        sched.add(Node("link", lambda: link(config, build_args), ["src"]))
+    if tests and not hot:
+        sched.add(Node("tests-cc", lambda: build_tests(config, tests, build_args["source"]), prev, cpu=False))
+        sched.add(Node("tests-objs", tests_objs_node, ["src"], cpu=False))
+        for t in tests:
+            sched.add(Node(f"test-link:{t}", functools.partial(link_test, config, t, app_objs, build_args), ["tests-cc", "tests-objs"]))
+
+    set_dist_pool(pool)
+    try:
+        with jobserver_env(js):
+            ok: bool = sched.run()
+    finally:
+        set_dist_pool(None)
+        if js is not None: js.close()
+    timings.save()
+    if pool is not None:
+        summary: str|None = pool.summary()
+        if summary is not None: logger.info(summary)
+    append_history(build_record(sched, started, ok, force, cache))
+    if not ok: return False
 
-    if "assets" in config: build_assets(config["assets"])
+    if cache is not None:
+        cache.cleanup()
+        logger.info(cache.summary())
 
     logger.info("Работа сделана!")
-    return True
\ No newline at end of file
+    return True
@@ -0,0 +1,32 @@
+import logging
+
+from ..daemon import BuildDaemon, request, start_daemon
+from ..utils import check_config
+
+logger = logging.getLogger(__name__)
+
+def daemon(action: str, polling: bool = False) -> bool:
+    if not check_config(): return False
+
+    if action == "start":
+        return start_daemon(polling)
+
+    if action == "serve":
+        return BuildDaemon(polling).serve()
+
+    if action == "stop":
+        if request({"cmd": "stop"}) is None:
+            logger.info("демон сборки не запущен")
+            return True
+        logger.info("демон сборки остановлен")
+        return True
+
+    status: dict|None = request({"cmd": "status"})
+    if status is None:
+        logger.info("демон сборки не запущен")
+        return True
+    logger.info(
+        f"демон сборки: pid {status['pid']}, работает {status['uptime']:.0f}с, сборок {status['builds']}, "
+        f"файлов в таблице {status['files']} ({status['watcher']}){', идет сборка' if status['busy'] else ''}"
+    )
+    return True
@@ -0,0 +1,22 @@
+import json
+import logging
+from pathlib import Path
+
+from ..mirror import INDEX_NAME, make_index
+
+logger = logging.getLogger(__name__)
+
+
+def index(mirror_dir: str) -> bool:
+    pth = Path(mirror_dir)
+    if not pth.is_dir():
+        logger.error(f"'{pth}' не директория!")
+        return False
+
+    data: dict = make_index(pth)
+    with open(pth/INDEX_NAME, "+w") as fd:
+        fd.write(json.dumps(data, indent=4))
+
+    prebuilt: int = sum(len(keys) for keys in data.get("prebuilt", {}).values())
+    logger.info(f"{pth/INDEX_NAME}: пакетов {len(data['packages'])}, готовых артефактов {prebuilt}")
+    return True
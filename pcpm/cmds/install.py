@@ -1,49 +1,190 @@
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
 import logging
 import os
+import time
 from pathlib import Path
 import shutil
+import tarfile
 from types import ModuleType
 
-from ..ds import Config, PKGS_MIRROR, PKGS_PATH, ROOT_PATH, InitFuncType, PackageConfig
-from ..utils import download, untar, get_module, load_config, write_config, load_pkg_config
+from ..ds import Config, PKGS_MIRROR, PKGS_PATH, ROOT_PATH, LOCK_PATH, InitFuncType, PackageConfig, LockEntry
+from ..utils import download, download_stream, untar, get_module, load_config, write_config, load_pkg_config, get_package_store, get_config_dir, load_lock, write_lock
+from ..store import PackageStore
+from ..mirror import MirrorIndexes, MirrorRanker, STATS_NAME
+from ..netpool import get_http_pool
+from ..manifest import hash_file
+from ..prebuilt import eligible, fetch_prebuilt, prebuilt_key
+from .build import get_hook_spec
 
 logger = logging.getLogger(__name__)
 
 
-def download_pkg(p: str, config: Config) -> bool:
-    flag: bool = False
-
+def fetch_tarball(p: str, config: Config, dest: Path) -> bool:
     mirrors: list[str] = config.get("mirrors", []) + [PKGS_MIRROR]
     for m in mirrors:
         if m.startswith(("http", "https")):
-            if download(f"{m}/{p}.tar.gz", f"{PKGS_PATH}/{p}.tar.gz"):
-                flag = True
-                break  
+            if download(f"{m}/{p}.tar.gz", dest):
+                return True
         else:
             try:
-                shutil.copyfile(Path(m)/f"{p}.tar.gz", f"{PKGS_PATH}/{p}.tar.gz")
-                flag = True
-                break
+                shutil.copyfile(Path(m)/f"{p}.tar.gz", dest)
+                return True
             except:
                 pass
 
-    if not flag: 
+    logger.error(f"ошибка при скачивание пакета: {p}")
+    return False
+
+def order_mirrors(
+    p: str,
+    mirrors: list[str],
+    expected: str|None,
+    indexes: MirrorIndexes|None,
+    ranker: MirrorRanker|None = None
+) -> list[str]:
+    """
+    сначала зеркала, в индексе которых есть нужный архив, затем зеркала без индекса;
+    зеркала, чей индекс обещает другой архив, пропускаем.
+    внутри каждой группы - по ожидаемому времени скачивания
+    """
+    known: list[str] = mirrors
+    unknown: list[str] = []
+    if expected is not None and indexes is not None:
+        known = [m for m in mirrors if indexes.has(m, p, expected) is True]
+        unknown = [m for m in mirrors if indexes.has(m, p, expected) is None]
+
+    if ranker is None: return known + unknown
+    found = indexes.lookup(p) if indexes is not None else None
+    size: int = found[1].get("size", 0) if found is not None else 0
+    return ranker.order(known, size) + ranker.order(unknown, size)
+
+def fetch_to_store(
+    p: str,
+    config: Config,
+    store: PackageStore,
+    timings: dict[str, float],
+    expected: str|None = None,
+    indexes: MirrorIndexes|None = None,
+    ranker: MirrorRanker|None = None
+) -> str|None:
+    t = time.perf_counter()
+    digest: str|None = None
+    extracted: Path = store.tmp_path()
+
+    mirrors: list[str] = order_mirrors(p, config.get("mirrors", []) + [PKGS_MIRROR], expected, indexes, ranker)
+    for m in mirrors:
+        if m.startswith(("http", "https")):
+            url: str = f"{m}/{p}.tar.gz"
+            part: Path = store.part_path(url)
+            t_mirror = time.perf_counter()
+            res = download_stream(url, part, extracted, config.get("download_retries", 3), config.get("mirror_timeout", 5))
+            if res is None:
+                if ranker is not None: ranker.record_failure(m)
+                continue
+            if ranker is not None: ranker.record_transfer(m, part.stat().st_size, time.perf_counter() - t_mirror)
+            digest = store.add_tarball(part, res[0])
+            # распакованное на лету попадает в хранилище только после сверки хэша
+            if res[1] and digest is not None and (expected is None or digest == expected):
+                store.add_tree(digest, extracted)
+            break
+        else:
+            tmp: Path = store.tmp_path(".tar.gz")
+            try:
+                shutil.copyfile(Path(m)/f"{p}.tar.gz", tmp)
+            except:
+                if tmp.exists(): os.remove(tmp)
+                continue
+            digest = store.add_tarball(tmp)
+            break
+
+    if digest is None:
         logger.error(f"ошибка при скачивание пакета: {p}")
-        return False
-    
-    untar(f"{PKGS_PATH}/{p}.tar.gz", PKGS_PATH)
-    os.remove(f"{PKGS_PATH}/{p}.tar.gz")
+        return None
+    timings["download"] = time.perf_counter() - t
 
-    return True
+    if expected is not None and digest != expected:
+        logger.error(f"хэш архива {p} не совпадает: ожидался {expected[:12]}, скачан {digest[:12]}")
+        shutil.rmtree(extracted, ignore_errors=True)
+        return None
 
-def init_pkg(p: str, config: Config) -> bool:
+    if not store.has_tree(digest, p):
+        t = time.perf_counter()
+        extracted = store.tmp_path()
+        try:
+            untar(store.tarball_path(digest), extracted)
+            store.add_tree(digest, extracted)
+        except (OSError, EOFError, tarfile.TarError) as e:
+            logger.error(f"ошибка при распаковке пакета {p}: {e}")
+            shutil.rmtree(extracted, ignore_errors=True)
+            return None
+        timings["extract"] = time.perf_counter() - t
+
+    store.set_ref(p, digest)
+    return digest
+
+def download_pkg(
+    p: str,
+    config: Config,
+    forse: bool = True,
+    timings: dict[str, float]|None = None,
+    expected: str|None = None,
+    indexes: MirrorIndexes|None = None,
+    ranker: MirrorRanker|None = None
+) -> str|None:
+    """
+    expected - sha256 архива из pcpm.lock или индекса зеркала:
+    если он уже есть в хранилище, сеть не нужна; скачанный архив с ним сверяется
+
+    return sha256 установленного архива
+    """
+    if timings is None: timings = {}
+    store: PackageStore|None = get_package_store()
+    if store is None:
+        t = time.perf_counter()
+        if not fetch_tarball(p, config, PKGS_PATH/f"{p}.tar.gz"): return None
+        timings["download"] = time.perf_counter() - t
+        digest = hash_file(PKGS_PATH/f"{p}.tar.gz")
+        if digest is None or (expected is not None and digest != expected):
+            logger.error(f"хэш архива {p} не совпадает с ожидаемым")
+            os.remove(f"{PKGS_PATH}/{p}.tar.gz")
+            return None
+        t = time.perf_counter()
+        try:
+            untar(f"{PKGS_PATH}/{p}.tar.gz", PKGS_PATH)
+        except (OSError, EOFError, tarfile.TarError) as e:
+            logger.error(f"ошибка при распаковке пакета {p}: {e}")
+            shutil.rmtree(PKGS_PATH/p, ignore_errors=True)
+            return None
+        finally:
+            os.remove(f"{PKGS_PATH}/{p}.tar.gz")
+        timings["extract"] = time.perf_counter() - t
+        return digest
+
+    digest: str|None = expected if expected is not None else (None if forse else store.get_ref(p))
+    if digest is not None and store.has_tree(digest, p):
+        logger.info(f"{p} взят из хранилища ({digest[:12]})")
+    else:
+        digest = fetch_to_store(p, config, store, timings, expected, indexes, ranker)
+        if digest is None: return None
+
+    t = time.perf_counter()
+    ok: bool = store.materialize(digest, p, PKGS_PATH/p, config.get("store_link", "auto"))
+    timings["link"] = time.perf_counter() - t
+    return digest if ok else None
+
+def resolve_digest(p: str, lock: dict[str, LockEntry], indexes: MirrorIndexes|None, update: bool) -> str|None:
+    if not update and p in lock:
+        return lock[p]["sha256"]
+    if indexes is None: return None
+    found = indexes.lookup(p)
+    return found[1].get("sha256") if found is not None else None
+
+def get_pkg_dependencies(p: str) -> list[str]:
     pkg_config: PackageConfig|None = load_pkg_config(p)
-    if not pkg_config is None:
-        pkg_dependencies: dict|None = pkg_config["dependencies"] if "dependencies" in pkg_config else None
-        if not pkg_dependencies is None:
-            if not install_pkgs(pkg_dependencies.keys(), config, False):
-                return False
+    if pkg_config is None: return []
+    return list(pkg_config.get("dependencies", {}).keys())
 
+def init_pkg(p: str, config: Config) -> bool:
     try:
         main_mod: ModuleType|None = get_module(p)
         if main_mod is None: raise Exception("main_mod is None")
@@ -64,29 +205,195 @@ def init_pkg(p: str, config: Config) -> bool:
     
     return True
 
-def install_pkgs(pkgs: list[str], config: Config, forse: bool) -> bool:
+def _fetch_pkg(
+    p: str,
+    config: Config,
+    forse: bool,
+    lock: dict[str, LockEntry],
+    indexes: MirrorIndexes|None,
+    ranker: MirrorRanker|None
+) -> tuple[str|None, dict[str, float], list[str]]:
+    timings: dict[str, float] = {}
+    expected: str|None = resolve_digest(p, lock, indexes, forse)
+    digest: str|None = download_pkg(p, config, forse, timings, expected, indexes, ranker)
+    return digest, timings, get_pkg_dependencies(p) if digest is not None else []
+
+def install_pkgs(
+    pkgs: list[str],
+    config: Config,
+    forse: bool,
+    jobs: int|None = None,
+    lock: dict[str, LockEntry]|None = None,
+    indexes: MirrorIndexes|None = None,
+    ranker: MirrorRanker|None = None,
+    installed: list[str]|None = None
+) -> bool:
+    """
+    конвейер установки: замыкание зависимостей скачивается и распаковывается
+    параллельно (не больше `jobs` одновременно), а init каждого пакета
+    вызывается в основном потоке, как только готовы init его зависимостей.
+    installed - сюда добавляются действительно (пере)установленные пакеты
+    """
     if len(pkgs) == 0: 
         pkgs += config["dependencies"].keys() if "dependencies" in config else []
-    for p in pkgs:
-        if not forse and p in config["dependencies"] and os.path.exists(PKGS_PATH/p):
-            logger.info(f"{p} уже установлен")
-            continue
-        if not download_pkg(p, config) or not init_pkg(p, config):
+
+    if jobs is None: jobs = config.get("install_workers", 4)
+    jobs = max(1, jobs)
+
+    if lock is None: lock = {}
+
+    deps_of: dict[str, list[str]] = {}
+    ready: set[str] = set()
+    fetched: list[str] = []
+    timings: dict[str, dict[str, float]] = {}
+    seen: set[str] = set()
+    ok: bool = True
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures: dict[Future, str] = {}
+
+        def schedule(p: str, force_p: bool):
+            if p in seen: return
+            seen.add(p)
+            if not force_p and p in config["dependencies"] and os.path.exists(PKGS_PATH/p):
+                logger.info(f"{p} уже установлен")
+                ready.add(p)
+                store: PackageStore|None = get_package_store()
+                ref: str|None = store.get_ref(p) if store is not None else None
+                if p not in lock and ref is not None and store is not None and store.tarball_path(ref).exists():
+                    lock[p] = {"sha256": ref, "size": store.tarball_path(ref).stat().st_size}
+                return
+            futures[executor.submit(_fetch_pkg, p, config, force_p, lock, indexes, ranker)] = p
+
+        for p in pkgs: schedule(p, forse)
+
+        while futures and ok:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                p = futures.pop(future)
+                try:
+                    digest, timings[p], deps_of[p] = future.result()
+                except Exception as e:
+                    logger.error(f"ошибка при установке пакета {p}: {e}")
+                    ok = False
+                    break
+                if digest is None:
+                    ok = False
+                    break
+                fetched.append(p)
+                store: PackageStore|None = get_package_store()
+                tarball: Path|None = store.tarball_path(digest) if store is not None else None
+                lock[p] = {"sha256": digest, "size": tarball.stat().st_size if tarball is not None and tarball.exists() else 0}
+                for dep in deps_of[p]: schedule(dep, False)
+
+            # init всех пакетов, у которых готовы зависимости
+            progress: bool = True
+            while ok and progress:
+                progress = False
+                for p in fetched:
+                    if p in ready or not all(d in ready for d in deps_of[p]): continue
+                    t = time.perf_counter()
+                    if not init_pkg(p, config):
+                        ok = False
+                        break
+                    timings[p]["init"] = time.perf_counter() - t
+                    ready.add(p)
+                    progress = True
+
+        if not ok:
+            for f in futures: f.cancel()
             return False
 
+    pending: list[str] = [p for p in fetched if p not in ready]
+    if pending:
+        logger.error(f"циклические зависимости пакетов: {pending}")
+        return False
+
+    if installed is not None: installed.extend(fetched)
+
+    stage_names: dict[str, str] = {"download": "скачивание", "extract": "распаковка", "link": "ссылки", "init": "init"}
+    for p in fetched:
+        logger.info(f"{p}: " + ", ".join(f"{stage_names.get(stage, stage)} {t:.2f}s" for stage, t in timings[p].items()))
+
     return True
 
 
-def install(pkg_names: list[str], forse: bool):
+def verify_pkgs(config: Config, lock: dict[str, LockEntry]) -> bool:
+    """
+    проверка без сети: каждый пакет закреплен в pcpm.lock,
+    архив с этим хэшем и его дерево есть в хранилище, пакет материализован в ./pkgs
+    """
+    store: PackageStore|None = get_package_store()
+    ok: bool = True
+    for p in config.get("dependencies", {}).keys():
+        entry: LockEntry|None = lock.get(p)
+        if entry is None:
+            logger.error(f"{p} не закреплен в {LOCK_PATH}")
+            ok = False
+            continue
+        tarball: Path|None = store.tarball_path(entry["sha256"]) if store is not None else None
+        if tarball is None or not tarball.exists() or tarball.stat().st_size != entry["size"]:
+            logger.error(f"{p}: архива {entry['sha256'][:12]} нет в хранилище")
+            ok = False
+        elif store is not None and not store.has_tree(entry["sha256"], p):
+            logger.error(f"{p}: дерева {entry['sha256'][:12]} нет в хранилище")
+            ok = False
+        if not os.path.exists(PKGS_PATH/p):
+            logger.error(f"{p} не установлен в {PKGS_PATH}")
+            ok = False
+
+    if ok: logger.info("все пакеты совпадают с pcpm.lock")
+    return ok
+
+def prefetch_prebuilt(config: Config, lock: dict[str, LockEntry], indexes: MirrorIndexes, pkgs: list[str]):
+    """
+    готовые артефакты для только что установленных пакетов, чтобы pcpm build их не собирал.
+    не нашлись - не ошибка, пакет соберется из исходников.
+    неизмененные пакеты не трогаем: install без изменений обходится без сети
+    """
+    if not config.get("prebuilt", True): return
+    dependencies: dict = config.get("dependencies") or {}
+    for p in pkgs:
+        if p not in dependencies: continue
+        conf: dict = dependencies[p]
+        main_mod: ModuleType|None = get_module(p)
+        if main_mod is None: continue
+        try:
+            spec = get_hook_spec(p, main_mod, conf)
+        except Exception:
+            continue
+        if not eligible(spec): continue
+        found = prebuilt_key(p, conf, config, lock)
+        if found is None: continue
+        if fetch_prebuilt(p, found[0], config, indexes) is not None:
+            logger.info(f"{p}: готовый артефакт {found[0][:12]}")
+
+def install(pkg_names: list[str], forse: bool, jobs: int|None = None, verify: bool = False) -> bool:
     config: Config|None = load_config()
-    if config is None: return
+    if config is None: return False
 
     os.makedirs(PKGS_PATH, exist_ok=True)
 
     if config.get("dependencies") is None: config['dependencies'] = {}
 
-    if not install_pkgs(pkg_names, config, forse):
-        return
+    lock: dict[str, LockEntry] = load_lock()
+    if verify: return verify_pkgs(config, lock)
+
+    config_dir: Path|None = get_config_dir()
+    mirrors: list[str] = config.get("mirrors", []) + [PKGS_MIRROR]
+    timeout: float = config.get("mirror_timeout", 5)
+    ranker = MirrorRanker(mirrors, config_dir/"mirrors"/STATS_NAME if config_dir is not None else None, timeout)
+    indexes = MirrorIndexes(mirrors, config_dir/"mirrors" if config_dir is not None else None, timeout, ranker=ranker)
 
+    try:
+        installed: list[str] = []
+        if not install_pkgs(pkg_names, config, forse, jobs, lock, indexes, ranker, installed):
+            return False
+        prefetch_prebuilt(config, lock, indexes, installed)
+    finally:
+        if ranker.probed: ranker.save()
+        get_http_pool().close()
 
-    write_config(config)
\ No newline at end of file
+    write_config(config)
+    write_lock(lock)
+    return True
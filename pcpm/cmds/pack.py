@@ -0,0 +1,57 @@
+import logging
+from pathlib import Path
+
+from ..ds import HOOKS_PATH, PKGS_PATH, Config, HookSpec, LockEntry
+from ..hookcache import HookCache, toolchain_id
+from ..prebuilt import eligible, pack_prebuilt, prebuilt_key
+from ..utils import get_module, load_config, load_lock
+from .build import get_hook_spec
+
+logger = logging.getLogger(__name__)
+
+def pack(out_dir: str, pkg_names: list[str]) -> bool:
+    """
+    готовые артефакты пакетов из последней сборки для зеркала: <out_dir>/prebuilt/<пакет>/<ключ>.tar.gz
+    (после - pcpm index <out_dir>). годятся пакеты с объявленным хуком без inputs (см. HookCache)
+    """
+    config: Config|None = load_config()
+    if config is None: return False
+    lock: dict[str, LockEntry] = load_lock()
+    dependencies: dict = config.get("dependencies") or {}
+    names: list[str] = pkg_names if pkg_names else list(dependencies)
+
+    packed: int = 0
+    ok: bool = True
+    for p in names:
+        if p not in dependencies:
+            logger.error(f"{p} нет в dependencies")
+            ok = False
+            continue
+        main_mod = get_module(p)
+        if main_mod is None:
+            ok = False
+            continue
+        conf: dict = dependencies[p]
+        spec: HookSpec|None = get_hook_spec(p, main_mod, conf)
+        if not eligible(spec) or spec is None:
+            logger.info(f"{p}: хук не объявлен или читает файлы проекта (inputs), пропущен")
+            continue
+        found = prebuilt_key(p, conf, config, lock)
+        if found is None:
+            logger.info(f"{p}: архива нет в pcpm.lock, пропущен")
+            continue
+
+        hook_cache = HookCache(HOOKS_PATH/p)
+        if hook_cache.stored_fingerprint() != hook_cache.fingerprint(p, PKGS_PATH/p, conf, spec, toolchain_id(config)):
+            logger.error(f"{p}: результат хука устарел, сначала pcpm build")
+            ok = False
+            continue
+        dst: Path|None = pack_prebuilt(p, found[0], found[1], hook_cache, Path(out_dir))
+        if dst is None:
+            ok = False
+            continue
+        logger.info(f"{p}: {dst}")
+        packed += 1
+
+    logger.info(f"упаковано артефактов: {packed}")
+    return ok
@@ -0,0 +1,74 @@
+import logging
+import subprocess
+
+from ..ds import Config, PgoConfig
+from ..optimize import merge_profiles, pgo_dir, pgo_gen_overlay, pgo_use_overlay, profile_digest, reset_profiles, train_runs
+from ..utils import config_overlay, get_compiler, get_compiler_kind, get_profile, load_config, set_profile
+from .build import build
+from .run import start_target, stop_target
+
+logger = logging.getLogger(__name__)
+
+def train(config: Config, conf: PgoConfig) -> bool:
+    """
+    стадия 2: обучающие запуски инструментированной цели (как pcpm run, из build/bin)
+    """
+    timeout: float|None = conf.get("timeout")
+    for args in train_runs(conf):
+        logger.info(f"PGO: обучающий запуск {' '.join(args) or '(без аргументов)'}")
+        proc: subprocess.Popen|None = start_target(config, args)
+        if proc is None: return False
+        try:
+            code: int = proc.wait(timeout)
+        except subprocess.TimeoutExpired:
+            logger.error(f"PGO: обучающий запуск не завершился за {timeout:.0f}с")
+            stop_target(proc)
+            return False
+        except KeyboardInterrupt:
+            stop_target(proc)
+            raise
+        if code != 0:
+            logger.error(f"PGO: обучающий запуск завершился с кодом {code}")
+            return False
+    return True
+
+def pgo(force: bool = False, jobs: int|None = None, profile: str|None = None, lto: bool = False) -> bool:
+    """
+    сборка с PGO в три стадии (gcc, clang):
+        1. инструментированная сборка (-fprofile-generate)
+        2. обучающие запуски цели с аргументами из "pgo": {"train": [...]}
+        3. пересборка с -fprofile-use (clang - после llvm-profdata merge)
+    обе сборки идут в одно дерево объектников профиля: gcc ищет .gcda по пути объектника
+    """
+    prev_profile: str|None = get_profile()
+    if not set_profile(profile): return False
+    try:
+        config: Config|None = load_config()
+        if config is None: return False
+        conf: PgoConfig|None = config.get("pgo")
+        if conf is None or "train" not in conf:
+            logger.error('для PGO нужен "pgo": {"train": [<аргументы цели>]} в конфиге')
+            return False
+        cc: str|None = get_compiler()
+        if cc is None: return False
+        kind: str|None = get_compiler_kind(cc)
+        if kind is None:
+            logger.error(f"{cc}: PGO поддерживается только для gcc и clang")
+            return False
+
+        logger.info("PGO 1/3: инструментированная сборка")
+        with config_overlay(pgo_gen_overlay(kind)):
+            if not build(force, jobs, profile=profile, lto=lto): return False
+
+        logger.info(f"PGO 2/3: обучение, профили в {pgo_dir()}")
+        reset_profiles()
+        if not train(config, conf): return False
+        if kind == "clang" and not merge_profiles(cc): return False
+        digest: str|None = profile_digest(kind)
+        if digest is None: return False
+
+        logger.info("PGO 3/3: сборка по профилю")
+        with config_overlay(pgo_use_overlay(kind, digest)):
+            return build(False, jobs, profile=profile, lto=lto)
+    finally:
+        set_profile(prev_profile)
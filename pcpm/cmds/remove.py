@@ -3,8 +3,8 @@ import shutil
 import logging
 from types import ModuleType
 
-from ..utils import load_config, write_config, get_module
-from ..ds import Config, PKGS_PATH, RemoveFuncType, ROOT_PATH
+from ..utils import load_config, write_config, get_module, load_lock, write_lock
+from ..ds import Config, PKGS_PATH, RemoveFuncType, ROOT_PATH, LOCK_PATH
 
 logger = logging.getLogger(__name__)
 
@@ -12,8 +12,10 @@ logger = logging.getLogger(__name__)
 def remove(pkgs: list[str]):
     config: Config|None = load_config()
     if config is None: return None
+    lock = load_lock()
     
     for p in pkgs:
+        lock.pop(p, None)
         if os.path.exists(PKGS_PATH/p): 
             
             try:
@@ -33,4 +35,5 @@ def remove(pkgs: list[str]):
         if "dependencies" in config and p in config["dependencies"]:
             del config["dependencies"][p]
 
-    write_config(config)
\ No newline at end of file
+    write_config(config)
+    if LOCK_PATH.exists(): write_lock(lock)
\ No newline at end of file
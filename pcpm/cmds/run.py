@@ -5,31 +5,51 @@ import subprocess
 import signal
 
 from ..ds import BIN_PATH, Config
-from ..utils import get_platform, load_config, get_bin_suffix
+from ..utils import get_platform, load_config, get_bin_suffix, profile_path
 
 logger = logging.getLogger(__name__)
 
+STOP_TIMEOUT = 5.0
+
+def target_path(config: Config) -> Path:
+    return Path("./")/profile_path(BIN_PATH)/(config['target_name']+get_bin_suffix())
+
+def start_target(config: Config, args: list[str]) -> subprocess.Popen|None:
+    bin_path: Path = profile_path(BIN_PATH)
+    if not os.path.exists(target_path(config)):
+        logger.error(f"'{bin_path/config['target_name']}' не найден!")
+        return None
+    try:
+        if get_platform().startswith("windows"):
+            return subprocess.Popen([str(bin_path/(config['target_name']+get_bin_suffix()))] + args, cwd=bin_path)
+        return subprocess.Popen(["./"+config['target_name']+get_bin_suffix()] + args, cwd=bin_path)
+    except Exception as e:
+        logger.error(f"Ошибка при запуске!\n{e}")
+        return None
+
+def stop_target(proc: subprocess.Popen|None, timeout: float = STOP_TIMEOUT):
+    """
+    чистое завершение через SIGINT, если не помогло за timeout - kill
+    """
+    if proc is None or proc.poll() is not None: return
+    proc.send_signal(signal.SIGINT)
+    try:
+        proc.wait(timeout)
+    except subprocess.TimeoutExpired:
+        logger.warning(f"'{proc.args[0]}' не завершился по SIGINT за {timeout:.0f}с, kill")
+        proc.kill()
+        proc.wait()
+
 def run(args: list[str]):
     config: Config|None = load_config()
     if config is None: return
-        
 
-    if not os.path.exists(Path("./")/BIN_PATH/(config['target_name']+get_bin_suffix())):
-        logger.error(f"'{BIN_PATH/config['target_name']}' не найден!")
-        return
-    
-    proc = None
+    proc = start_target(config, args)
+    if proc is None: return
     try:
-        proc = None
-        if get_platform().startswith("windows"):
-            proc = subprocess.Popen([str(BIN_PATH/(config['target_name']+get_bin_suffix()))] + args, cwd=BIN_PATH)
-        else:
-            proc = subprocess.Popen(["./"+config['target_name']+get_bin_suffix()] + args, cwd=BIN_PATH)
         proc.wait()
     except KeyboardInterrupt:
         if proc and proc.poll() is None: 
             proc.send_signal(signal.SIGINT)
             proc.wait()  
-    except Exception as e:
-        logger.error(f"Ошибка при запуске!\n{e}")
-    logger.info("завершение")
\ No newline at end of file
+    logger.info("завершение")
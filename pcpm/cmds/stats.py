@@ -0,0 +1,83 @@
+import logging
+import statistics
+import time
+
+from ..ds import BuildRecord, HISTORY_PATH
+from ..history import load_history
+
+logger = logging.getLogger(__name__)
+
+TOP = 10
+
+def _average(records: list[BuildRecord], field: str) -> list[tuple[str, float, int]]:
+    """
+    return [(имя, среднее время, в скольких сборках встречалось)] по убыванию среднего
+    """
+    samples: dict[str, list[float]] = {}
+    for r in records:
+        for name, seconds in r.get(field, {}).items():
+            samples.setdefault(name, []).append(seconds)
+    rows = [(name, statistics.fmean(v), len(v)) for name, v in samples.items()]
+    return sorted(rows, key=lambda row: row[1], reverse=True)[:TOP]
+
+def _hit_rate(cache: dict[str, int]) -> float|None:
+    total: int = sum(cache.values())
+    if total == 0: return None
+    return (cache.get("hits", 0) + cache.get("secondary_hits", 0)) / total * 100
+
+def _trend(values: list[float], unit: str = "с") -> str:
+    if len(values) < 4: return "мало данных"
+    half: int = len(values) // 2
+    old, new = statistics.median(values[:half]), statistics.median(values[half:])
+    if old == 0: return "мало данных"
+    change: float = (new - old) / old * 100
+    return f"{change:+.0f}% (медиана {old:.2f}{unit} -> {new:.2f}{unit})"
+
+def stats(n: int = 20) -> bool:
+    records: list[BuildRecord] = load_history(n)
+    if not records:
+        logger.error(f"история сборок пуста ({HISTORY_PATH}), сначала выполните pcpm build")
+        return False
+
+    ok_builds = [r for r in records if r.get("ok")]
+    walls: list[float] = [r["wall"] for r in ok_builds]
+    logger.info(
+        f"сборок: {len(records)} (успешных {len(ok_builds)}), "
+        f"с {time.strftime('%Y-%m-%d %H:%M', time.localtime(records[0]['time']))}"
+    )
+    if walls:
+        logger.info(f"время сборки: медиана {statistics.median(walls):.2f}с, мин {min(walls):.2f}с, макс {max(walls):.2f}с")
+        logger.info(f"тренд времени сборки: {_trend(walls)}")
+        full = [r["wall"] for r in ok_builds if r.get("force")]
+        if full: logger.info(f"полная пересборка (--force): медиана {statistics.median(full):.2f}с")
+        logger.info(f"компилируется TU за сборку: медиана {statistics.median(r['compiled'] for r in ok_builds):.0f}")
+
+    links: list[float] = [r["link"] for r in ok_builds if "link" in r]
+    if links: logger.info(f"линковка: медиана {statistics.median(links):.2f}с, тренд {_trend(links)}")
+
+    tus = _average(records, "tus")
+    if tus:
+        logger.info("самые долгие TU (среднее время, сборок):")
+        for name, avg, count in tus:
+            logger.info(f"    {avg:8.3f}с  {count:3}  {name}")
+
+    hooks = _average(records, "hooks")
+    if hooks:
+        logger.info("самые долгие пакеты (хук build):")
+        for name, avg, count in hooks:
+            logger.info(f"    {avg:8.3f}с  {count:3}  {name}")
+
+    rates: list[float] = [
+        rate for r in records if "cache" in r
+        for rate in [_hit_rate(r["cache"])] if rate is not None
+    ]
+    if rates:
+        total: dict[str, int] = {}
+        for r in records:
+            for k, v in r.get("cache", {}).items(): total[k] = total.get(k, 0) + v
+        overall: float|None = _hit_rate(total)
+        logger.info(
+            f"кэш объектов: попаданий {overall or 0:.0f}% за {len(rates)} сборок, "
+            f"в последней {rates[-1]:.0f}%, тренд {_trend(rates, '%')}"
+        )
+    return True
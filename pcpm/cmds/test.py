@@ -0,0 +1,101 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from fnmatch import fnmatch
+from pathlib import Path
+import logging
+import sys
+
+from ..ds import BIN_PATH, TESTS_BUILD_PATH, Config, TestResult
+from ..scheduler import BuildTimings
+from ..testing import DEFAULT_TIMEOUT, describe, discover_tests, order_by_history, parse_shard, pick_shard, run_test, test_bin, test_name, tests_config, tests_dir, write_junit
+from ..utils import get_profile, get_workers, load_config, profile_path, set_profile
+from .build import build
+
+logger = logging.getLogger(__name__)
+
+def select_tests(config: Config, patterns: list[str], shard: tuple[int, int]|None) -> dict[str, Path]:
+    tests: dict[str, Path] = {test_name(config, t): t for t in discover_tests(config)}
+    if patterns:
+        tests = {n: t for n, t in tests.items() if any(fnmatch(n, p) for p in patterns)}
+    if shard is not None:
+        keep: set[str] = set(pick_shard(list(tests), *shard))
+        tests = {n: t for n, t in tests.items() if n in keep}
+    return tests
+
+def test(
+    patterns: list[str],
+    force: bool = False,
+    jobs: int|None = None,
+    shard: str|None = None,
+    junit: Path|None = None,
+    timeout: float|None = None,
+    profile: str|None = None,
+) -> bool:
+    """
+    собирает каждый tests/**/*.c в отдельный бинарник (вместе с объектниками проекта без main
+    и пакетами, в одном графе со сборкой проекта) и запускает их параллельно, от самых долгих
+    по прошлым запускам. код 0 - успех, 77 - пропущен, иначе или по таймауту - провал.
+    результат - JUnit XML в build/[<профиль>/]tests/junit.xml (или junit)
+    """
+    prev_profile: str|None = get_profile()
+    if not set_profile(profile): return False
+    try:
+        config: Config|None = load_config()
+        if config is None: return False
+
+        parsed: tuple[int, int]|None = None
+        if shard is not None:
+            parsed = parse_shard(shard)
+            if parsed is None:
+                logger.error(f"--shard {shard}: нужно i/n, 1 <= i <= n")
+                return False
+
+        tests: dict[str, Path] = select_tests(config, patterns, parsed)
+        if not tests:
+            logger.info(f"тестов нет ({tests_dir(config)}/*.c){', шард ' + shard if shard else ''}")
+            return True
+
+        if not build(force, jobs, profile=profile, tests=list(tests.values())): return False
+
+        timings = BuildTimings(profile_path(TESTS_BUILD_PATH)/"timings.json")
+        order: list[str] = order_by_history(list(tests), timings)
+        limit: float = timeout if timeout is not None else tests_config(config).get("timeout", DEFAULT_TIMEOUT)
+        workers: int = jobs if jobs is not None and jobs > 0 else get_workers(config)
+        logger.info(f"тестов {len(order)}{', шард ' + shard if shard else ''}, параллельно {workers}")
+
+        results: list[TestResult] = []
+        with ThreadPoolExecutor(max_workers=workers) as ex:
+            futures = [
+                ex.submit(run_test, name, test_bin(config, tests[name]), profile_path(BIN_PATH), limit)
+                for name in order
+            ]
+            for fut in as_completed(futures):
+                r: TestResult = fut.result()
+                results.append(r)
+                report(r, limit)
+                timings.record(r["name"], r["time"])
+        timings.save()
+
+        out: Path = junit if junit is not None else profile_path(TESTS_BUILD_PATH)/"junit.xml"
+        write_junit(results, config["name"], out, limit)
+
+        failed: list[str] = [r["name"] for r in results if r["status"] in ("failed", "timeout")]
+        skipped: int = sum(r["status"] == "skipped" for r in results)
+        summary: str = f"пройдено {len(results) - len(failed) - skipped}, провалено {len(failed)}, пропущено {skipped}; {out}"
+        if failed:
+            logger.error(f"{summary}. провалены: {', '.join(sorted(failed))}")
+            return False
+        logger.info(summary)
+        return True
+    finally:
+        set_profile(prev_profile)
+
+def report(r: TestResult, timeout: float):
+    if r["status"] == "passed":
+        logger.info(f"OK   {r['name']} ({r['time']:.2f}с)")
+    elif r["status"] == "skipped":
+        logger.info(f"SKIP {r['name']}")
+    else:
+        logger.error(f"FAIL {r['name']} ({r['time']:.2f}с): {describe(r, timeout)}")
+        # вывод провалившегося теста - сразу, не дожидаясь JUnit
+        sys.stderr.write(r["stdout"]+r["stderr"])
+        sys.stderr.flush()
@@ -0,0 +1,127 @@
+import logging
+import os
+import signal
+import subprocess
+import sys
+import time
+
+from ..ds import Config, ROOT_PATH
+from ..daemon import watch_roots
+from ..fswatch import Watcher, make_watcher
+from ..utils import load_config
+from .run import start_target, stop_target, target_path
+
+logger = logging.getLogger(__name__)
+
+DEBOUNCE = 0.2          # тишина после последнего изменения перед сборкой
+POLL = 0.1              # как часто проверять изменения во время сборки
+CANCEL_TIMEOUT = 5.0
+
+def _collect(watcher: Watcher, changed: set[str]) -> set[str]:
+    """
+    дожидается паузы в потоке изменений (редактор сохраняет несколько файлов подряд)
+    """
+    while True:
+        more: set[str]|None = watcher.wait(DEBOUNCE)
+        if more is None:
+            changed.add(str(ROOT_PATH))
+            continue
+        if not more: return changed
+        changed |= more
+
+def _mtime(pth) -> int|None:
+    try:
+        return os.stat(pth).st_mtime_ns
+    except OSError:
+        return None
+
+def _start_build(jobs: int|None, hot: bool, profile: str|None) -> subprocess.Popen:
+    # сборка в дочернем процессе своей группы: ее можно отменить целиком вместе с компиляторами.
+    # --no-daemon: отмена клиента не остановила бы сборку в демоне
+    cmd: list[str] = [sys.executable, "-m", "pcpm", "build", "--no-daemon"]
+    if jobs is not None: cmd += ["-j", str(jobs)]
+    if hot: cmd.append("--hot")
+    if profile is not None: cmd += ["--profile", profile]
+    return subprocess.Popen(cmd, start_new_session=not sys.platform.startswith("win"))
+
+def _cancel_build(proc: subprocess.Popen):
+    if proc.poll() is not None: return
+    try:
+        if sys.platform.startswith("win"):
+            proc.terminate()
+        else:
+            os.killpg(proc.pid, signal.SIGINT)
+        proc.wait(CANCEL_TIMEOUT)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+    except ProcessLookupError:
+        pass
+
+def watch(run_args: list[str], run_target: bool = True, jobs: int|None = None, polling: bool = False, hot: bool = False, profile: str|None = None) -> bool:
+    """
+    следит за src/, pkgs/, config.json и assets: после паузы в изменениях пересобирает
+    (инкрементально, в отдельном процессе) и перезапускает цель через SIGINT.
+    изменение во время сборки отменяет ее и запускает новую.
+    hot: цель - хост hot-reload, он сам подгружает новую библиотеку, перезапуск только если он завершился
+    profile: сборка и запуск из build/<профиль>/
+    """
+    config: Config|None = load_config()
+    if config is None: return False
+
+    watcher: Watcher = make_watcher(watch_roots(config), polling)
+    target: subprocess.Popen|None = None
+    build: subprocess.Popen|None = None
+    changed: set[str] = {str(ROOT_PATH)}
+    logger.info("отслеживание изменений, Ctrl-C - выход")
+    try:
+        while True:
+            if not changed:
+                more: set[str]|None = watcher.wait(None)
+                changed = {str(ROOT_PATH)} if more is None else more
+                if not changed: continue
+            changed = _collect(watcher, changed)
+            if len(changed) <= 3:
+                logger.info(f"изменения: {', '.join(sorted(changed))}")
+            else:
+                logger.info(f"изменено файлов: {len(changed)}")
+
+            if any(os.path.normpath(p) == "config.json" for p in changed):
+                # могли поменяться assets - переподписываемся
+                new_config: Config|None = load_config()
+                if new_config is not None:
+                    config = new_config
+                    watcher.close()
+                    watcher = make_watcher(watch_roots(config), polling)
+            changed = set()
+
+            t: float = time.perf_counter()
+            target_mtime: int|None = _mtime(target_path(config))
+            build = _start_build(jobs, hot, profile)
+            while build.poll() is None:
+                more = watcher.wait(POLL)
+                if more is None or more:
+                    changed = {str(ROOT_PATH)} if more is None else more
+                    logger.info("новые изменения, сборка отменена")
+                    _cancel_build(build)
+                    break
+            if changed: continue
+
+            if build.returncode != 0:
+                logger.error("сборка не удалась, жду изменений")
+                continue
+            logger.info(f"собрано за {time.perf_counter() - t:.2f}с")
+
+            if run_target:
+                # хост перелинкован (поменялись пакеты) - его надо перезапустить, иначе хватит новой библиотеки
+                if hot and target is not None and target.poll() is None and _mtime(target_path(config)) == target_mtime: continue
+                stop_target(target)
+                target = start_target(config, run_args)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if build is not None: _cancel_build(build)
+        stop_target(target)
+        watcher.close()
+    logger.info("завершение")
+    return True
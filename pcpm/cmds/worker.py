@@ -0,0 +1,4 @@
+from ..dist import CompileWorker, DEFAULT_LISTEN
+
+def worker(listen: str = DEFAULT_LISTEN, slots: int|None = None) -> bool:
+    return CompileWorker(slots).serve(listen)
@@ -0,0 +1,261 @@
+from pathlib import Path
+import json
+import logging
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+from .ds import Config, DAEMON_LOG_PATH, DAEMON_SOCKET_PATH, PKGS_PATH, ROOT_PATH, SRC_PATH
+from .fswatch import FileState, set_file_state
+from .utils import get_compiler_id, load_config
+
+logger = logging.getLogger(__name__)
+
+# после потока вывода сборки демон шлет DONE_MARK + json с результатом
+DONE_MARK = b"\0pcpm-done:"
+START_TIMEOUT = 5.0
+ACCEPT_POLL = 0.5
+
+def daemon_available() -> bool:
+    return hasattr(socket, "AF_UNIX") and not sys.platform.startswith("win")
+
+def watch_roots(config: Config|None) -> list[Path]:
+    roots: list[Path] = [SRC_PATH, PKGS_PATH, ROOT_PATH/"config.json"]
+    if config is not None:
+        roots += [Path(a) for a in config.get("assets", [])]
+    return roots
+
+def _connect(timeout: float|None = None) -> socket.socket|None:
+    if not daemon_available() or not DAEMON_SOCKET_PATH.exists(): return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(str(DAEMON_SOCKET_PATH))
+    except ConnectionRefusedError:
+        # демон умер, не убрав за собой сокет
+        sock.close()
+        DAEMON_SOCKET_PATH.unlink(missing_ok=True)
+        return None
+    except OSError:
+        sock.close()
+        return None
+    return sock
+
+def request(req: dict, timeout: float|None = 5.0) -> dict|None:
+    """
+    короткий запрос к демону (status, stop). return ответ или None, если демон не запущен
+    """
+    sock = _connect(timeout)
+    if sock is None: return None
+    with sock:
+        try:
+            sock.sendall(json.dumps(req).encode()+b"\n")
+            data: bytes = b""
+            while not data.endswith(b"\n"):
+                chunk = sock.recv(4096)
+                if not chunk: break
+                data += chunk
+            return json.loads(data) if data else None
+        except (OSError, ValueError):
+            return None
+
+def build_via_daemon(force: bool, jobs: int|None, trace: Path|None, hot: bool = False, unity: bool = False, profile: str|None = None, lto: bool = False) -> bool|None:
+    """
+    отдает сборку демону и печатает ее вывод по мере поступления.
+    return результат сборки, None - демона нет (собираем сами)
+    """
+    # под make pcpm должен быть клиентом jobserver'а вызвавшего make, а демон его не видит
+    if "--jobserver-auth=" in os.environ.get("MAKEFLAGS", "") or "--jobserver-fds=" in os.environ.get("MAKEFLAGS", ""):
+        return None
+    sock = _connect()
+    if sock is None: return None
+
+    with sock:
+        sock.sendall(json.dumps({
+            "cmd": "build", "force": force, "jobs": jobs, "hot": hot, "unity": unity, "profile": profile, "lto": lto,
+            "trace": str(trace) if trace is not None else None
+        }).encode()+b"\n")
+
+        out = sys.stdout.buffer
+        tail: bytes = b""
+        while True:
+            chunk: bytes = sock.recv(1 << 16)
+            if not chunk:
+                logger.error("демон сборки оборвал соединение")
+                return False
+            tail += chunk
+            i: int = tail.find(DONE_MARK)
+            if i >= 0:
+                out.write(tail[:i]); out.flush()
+                rest: bytes = tail[i+len(DONE_MARK):]
+                while not rest.endswith(b"\n"):
+                    chunk = sock.recv(4096)
+                    if not chunk: break
+                    rest += chunk
+                try:
+                    return bool(json.loads(rest).get("ok"))
+                except ValueError:
+                    return False
+            # хвост, в котором может начинаться маркер, оставляем до следующего чанка
+            keep: int = len(DONE_MARK)-1
+            out.write(tail[:-keep]); out.flush()
+            tail = tail[-keep:]
+
+class BuildDaemon:
+    """
+    фоновый процесс на проект: держит разобранный config.json, загруженные модули пакетов
+    и таблицу файлов src/, pkgs/, assets (inotify, без него - опрос) между сборками.
+    одна сборка за раз: на время сборки stdout/stderr демона перенаправлены в сокет клиента,
+    поэтому клиент видит и логи pcpm, и вывод компилятора и хуков
+    """
+    def __init__(self, polling: bool = False):
+        self.started = time.time()
+        self.builds = 0
+        self.stopping = False
+        self.build_lock = threading.Lock()
+        self.state = FileState(watch_roots(load_config()), polling)
+        set_file_state(self.state)
+        self.server: socket.socket|None = None
+
+    def serve(self) -> bool:
+        DAEMON_SOCKET_PATH.parent.mkdir(parents=True, exist_ok=True)
+        if request({"cmd": "status"}) is not None:
+            logger.error("демон сборки уже запущен")
+            return False
+        DAEMON_SOCKET_PATH.unlink(missing_ok=True)
+
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server.bind(str(DAEMON_SOCKET_PATH))
+        self.server.listen(8)
+        # accept с таймаутом, чтобы stop() из потока запроса или SIGTERM завершали цикл
+        self.server.settimeout(ACCEPT_POLL)
+        signal.signal(signal.SIGTERM, lambda *_: self.stop())
+        logger.info(f"демон сборки запущен (pid {os.getpid()}, файлы: {self.state.kind})")
+        try:
+            while not self.stopping:
+                try:
+                    conn, _ = self.server.accept()
+                except socket.timeout:
+                    continue
+                except OSError:
+                    break
+                conn.settimeout(None)
+                threading.Thread(target=self.handle, args=(conn,), daemon=True).start()
+        finally:
+            self.server.close()
+            DAEMON_SOCKET_PATH.unlink(missing_ok=True)
+            self.state.close()
+            logger.info("демон сборки остановлен")
+        return True
+
+    def stop(self):
+        self.stopping = True
+
+    def status(self) -> dict:
+        return {
+            "pid": os.getpid(),
+            "uptime": round(time.time() - self.started, 1),
+            "builds": self.builds,
+            "watcher": self.state.kind,
+            "files": len(self.state.files),
+            "busy": self.build_lock.locked(),
+        }
+
+    def handle(self, conn: socket.socket):
+        with conn:
+            try:
+                data: bytes = b""
+                while not data.endswith(b"\n"):
+                    chunk = conn.recv(4096)
+                    if not chunk: return
+                    data += chunk
+                req: dict = json.loads(data)
+            except (OSError, ValueError):
+                return
+
+            cmd: str|None = req.get("cmd")
+            try:
+                if cmd == "status":
+                    conn.sendall(json.dumps(self.status()).encode()+b"\n")
+                elif cmd == "stop":
+                    conn.sendall(json.dumps({"ok": True}).encode()+b"\n")
+                    self.stop()
+                elif cmd == "build":
+                    ok: bool = self.build(conn, req)
+                    conn.sendall(DONE_MARK+json.dumps({"ok": ok}).encode()+b"\n")
+                else:
+                    conn.sendall(json.dumps({"error": f"неизвестная команда {cmd}"}).encode()+b"\n")
+            except OSError:
+                # клиент ушел (Ctrl-C)
+                return
+
+    def build(self, conn: socket.socket, req: dict) -> bool:
+        from .cmds.build import build
+
+        with self.build_lock:
+            self.state.refresh()
+            # компилятор могли обновить, пока демон работал
+            get_compiler_id.cache_clear()
+
+            sys.stdout.flush(); sys.stderr.flush()
+            saved: tuple[int, int] = (os.dup(1), os.dup(2))
+            os.dup2(conn.fileno(), 1)
+            os.dup2(conn.fileno(), 2)
+            ok: bool = False
+            try:
+                trace: str|None = req.get("trace")
+                ok = build(
+                    bool(req.get("force")), req.get("jobs"), Path(trace) if trace else None,
+                    bool(req.get("hot")), bool(req.get("unity")), req.get("profile"), bool(req.get("lto"))
+                )
+            except Exception as e:
+                logger.error(f"сборка в демоне упала: {e}")
+            finally:
+                try:
+                    sys.stdout.flush(); sys.stderr.flush()
+                except OSError:
+                    pass
+                os.dup2(saved[0], 1)
+                os.dup2(saved[1], 2)
+                os.close(saved[0]); os.close(saved[1])
+            self.builds += 1
+            return ok
+
+def start_daemon(polling: bool = False) -> bool:
+    """
+    запускает `pcpm daemon serve` отдельной сессией и ждет, пока он начнет отвечать
+    """
+    if not daemon_available():
+        logger.error("демон сборки требует unix-сокетов")
+        return False
+    status: dict|None = request({"cmd": "status"})
+    if status is not None:
+        logger.info(f"демон сборки уже запущен (pid {status['pid']})")
+        return True
+
+    DAEMON_LOG_PATH.parent.mkdir(parents=True, exist_ok=True)
+    # MAKEFLAGS запустившего make демону не нужен: его jobserver живет меньше демона
+    env: dict[str, str] = {k: v for k, v in os.environ.items() if k not in ("MAKEFLAGS", "MFLAGS")}
+    cmd: list[str] = [sys.executable, "-m", "pcpm", "daemon", "serve"] + (["--polling"] if polling else [])
+    with open(DAEMON_LOG_PATH, "a") as log:
+        proc = subprocess.Popen(
+            cmd, stdin=subprocess.DEVNULL, stdout=log, stderr=subprocess.STDOUT,
+            start_new_session=True, env=env
+        )
+
+    deadline: float = time.monotonic() + START_TIMEOUT
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            logger.error(f"демон сборки не запустился, см. {DAEMON_LOG_PATH}")
+            return False
+        status = request({"cmd": "status"}, timeout=1.0)
+        if status is not None:
+            logger.info(f"демон сборки запущен (pid {status['pid']}, файлы: {status['watcher']})")
+            return True
+        time.sleep(0.05)
+    logger.error(f"демон сборки не ответил за {START_TIMEOUT:.0f}с, см. {DAEMON_LOG_PATH}")
+    return False
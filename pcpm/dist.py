@@ -0,0 +1,396 @@
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable
+import json
+import logging
+import os
+import re
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import uuid
+import zlib
+
+from .ds import Config, DistConfig, DistWorkerConfig
+
+logger = logging.getLogger(__name__)
+
+PROTOCOL_VERSION = 1
+DEFAULT_PORT = 3633
+DEFAULT_LISTEN = f"127.0.0.1:{DEFAULT_PORT}"
+DEFAULT_TIMEOUT = 120.0
+CONNECT_TIMEOUT = 2.0
+ACCEPT_POLL = 0.5
+MAX_HEADER = 1 << 20
+
+# язык препроцессированного TU по расширению исходника
+REMOTE_LANGS: dict[str, str] = {
+    ".c": "cpp-output",
+    ".cc": "c++-cpp-output",
+    ".cpp": "c++-cpp-output",
+    ".cxx": "c++-cpp-output",
+    ".c++": "c++-cpp-output",
+    ".C": "c++-cpp-output",
+}
+# флаги препроцессора: TU препроцессируется локально, на воркер они не нужны
+CPP_FLAGS_SEPARATE = ("-I", "-D", "-U", "-include", "-imacros", "-isystem", "-iquote", "-idirafter", "-iprefix", "-iwithprefix", "-iwithprefixbefore")
+CPP_FLAGS_JOINED = ("-I", "-D", "-U", "-isystem", "-iquote", "-idirafter", "-Wp,", "-nostdinc")
+# с этими флагами TU компилируется только локально: результат зависит от файлов или железа этой машины
+LOCAL_ONLY = ("-x", "-include-pch", "-gsplit-dwarf", "-fprofile-", "--coverage", "-ftest-coverage", "-save-temps", "-march=native", "-mtune=native", "-mcpu=native")
+# воркер не выполняет флаги, которые подгружают код или пишут что-то кроме объектника
+FORBIDDEN = ("-fplugin", "-B", "-specs", "--specs", "-wrapper", "-o", "-M", "-fdump-", "-aux-info", "-save-temps", "-fprofile-", "@")
+# на воркере запускаются только компиляторы (в т.ч. кросс-компиляторы и версии: gcc-12, clang++-17)
+COMPILER_NAME = re.compile(r"^([\w.]+-)*(cc|c\+\+|gcc|g\+\+|clang|clang\+\+)(-[\d.]+)?$")
+
+def parse_address(address: str) -> tuple[int, str|tuple[str, int]]:
+    """
+    "unix:/путь" -> AF_UNIX, "host:port", "host", "[::1]:port" -> TCP
+    """
+    if address.startswith("unix:"):
+        return socket.AF_UNIX, address[len("unix:"):]
+    host, sep, port = address.rpartition(":")
+    if not sep or "]" in port:
+        host, port = address, str(DEFAULT_PORT)
+    host = host.strip("[]")
+    return (socket.AF_INET6 if ":" in host else socket.AF_INET), (host, int(port))
+
+def _connect(address: str, timeout: float) -> socket.socket:
+    family, addr = parse_address(address)
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(addr)
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+def send_msg(sock: socket.socket, header: dict, payload: bytes = b""):
+    """
+    сообщение: json-заголовок в одну строку (size - длина данных) и сразу за ним данные
+    """
+    sock.sendall(json.dumps({**header, "size": len(payload)}).encode()+b"\n"+payload)
+
+def recv_msg(fd) -> tuple[dict, bytes]:
+    line: bytes = fd.readline(MAX_HEADER)
+    if not line.endswith(b"\n"): raise ConnectionError("соединение оборвано")
+    header: dict = json.loads(line)
+    size: int = int(header.get("size", 0))
+    payload: bytes = fd.read(size) if size else b""
+    if len(payload) != size: raise ConnectionError("соединение оборвано")
+    return header, payload
+
+def exchange(address: str, header: dict, payload: bytes, timeout: float) -> tuple[dict, bytes]:
+    with _connect(address, min(timeout, CONNECT_TIMEOUT)) as sock:
+        sock.settimeout(timeout)
+        send_msg(sock, header, payload)
+        with sock.makefile("rb") as fd:
+            return recv_msg(fd)
+
+def version_line(cc: str) -> str|None:
+    try:
+        result = subprocess.run([cc, "--version"], capture_output=True, text=True)
+    except OSError:
+        return None
+    if result.returncode != 0 or not result.stdout: return None
+    return result.stdout.splitlines()[0]
+
+def remote_lang(c_file: Path) -> str|None:
+    return REMOTE_LANGS.get(c_file.suffix)
+
+def can_offload(c_file: Path, args: list[str]) -> bool:
+    return remote_lang(c_file) is not None and not any(a.startswith(LOCAL_ONLY+FORBIDDEN) for a in args)
+
+def compile_args(args: list[str]) -> list[str]:
+    """
+    флаги для компиляции уже препроцессированного TU: без -I/-D/-include и т.п.
+    """
+    out: list[str] = []
+    skip: bool = False
+    for arg in args:
+        if skip:
+            skip = False
+            continue
+        if arg in CPP_FLAGS_SEPARATE:
+            skip = True
+            continue
+        if arg.startswith(CPP_FLAGS_JOINED): continue
+        out.append(arg)
+    return out
+
+def _write_stderr(text: str, map_stderr: Callable[[str], str]|None):
+    if not text: return
+    if map_stderr is not None:
+        text = "".join(map_stderr(line) for line in text.splitlines(keepends=True))
+    sys.stderr.write(text)
+    sys.stderr.flush()
+
+class RemoteWorker:
+    def __init__(self, address: str, slots: int):
+        self.address = address
+        self.slots = max(1, slots)
+        self.busy = 0
+        self.alive = True
+        self.compiled = 0
+
+class DistPool:
+    """
+    удаленные воркеры одной сборки. TU препроцессируется локально (заодно пишется depfile),
+    на воркер уходит препроцессированный текст, обратно приходит объектник.
+    воркер для TU - наименее загруженный относительно своего числа слотов.
+    воркер, который не ответил или ответил ошибкой протокола, до конца сборки не используется,
+    а его TU компилируется локально
+    """
+    def __init__(self, cc: str, version: str, workers: list[RemoteWorker], timeout: float, local_workers: int):
+        self.cc = cc
+        self.compiler = Path(cc).name
+        self.version = version
+        self.workers = workers
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        # препроцессирование идет локально и без слотов планировщика
+        self.cpp = threading.Semaphore(max(2, 2*local_workers))
+        self.fallbacks = 0
+
+    @property
+    def capacity(self) -> int:
+        return sum(w.slots for w in self.workers if w.alive)
+
+    def acquire(self) -> RemoteWorker|None:
+        with self.lock:
+            free: list[RemoteWorker] = [w for w in self.workers if w.alive and w.busy < w.slots]
+            if not free: return None
+            worker: RemoteWorker = min(free, key=lambda w: (w.busy/w.slots, -w.slots))
+            worker.busy += 1
+            return worker
+
+    def release(self, worker: RemoteWorker, ok: bool):
+        with self.lock:
+            worker.busy -= 1
+            if ok: worker.compiled += 1
+
+    def fail(self, worker: RemoteWorker, reason: object):
+        with self.lock:
+            if not worker.alive: return
+            worker.alive = False
+        logger.warning(f"воркер {worker.address}: {reason}, его TU компилируются локально")
+
+    def compile(self, c_file: Path, dst: Path, args: list[str], depfile: Path|None, map_stderr: Callable[[str], str]|None = None) -> bool|None:
+        """
+        return True - объектник получен, False - ошибка в TU, None - компилировать локально
+        """
+        lang: str|None = remote_lang(c_file)
+        if lang is None: return None
+        worker: RemoteWorker|None = self.acquire()
+        if worker is None:
+            with self.lock: self.fallbacks += 1
+            return None
+
+        ok: bool = False
+        try:
+            cmd: list[str] = [self.cc]+args+["-E", str(c_file)]
+            if depfile is not None:
+                cmd += ["-MMD", "-MF", str(depfile), "-MT", str(dst)]
+            with self.cpp:
+                pre = subprocess.run(cmd, capture_output=True)
+            _write_stderr(pre.stderr.decode(errors="replace"), map_stderr)
+            if pre.returncode != 0: return False
+
+            header: dict = {
+                "cmd": "compile", "protocol": PROTOCOL_VERSION,
+                "compiler": self.compiler, "version": self.version,
+                "lang": lang, "args": compile_args(args), "cwd": os.getcwd(),
+            }
+            reply, data = exchange(worker.address, header, zlib.compress(pre.stdout, 1), self.timeout)
+            if "error" in reply:
+                self.fail(worker, reply["error"])
+                with self.lock: self.fallbacks += 1
+                return None
+            _write_stderr(reply.get("stderr", ""), map_stderr)
+            if reply.get("returncode") != 0: return False
+
+            tmp: Path = dst.with_name(f".{uuid.uuid4().hex}.tmp")
+            tmp.write_bytes(zlib.decompress(data))
+            os.replace(tmp, dst)
+            ok = True
+            return True
+        except (OSError, ValueError, zlib.error) as e:
+            self.fail(worker, e)
+            with self.lock: self.fallbacks += 1
+            return None
+        finally:
+            self.release(worker, ok)
+
+    def summary(self) -> str|None:
+        done: list[str] = [f"{w.address} - {w.compiled}" for w in self.workers if w.compiled]
+        if not done and not self.fallbacks: return None
+        text: str = f"удаленно собрано TU: {', '.join(done) if done else 'нет'}"
+        if self.fallbacks: text += f"; локально вместо воркера: {self.fallbacks}"
+        return text
+
+def _worker_entries(conf: DistConfig) -> list[DistWorkerConfig]:
+    return [{"address": w} if isinstance(w, str) else w for w in conf.get("workers", [])]
+
+def hello(address: str, compiler: str, version: str) -> dict:
+    try:
+        reply, _ = exchange(address, {
+            "cmd": "hello", "protocol": PROTOCOL_VERSION, "compiler": compiler, "version": version
+        }, b"", CONNECT_TIMEOUT)
+        return reply
+    except (OSError, ValueError) as e:
+        return {"error": f"недоступен ({e})"}
+
+def connect_workers(config: Config, cc: str, local_workers: int) -> DistPool|None:
+    """
+    опрашивает воркеры из "distributed" и оставляет те, у которых тот же компилятор той же версии.
+    return None, если распределенная сборка не настроена или ни один воркер не подошел
+    """
+    conf: DistConfig|None = config.get("distributed")
+    if conf is None or not conf.get("enabled", True): return None
+    entries: list[DistWorkerConfig] = _worker_entries(conf)
+    if not entries: return None
+    version: str|None = version_line(cc)
+    if version is None: return None
+
+    with ThreadPoolExecutor(max_workers=len(entries)) as ex:
+        replies: list[dict] = list(ex.map(lambda e: hello(e["address"], Path(cc).name, version), entries))
+
+    workers: list[RemoteWorker] = []
+    for entry, reply in zip(entries, replies):
+        if "error" in reply:
+            logger.warning(f"воркер {entry['address']}: {reply['error']}")
+            continue
+        workers.append(RemoteWorker(entry["address"], entry.get("slots", int(reply.get("slots", 1)))))
+    if not workers:
+        logger.warning("нет доступных воркеров, сборка локально")
+        return None
+
+    pool = DistPool(cc, version, workers, conf.get("timeout", DEFAULT_TIMEOUT), local_workers)
+    logger.info(f"распределенная сборка: воркеров {len(workers)}, удаленных слотов {pool.capacity}")
+    return pool
+
+_pool: DistPool|None = None
+
+def get_dist_pool() -> DistPool|None:
+    return _pool
+
+def set_dist_pool(pool: DistPool|None):
+    global _pool
+    _pool = pool
+
+class CompileWorker:
+    """
+    `pcpm worker`: принимает препроцессированные TU и возвращает объектники.
+    компилятор берется из PATH воркера по имени и должен совпадать с клиентским по `--version`.
+    флаги, подгружающие код (-fplugin, -B, -specs, ...), отклоняются, но воркер все равно
+    стоит слушать только в доверенной сети: протокол без аутентификации
+    """
+    def __init__(self, slots: int|None = None):
+        self.slots = slots if slots is not None and slots > 0 else os.cpu_count() or 1
+        self.sem = threading.Semaphore(self.slots)
+        self.stopping = False
+        self.compiled = 0
+        self.lock = threading.Lock()
+        self.compilers: dict[str, tuple[str, str]|None] = {}
+
+    def serve(self, listen: str = DEFAULT_LISTEN) -> bool:
+        family, addr = parse_address(listen)
+        if family == socket.AF_UNIX:
+            if not hasattr(socket, "AF_UNIX"):
+                logger.error("unix-сокеты не поддерживаются на этой платформе")
+                return False
+            Path(addr).unlink(missing_ok=True)
+        server = socket.socket(family, socket.SOCK_STREAM)
+        if family != socket.AF_UNIX:
+            server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            server.bind(addr)
+        except OSError as e:
+            logger.error(f"не удалось слушать {listen}: {e}")
+            server.close()
+            return False
+        server.listen(64)
+        server.settimeout(ACCEPT_POLL)
+        signal.signal(signal.SIGTERM, lambda *_: self.stop())
+        logger.info(f"воркер компиляции слушает {listen} (слотов {self.slots}, pid {os.getpid()})")
+        try:
+            while not self.stopping:
+                try:
+                    conn, _ = server.accept()
+                except socket.timeout:
+                    continue
+                except OSError:
+                    break
+                conn.settimeout(None)
+                threading.Thread(target=self.handle, args=(conn,), daemon=True).start()
+        finally:
+            server.close()
+            if family == socket.AF_UNIX: Path(addr).unlink(missing_ok=True)
+            logger.info(f"воркер компиляции остановлен, собрано TU: {self.compiled}")
+        return True
+
+    def stop(self):
+        self.stopping = True
+
+    def resolve(self, compiler: str, version: str) -> tuple[str|None, str|None]:
+        """
+        return (путь к компилятору, None) или (None, причина отказа)
+        """
+        if not COMPILER_NAME.match(compiler): return None, f"{compiler} - не компилятор"
+        with self.lock:
+            if compiler not in self.compilers:
+                pth: str|None = shutil.which(compiler)
+                ver: str|None = version_line(pth) if pth is not None else None
+                self.compilers[compiler] = (pth, ver) if pth is not None and ver is not None else None
+            found = self.compilers[compiler]
+        if found is None: return None, f"нет компилятора {compiler}"
+        if found[1] != version: return None, f"другая версия {compiler}: {found[1]}"
+        return found[0], None
+
+    def handle(self, conn: socket.socket):
+        with conn, conn.makefile("rb") as fd:
+            try:
+                req, payload = recv_msg(fd)
+                reply, data = self.dispatch(req, payload)
+                send_msg(conn, reply, data)
+            except (OSError, ValueError, zlib.error) as e:
+                try:
+                    send_msg(conn, {"error": f"ошибка протокола: {e}"})
+                except OSError:
+                    pass
+
+    def dispatch(self, req: dict, payload: bytes) -> tuple[dict, bytes]:
+        if req.get("protocol") != PROTOCOL_VERSION:
+            return {"error": f"версия протокола {req.get('protocol')}, воркер - {PROTOCOL_VERSION}"}, b""
+        cc, reason = self.resolve(str(req.get("compiler")), str(req.get("version")))
+        if cc is None: return {"error": reason}, b""
+        if req.get("cmd") == "hello":
+            return {"slots": self.slots}, b""
+        if req.get("cmd") != "compile":
+            return {"error": f"неизвестная команда {req.get('cmd')}"}, b""
+
+        args: list[str] = [str(a) for a in req.get("args", [])]
+        bad: list[str] = [a for a in args if a.startswith(FORBIDDEN)]
+        if bad: return {"error": f"флаги не принимаются: {' '.join(bad)}"}, b""
+        lang: str = str(req.get("lang"))
+        if lang not in REMOTE_LANGS.values(): return {"error": f"неизвестный язык {lang}"}, b""
+
+        with self.sem, tempfile.TemporaryDirectory(prefix="pcpm-worker-") as tmp_dir:
+            src: Path = Path(tmp_dir)/("tu.ii" if lang.startswith("c++") else "tu.i")
+            obj: Path = Path(tmp_dir)/"tu.o"
+            src.write_bytes(zlib.decompress(payload))
+            if any(a.startswith("-g") and a != "-g0" for a in args) and "cwd" in req:
+                # в отладочную информацию - директория клиента, а не временная воркера
+                args = args+[f"-fdebug-prefix-map={tmp_dir}={req['cwd']}"]
+            result = subprocess.run(
+                [cc]+args+["-x", lang, "-c", str(src), "-o", str(obj)],
+                capture_output=True, text=True, cwd=tmp_dir
+            )
+            data: bytes = zlib.compress(obj.read_bytes(), 1) if result.returncode == 0 and obj.exists() else b""
+        if result.returncode == 0:
+            with self.lock: self.compiled += 1
+        return {"returncode": result.returncode, "stderr": result.stderr}, data
@@ -6,6 +6,7 @@ PKGS_MIRROR = "https://pcpmirror.potatom.ru/packages"
 
 PKGS_PATH = Path("./pkgs") 
 ROOT_PATH = Path(".")
+LOCK_PATH = Path(ROOT_PATH/"pcpm.lock")
 
 SRC_PATH = Path("./src")
 
@@ -13,8 +14,27 @@ BUILD_PATH = Path("./build")
 TMP_SRC_PATH = Path(BUILD_PATH/"tmp_src")
 OBJS_PATH = Path(BUILD_PATH/"objs")
 BIN_PATH = Path(BUILD_PATH/"bin")
+MANIFEST_PATH = Path(BUILD_PATH/"manifest.json")
+TIMINGS_PATH = Path(BUILD_PATH/"timings.json")
+HOOKS_PATH = Path(BUILD_PATH/"hooks")
+HISTORY_PATH = Path(BUILD_PATH/"history.jsonl")
+TRACE_PATH = Path(BUILD_PATH/"trace.json")
+DAEMON_SOCKET_PATH = Path(BUILD_PATH/"pcpm.sock")
+DAEMON_LOG_PATH = Path(BUILD_PATH/"daemon.log")
+HOT_PATH = Path(BUILD_PATH/"hot")
+HOT_OBJS_PATH = Path(HOT_PATH/"objs")
+HOT_BIN_PATH = Path(BIN_PATH/"hot")
+UNITY_PATH = Path(BUILD_PATH/"unity")
+PCH_PATH = Path(BUILD_PATH/"pch")
+PGO_PATH = Path(BUILD_PATH/"pgo")
+LIBS_PATH = Path(BUILD_PATH/"libs")
+TESTS_PATH = Path("./tests")
+TESTS_BUILD_PATH = Path(BUILD_PATH/"tests")
+BENCH_PATH = Path(BUILD_PATH/"bench")
 
 BUILD_PATHS = [BUILD_PATH, TMP_SRC_PATH, OBJS_PATH, BIN_PATH]
+# у каждого профиля сборки свои (build/<профиль>/...), остальное общее
+PROFILE_PATHS = [OBJS_PATH, BIN_PATH, HOT_PATH, MANIFEST_PATH, TIMINGS_PATH, PGO_PATH, LIBS_PATH, TESTS_BUILD_PATH]
 
 COMPILE_ARGS = ["-Wall", "-Wextra"]
 COMPILERS = ["cc", "gcc", "clang", "mingw", "cl"]
@@ -24,6 +44,65 @@ class BuildArgs(TypedDict):
     link: list[str]
     objs: list[str]
 
+class CacheConfig(TypedDict):
+    enabled: NotRequired[bool]
+    max_size: NotRequired[int]      # MB
+    secondary: NotRequired[str]
+
+class UnityConfig(TypedDict):
+    enabled: NotRequired[bool]
+    batches: NotRequired[int]           # по умолчанию - число воркеров
+    exclude: NotRequired[list[str]]     # glob'ы от src/, такие файлы компилируются отдельно
+
+class PchConfig(TypedDict):
+    enabled: NotRequired[bool]
+    header: NotRequired[str]            # prefix-заголовок для всех TU, без него - заголовки пакетов
+    min_tus: NotRequired[int]           # сколько TU должны подключать заголовок пакета
+
+class LinkConfig(TypedDict):
+    fast_linker: NotRequired[str|bool]  # "auto" (по умолчанию: mold, затем lld), имя линкера или false
+    archives: NotRequired[bool]         # объектники пакетов - в build/libs/lib<pkg>.a (по умолчанию true)
+    split_dwarf: NotRequired[bool]      # -gsplit-dwarf
+    gdb_index: NotRequired[bool]        # -Wl,--gdb-index (mold, lld, gold)
+
+class DistWorkerConfig(TypedDict):
+    address: Required[str]              # "host:port" или "unix:/путь/к/сокету"
+    slots: NotRequired[int]             # вес воркера, по умолчанию - сколько он сам сообщает
+
+class DistConfig(TypedDict):
+    enabled: NotRequired[bool]
+    workers: Required[list[str|DistWorkerConfig]]
+    timeout: NotRequired[float]         # секунды на один TU, дольше - компиляция локально
+
+class TestsConfig(TypedDict):
+    dir: NotRequired[str]               # откуда брать тесты, по умолчанию tests/
+    timeout: NotRequired[float]         # секунды на один тест
+
+class BenchCase(TypedDict):
+    args: NotRequired[list[str]]        # аргументы цели
+    bin: NotRequired[str]               # другой бинарник из build/[<профиль>/]bin вместо цели
+
+class BenchConfig(TypedDict):
+    cases: NotRequired[dict[str, list[str]|BenchCase]]  # по умолчанию - цель без аргументов
+    profile: NotRequired[str]           # по умолчанию "release", если он есть в profiles
+    runs: NotRequired[int]
+    warmup: NotRequired[int]
+    cpus: NotRequired[list[int]]        # привязка к ядрам (linux)
+    threshold: NotRequired[float]       # % роста медианы wall, после которого - регрессия
+    baseline: NotRequired[str]          # файл базовой линии, по умолчанию bench_baseline.json
+    timeout: NotRequired[float]         # секунды на один запуск
+
+class ProfileConfig(TypedDict):
+    compilation_args: NotRequired[list[str]]    # добавляются к общим
+    linking_args: NotRequired[list[str]]        # добавляются к общим
+    compiler: NotRequired[str]
+    linker: NotRequired[str]
+    lto: NotRequired[bool]
+
+class PgoConfig(TypedDict):
+    train: Required[list[str]|list[list[str]]]  # аргументы цели для обучающего запуска (или список запусков)
+    timeout: NotRequired[float]                 # секунды на один запуск
+
 class Config(TypedDict):
     name: Required[str]
     target_name: Required[str]
@@ -36,12 +115,74 @@ class Config(TypedDict):
     workers: NotRequired[int]
     mirrors: NotRequired[list[str]]
     assets: NotRequired[list[str]]
+    incremental: NotRequired[bool]
+    cache: NotRequired[CacheConfig]
+    store_link: NotRequired[str]
+    install_workers: NotRequired[int]
+    download_retries: NotRequired[int]
+    mirror_timeout: NotRequired[float]
+    jobserver: NotRequired[str|bool]
+    memory_budget: NotRequired[int|str]
+    unity: NotRequired[UnityConfig|bool]
+    pch: NotRequired[PchConfig|bool]
+    profiles: NotRequired[dict[str, ProfileConfig]]
+    lto: NotRequired[bool]
+    pgo: NotRequired[PgoConfig]
+    link: NotRequired[LinkConfig]
+    prebuilt: NotRequired[bool]
+    distributed: NotRequired[DistConfig]
+    tests: NotRequired[TestsConfig]
+    bench: NotRequired[BenchConfig]
+
+class BuildRecord(TypedDict):
+    time: float                     # unix time начала сборки
+    ok: bool
+    wall: float                     # секунды
+    jobs: int
+    force: bool
+    compiled: int                   # сколько TU реально компилировалось
+    tus: dict[str, float]           # самые долгие TU: исходник -> секунды
+    hooks: dict[str, float]         # пакет -> секунды хука
+    profile: NotRequired[str]
+    link: NotRequired[float]
+    cache: NotRequired[dict[str, int]]  # hits, secondary_hits, misses
+
+class TestResult(TypedDict):
+    name: str
+    status: str                     # passed, failed, timeout, skipped
+    time: float                     # секунды
+    code: int|None                  # код возврата (отрицательный - сигнал), None при таймауте
+    stdout: str
+    stderr: str
+
+class BenchStats(TypedDict):
+    median: float
+    mad: float                      # медианное абсолютное отклонение
+    ci: list[float]                 # доверительный интервал медианы [от, до]
+
+class BenchSummary(TypedDict):
+    runs: int
+    wall: BenchStats                # секунды
+    user: BenchStats                # секунды
+    sys: BenchStats                 # секунды
+    rss: BenchStats                 # MB
+    samples: list[float]            # wall каждого запуска
+
+class LockEntry(TypedDict):
+    sha256: str
+    size: int
+
+class HookSpec(TypedDict):
+    inputs: NotRequired[list[str]]      # glob'ы от корня проекта
+    outputs: NotRequired[list[str]]     # glob'ы от tmp_src
 
 class PackageConfig(TypedDict):
     name: str
     dependencies: NotRequired[dict]
+    hook: NotRequired[HookSpec]
 
 
 InitFuncType = Callable[[Path, Path], dict|None]
 BuildFuncType = Callable[[Path, Path, dict], BuildArgs|None]
-RemoveFuncType = Callable[[Path, Path, dict|None], None]
\ No newline at end of file
+RemoveFuncType = Callable[[Path, Path, dict|None], None]
+SpecFuncType = Callable[[Path, Path, dict], HookSpec|None]
\ No newline at end of file
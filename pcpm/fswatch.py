@@ -0,0 +1,259 @@
+from pathlib import Path
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+IN_MODIFY       = 0x00000002
+IN_ATTRIB       = 0x00000004
+IN_CLOSE_WRITE  = 0x00000008
+IN_MOVED_FROM   = 0x00000040
+IN_MOVED_TO     = 0x00000080
+IN_CREATE       = 0x00000100
+IN_DELETE       = 0x00000200
+IN_DELETE_SELF  = 0x00000400
+IN_MOVE_SELF    = 0x00000800
+IN_Q_OVERFLOW   = 0x00004000
+IN_IGNORED      = 0x00008000
+IN_ISDIR        = 0x40000000
+
+WATCH_MASK = (
+    IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+    | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+)
+EVENT_HEADER = struct.Struct("iIII")
+POLL_INTERVAL = 0.5
+
+FileStat = tuple[int, int]     # (mtime_ns, size)
+
+IGNORED_DIRS = ("__pycache__",)
+# то, что сборка сама кладет в папки пакетов (build_sf_libs, готовые артефакты)
+IGNORED_SUFFIXES = (".o", ".d", ".gch", ".pch")
+
+def ignored(pth: str) -> bool:
+    """
+    собственные записи pcpm и python: иначе сборка видела бы их как новые изменения и отменяла себя
+    """
+    return pth.endswith(IGNORED_SUFFIXES) or any(part in IGNORED_DIRS for part in Path(pth).parts)
+
+def scan(root: Path) -> dict[str, FileStat]:
+    """
+    return { "src/main.c": (mtime_ns, size) } для всех файлов под root (или самого root, если это файл)
+    """
+    files: dict[str, FileStat] = {}
+    try:
+        st = os.stat(root)
+    except OSError:
+        return files
+    if not os.path.isdir(root):
+        files[str(root)] = (st.st_mtime_ns, st.st_size)
+        return files
+    # пакеты в pkgs/ могут быть симлинками в хранилище
+    for dirpath, dirnames, filenames in os.walk(root, followlinks=True):
+        dirnames[:] = [d for d in dirnames if d not in IGNORED_DIRS]
+        for name in filenames:
+            pth = os.path.join(dirpath, name)
+            try:
+                st = os.stat(pth)
+            except OSError:
+                continue
+            files[pth] = (st.st_mtime_ns, st.st_size)
+    return files
+
+def _under(pth: str, root: str) -> bool:
+    return pth == root or pth.startswith(root.rstrip(os.sep)+os.sep)
+
+class InotifyWatcher:
+    """
+    inotify через ctypes (linux): рекурсивные watch'и на каталоги roots,
+    плюс нерекурсивный на корень проекта, чтобы заметить появление/удаление самих roots
+    """
+    def __init__(self, roots: list[Path]):
+        if not sys.platform.startswith("linux"):
+            raise OSError("inotify есть только в linux")
+        libc_name: str|None = ctypes.util.find_library("c")
+        self.libc = ctypes.CDLL(libc_name or "libc.so.6", use_errno=True)
+        self.fd: int = self.libc.inotify_init1(os.O_CLOEXEC | os.O_NONBLOCK)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1")
+        self.roots = [str(r) for r in roots]
+        self.wds: dict[int, str] = {}
+        self.buffer = b""
+        self._add(".", recursive=False)
+        for root in self.roots:
+            self._add(root)
+
+    def _add_one(self, pth: str):
+        wd: int = self.libc.inotify_add_watch(self.fd, os.fsencode(pth), WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            # каталог успел пропасть - не ошибка
+            if err not in (2, 20): logger.warning(f"inotify: не удалось следить за '{pth}': {os.strerror(err)}")
+            return
+        self.wds[wd] = pth
+
+    def _add(self, pth: str, recursive: bool = True):
+        if not os.path.exists(pth): return
+        self._add_one(pth)
+        if not recursive or not os.path.isdir(pth): return
+        for dirpath, dirnames, _ in os.walk(pth, followlinks=True):
+            dirnames[:] = [d for d in dirnames if d not in IGNORED_DIRS]
+            for d in dirnames:
+                self._add_one(os.path.join(dirpath, d))
+
+    def _watched(self, pth: str) -> bool:
+        return any(_under(pth, r) for r in self.roots)
+
+    def wait(self, timeout: float|None = None) -> set[str]|None:
+        """
+        ждет изменений не дольше timeout.
+        return измененные пути (файлы или каталоги), None - очередь переполнилась, нужен полный рескан
+        """
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready: return set()
+        try:
+            self.buffer += os.read(self.fd, 1 << 16)
+        except BlockingIOError:
+            return set()
+
+        changed: set[str] = set()
+        overflow: bool = False
+        offset: int = 0
+        while offset + EVENT_HEADER.size <= len(self.buffer):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(self.buffer, offset)
+            if offset + EVENT_HEADER.size + length > len(self.buffer): break
+            name: str = os.fsdecode(self.buffer[offset+EVENT_HEADER.size:offset+EVENT_HEADER.size+length].rstrip(b"\0"))
+            offset += EVENT_HEADER.size + length
+
+            if mask & IN_Q_OVERFLOW:
+                overflow = True
+                continue
+            if mask & IN_IGNORED:
+                self.wds.pop(wd, None)
+                continue
+            base: str|None = self.wds.get(wd)
+            if base is None: continue
+            pth: str = os.path.normpath(os.path.join(base, name)) if name else base
+            if not self._watched(pth) or ignored(pth): continue
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                self._add(pth)
+            changed.add(pth)
+        self.buffer = self.buffer[offset:]
+        return None if overflow else changed
+
+    def close(self):
+        os.close(self.fd)
+
+class PollingWatcher:
+    """
+    запасной вариант без inotify: сравнение снимков stat раз в interval секунд
+    """
+    def __init__(self, roots: list[Path], interval: float = POLL_INTERVAL):
+        self.roots = roots
+        self.interval = interval
+        self.snapshot: dict[str, FileStat] = self._scan()
+
+    def _scan(self) -> dict[str, FileStat]:
+        files: dict[str, FileStat] = {}
+        for root in self.roots: files.update(scan(root))
+        return files
+
+    def wait(self, timeout: float|None = None) -> set[str]|None:
+        deadline: float|None = None if timeout is None else time.monotonic() + timeout
+        while True:
+            current = self._scan()
+            changed: set[str] = {
+                p for p in current.keys() | self.snapshot.keys()
+                if current.get(p) != self.snapshot.get(p) and not ignored(p)
+            }
+            self.snapshot = current
+            if changed: return changed
+            if deadline is not None and time.monotonic() >= deadline: return set()
+            left: float = self.interval if deadline is None else min(self.interval, max(0.0, deadline - time.monotonic()))
+            time.sleep(left)
+
+    def close(self):
+        pass
+
+Watcher = InotifyWatcher|PollingWatcher
+
+def make_watcher(roots: list[Path], polling: bool = False) -> Watcher:
+    if not polling:
+        try:
+            return InotifyWatcher(roots)
+        except (OSError, AttributeError) as e:
+            logger.info(f"inotify недоступен ({e}), отслеживание опросом")
+    return PollingWatcher(roots)
+
+class FileState:
+    """
+    таблица (mtime_ns, size) файлов под roots в памяти вместо обхода src/ и pkgs/ на каждую сборку.
+    refresh() перед сборкой забирает накопленные события watcher'а: событие inotify
+    стоит в очереди ядра уже к возврату из write(), так что гонки с только что сохраненным файлом нет
+    """
+    def __init__(self, roots: list[Path], polling: bool = False):
+        self.roots = roots
+        self.lock = threading.Lock()
+        self.watcher: Watcher = make_watcher(roots, polling)
+        self.files: dict[str, FileStat] = {}
+        self.generation: int = 0
+        self.rescan()
+
+    @property
+    def kind(self) -> str:
+        return "inotify" if isinstance(self.watcher, InotifyWatcher) else "polling"
+
+    def rescan(self):
+        files: dict[str, FileStat] = {}
+        for root in self.roots: files.update(scan(root))
+        with self.lock:
+            self.files = files
+            self.generation += 1
+
+    def update(self, paths: set[str]):
+        with self.lock:
+            for pth in paths:
+                for key in [k for k in self.files if _under(k, pth)]:
+                    del self.files[key]
+                self.files.update(scan(Path(pth)))
+            self.generation += 1
+
+    def refresh(self):
+        while True:
+            changed: set[str]|None = self.watcher.wait(0)
+            if changed is None: self.rescan()
+            elif changed: self.update(changed)
+            else: return
+
+    def tree(self, root: Path) -> dict[str, FileStat]|None:
+        """
+        return файлы под root из таблицы, None - root не отслеживается
+        """
+        r: str = os.path.normpath(root)
+        if not any(_under(r, os.path.normpath(w)) for w in self.roots): return None
+        with self.lock:
+            return {k: v for k, v in self.files.items() if _under(k, r)}
+
+    def signature(self, root: Path) -> int|None:
+        files = self.tree(root)
+        if files is None: return None
+        return hash(tuple(sorted(files.items())))
+
+    def close(self):
+        self.watcher.close()
+
+_file_state: FileState|None = None
+
+def get_file_state() -> FileState|None:
+    return _file_state
+
+def set_file_state(state: FileState|None):
+    global _file_state
+    _file_state = state
@@ -0,0 +1,36 @@
+from collections import deque
+from pathlib import Path
+import json
+import logging
+
+from .ds import BuildRecord, HISTORY_PATH
+
+logger = logging.getLogger(__name__)
+
+# в историю попадают только самые долгие TU сборки, чтобы файл не рос с размером проекта
+HISTORY_TOP_TUS = 20
+
+def append_history(record: BuildRecord, pth: Path = HISTORY_PATH):
+    try:
+        pth.parent.mkdir(parents=True, exist_ok=True)
+        with open(pth, "a") as fd:
+            fd.write(json.dumps(record)+"\n")
+    except OSError as e:
+        logger.warning(f"не удалось дописать историю сборок '{pth}': {e}")
+
+def load_history(n: int|None = None, pth: Path = HISTORY_PATH) -> list[BuildRecord]:
+    """
+    return последние n записей (все, если n=None), от старых к новым
+    """
+    if not pth.exists(): return []
+    records: deque[BuildRecord] = deque(maxlen=n)
+    with open(pth) as fd:
+        for line in fd:
+            line = line.strip()
+            if not line: continue
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                # оборванная запись (сборку убили на записи) - пропускаем
+                continue
+    return list(records)
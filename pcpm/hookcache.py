@@ -0,0 +1,119 @@
+from pathlib import Path
+import glob
+import hashlib
+import json
+import logging
+import os
+import shutil
+
+from .ds import COMPILE_ARGS, BuildArgs, Config, HookSpec
+from .fswatch import ignored
+from .manifest import hash_file
+from .utils import get_compiler, get_compiler_id
+
+logger = logging.getLogger(__name__)
+
+HOOK_CACHE_VERSION = "1"
+
+def _glob(root: Path, patterns: list[str]) -> list[Path]:
+    found: set[Path] = set()
+    for pattern in patterns:
+        for m in glob.glob(str(root/pattern), recursive=True):
+            pth = Path(m)
+            if pth.is_file(): found.add(pth)
+    return sorted(found)
+
+def package_files(pkg_path: Path) -> list[Path]:
+    # то, что сборка сама кладет в папку пакета (build_sf_libs), в отпечаток не входит
+    return sorted(
+        Path(dirpath)/name
+        for dirpath, dirnames, filenames in os.walk(pkg_path)
+        for name in filenames
+        if not ignored(os.path.join(dirpath, name))
+    )
+
+def toolchain_id(config: Config) -> str:
+    """
+    компилятор и флаги компиляции с учетом профиля: build/hooks общий для всех профилей,
+    а хуки компилируют (build_sf_libs) с текущими флагами
+    """
+    cc: str|None = get_compiler()
+    return json.dumps([get_compiler_id(cc) if cc is not None else None, config.get("compilation_args", COMPILE_ARGS)])
+
+class HookCache:
+    """
+    мемоизация build-хука пакета, объявившего свои входы и выходы:
+        package.json: { "hook": { "inputs": ["src/**/*.c"], "outputs": ["pjim_gen/*.c"] } }
+        или main.py:  def spec(tmp_src, pkg_path, conf) -> HookSpec
+
+    inputs  - glob'ы от корня проекта,
+    outputs - glob'ы от tmp_src (сгенерированные файлы).
+
+    отпечаток = конфиг пакета + компилятор и флаги (toolchain_id) + файлы пакета + файлы inputs.
+    при совпадении хук не вызывается: выходы копируются обратно в tmp_src,
+    BuildArgs берутся из build/hooks/<pkg>/build_args.json (если все его objs на месте)
+    """
+    def __init__(self, root: Path):
+        self.root = root
+
+    def fingerprint(self, pkg: str, pkg_path: Path, conf: dict, spec: HookSpec, toolchain: str, project_root: Path = Path(".")) -> str:
+        h = hashlib.sha256()
+        h.update(HOOK_CACHE_VERSION.encode())
+        h.update(b"\0"+pkg.encode())
+        h.update(b"\0"+toolchain.encode())
+        h.update(b"\0"+json.dumps(conf, sort_keys=True, default=str).encode())
+        h.update(b"\0"+json.dumps(spec, sort_keys=True).encode())
+
+        for pth in package_files(pkg_path) + _glob(project_root, spec.get("inputs", [])):
+            h.update(b"\0"+str(pth).encode())
+            h.update(b":"+(hash_file(pth) or "-").encode())
+        return h.hexdigest()
+
+    def stored_fingerprint(self) -> str|None:
+        try:
+            with open(self.root/"fingerprint") as fd:
+                return fd.read().strip()
+        except OSError:
+            return None
+
+    def restore(self, fingerprint: str, tmp_src: Path) -> BuildArgs|None:
+        if self.stored_fingerprint() != fingerprint: return None
+        try:
+            with open(self.root/"build_args.json") as fd:
+                ba: BuildArgs = json.load(fd)
+        except (OSError, ValueError):
+            return None
+
+        outputs: Path = self.root/"outputs"
+        if outputs.exists():
+            shutil.copytree(outputs, tmp_src, dirs_exist_ok=True)
+        # объектники вне outputs (например, в папке пакета) могли удалить - тогда хук нужно запустить
+        if not all(os.path.exists(obj) for obj in ba.get("objs", [])): return None
+        return ba
+
+    def store(self, fingerprint: str, tmp_src: Path, spec: HookSpec, ba: BuildArgs):
+        if self.root.exists(): shutil.rmtree(self.root)
+        outputs: Path = self.root/"outputs"
+        outputs.mkdir(parents=True)
+        for pth in _glob(tmp_src, spec.get("outputs", [])):
+            dst = outputs/pth.relative_to(tmp_src)
+            dst.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copy2(pth, dst)
+        with open(self.root/"build_args.json", "w") as fd:
+            json.dump(ba, fd)
+        # отпечаток пишется последним - без него запись не считается готовой
+        with open(self.root/"fingerprint", "w") as fd:
+            fd.write(fingerprint)
+
+    def import_entry(self, fingerprint: str, outputs: Path|None, ba: BuildArgs):
+        """
+        запись, собранная не здесь (готовый артефакт с зеркала, см. pcpm/prebuilt.py)
+        """
+        if self.root.exists(): shutil.rmtree(self.root)
+        self.root.mkdir(parents=True)
+        if outputs is not None and outputs.exists():
+            shutil.copytree(outputs, self.root/"outputs")
+        with open(self.root/"build_args.json", "w") as fd:
+            json.dump(ba, fd)
+        with open(self.root/"fingerprint", "w") as fd:
+            fd.write(fingerprint)
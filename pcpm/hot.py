@@ -0,0 +1,181 @@
+from pathlib import Path
+import logging
+import os
+import re
+import shutil
+import sys
+
+from .ds import HOT_BIN_PATH
+from .utils import profile_path
+
+logger = logging.getLogger(__name__)
+
+# main пользователя в библиотеке не нужен: вместо него точка входа хоста
+HOT_ARGS = ["-fPIC", "-Dmain=pcpm_hot_user_main"]
+# сколько прошлых версий библиотеки оставлять (хост может держать открытой предыдущую)
+KEEP_VERSIONS = 2
+
+HOST_C = r'''// сгенерировано pcpm (pcpm build --hot), не редактировать
+#include <dlfcn.h>
+#include <signal.h>
+#include <stdio.h>
+#include <string.h>
+#include <sys/stat.h>
+#include <time.h>
+
+#ifdef __APPLE__
+#define PCPM_HOT_MTIME(st) ((st).st_mtimespec)
+#else
+#define PCPM_HOT_MTIME(st) ((st).st_mtim)
+#endif
+
+typedef void *(*pcpm_hot_load_fn)(void *state, int argc, char **argv);
+typedef int (*pcpm_hot_update_fn)(void *state);
+typedef void (*pcpm_hot_unload_fn)(void *state);
+
+struct pcpm_hot_api {
+    void *handle;
+    pcpm_hot_load_fn load;
+    pcpm_hot_update_fn update;
+    pcpm_hot_unload_fn unload;
+};
+
+static volatile sig_atomic_t pcpm_hot_stop = 0;
+
+static void pcpm_hot_on_signal(int sig) {
+    (void)sig;
+    pcpm_hot_stop = 1;
+}
+
+static int pcpm_hot_open(struct pcpm_hot_api *api, const char *pth) {
+    void *h = dlopen(pth, RTLD_NOW | RTLD_LOCAL);
+    if (!h) {
+        fprintf(stderr, "[pcpm hot]: %s\n", dlerror());
+        return 0;
+    }
+    *(void **)(&api->update) = dlsym(h, "pcpm_hot_update");
+    if (!api->update) {
+        fprintf(stderr, "[pcpm hot]: %s: нет pcpm_hot_update\n", pth);
+        dlclose(h);
+        return 0;
+    }
+    *(void **)(&api->load) = dlsym(h, "pcpm_hot_load");
+    *(void **)(&api->unload) = dlsym(h, "pcpm_hot_unload");
+    api->handle = h;
+    return 1;
+}
+
+static int pcpm_hot_current(char *buf, size_t n) {
+    FILE *fd = fopen("@CURRENT@", "r");
+    if (!fd) return 0;
+    int ok = fgets(buf, (int)n, fd) != NULL;
+    fclose(fd);
+    buf[strcspn(buf, "\r\n")] = '\0';
+    return ok && buf[0] != '\0';
+}
+
+int main(int argc, char **argv) {
+    struct pcpm_hot_api api = {0};
+    void *state = NULL;
+    char loaded[256] = "";
+    char next[256];
+    char pth[512];
+    struct stat st;
+    struct timespec seen = {0, 0};
+    struct timespec idle = {0, 100 * 1000 * 1000};
+
+    signal(SIGINT, pcpm_hot_on_signal);
+    signal(SIGTERM, pcpm_hot_on_signal);
+
+    while (!pcpm_hot_stop) {
+        // pcpm атомарно переписывает @CURRENT@ после каждой пересборки
+        if (stat("@CURRENT@", &st) == 0
+            && (PCPM_HOT_MTIME(st).tv_sec != seen.tv_sec || PCPM_HOT_MTIME(st).tv_nsec != seen.tv_nsec)) {
+            seen = PCPM_HOT_MTIME(st);
+            if (pcpm_hot_current(next, sizeof(next)) && strcmp(next, loaded) != 0) {
+                struct pcpm_hot_api fresh = {0};
+                snprintf(pth, sizeof(pth), "@DIR@/%s", next);
+                // новая версия открывается до выгрузки старой: если она битая, работаем дальше на старой
+                if (pcpm_hot_open(&fresh, pth)) {
+                    if (api.handle && api.unload) api.unload(state);
+                    if (fresh.load) state = fresh.load(state, argc, argv);
+                    if (api.handle) dlclose(api.handle);
+                    api = fresh;
+                    strcpy(loaded, next);
+                    fprintf(stderr, "[pcpm hot]: загружен %s\n", loaded);
+                }
+            }
+        }
+        if (!api.handle) {
+            nanosleep(&idle, NULL);
+            continue;
+        }
+        if (api.update(state) != 0) break;
+    }
+
+    if (api.handle) {
+        if (api.unload) api.unload(state);
+        dlclose(api.handle);
+    }
+    return 0;
+}
+'''
+
+def hot_supported() -> bool:
+    return not sys.platform.startswith("win")
+
+def lib_suffix() -> str:
+    return ".dylib" if sys.platform == "darwin" else ".so"
+
+def shared_args() -> list[str]:
+    # неразрешенные символы (код пакетов) библиотека берет из хоста
+    return ["-shared", "-undefined", "dynamic_lookup"] if sys.platform == "darwin" else ["-shared"]
+
+def host_args() -> list[str]:
+    # хост экспортирует свои символы (код пакетов) для библиотеки
+    return ["-rdynamic"] if sys.platform == "darwin" else ["-rdynamic", "-ldl"]
+
+def write_host(pth: Path) -> Path:
+    """
+    пишет исходник хоста, только если он изменился (чтобы не сбивать инкрементальную сборку)
+    """
+    # хост запускается из build/bin (см. run), пути к библиотекам - от нее
+    rel_dir: str = HOT_BIN_PATH.name
+    text: str = HOST_C.replace("@CURRENT@", f"{rel_dir}/current").replace("@DIR@", rel_dir)
+    if not pth.exists() or pth.read_text() != text:
+        pth.parent.mkdir(parents=True, exist_ok=True)
+        pth.write_text(text)
+    return pth
+
+def current_version() -> str|None:
+    try:
+        return (profile_path(HOT_BIN_PATH)/"current").read_text().strip() or None
+    except OSError:
+        return None
+
+def publish(lib: Path, target_name: str) -> str|None:
+    """
+    копирует свежую библиотеку под новым именем lib<target>.<N>.so (dlopen кэширует по пути,
+    поэтому каждой версии - свой файл) и атомарно переключает build/bin/hot/current
+    """
+    bin_path: Path = profile_path(HOT_BIN_PATH)
+    bin_path.mkdir(parents=True, exist_ok=True)
+    pattern = re.compile(rf"^lib{re.escape(target_name)}\.(\d+){re.escape(lib_suffix())}$")
+    versions: list[int] = sorted(
+        int(m.group(1)) for name in os.listdir(bin_path)
+        if (m := pattern.match(name)) is not None
+    )
+    version: int = (versions[-1] + 1) if versions else 1
+    name: str = f"lib{target_name}.{version}{lib_suffix()}"
+    try:
+        shutil.copy2(lib, bin_path/name)
+        tmp: Path = bin_path/"current.tmp"
+        tmp.write_text(name+"\n")
+        os.replace(tmp, bin_path/"current")
+    except OSError as e:
+        logger.error(f"не удалось опубликовать {name}: {e}")
+        return None
+
+    for old in versions[:max(0, len(versions) - (KEEP_VERSIONS-1))]:
+        (bin_path/f"lib{target_name}.{old}{lib_suffix()}").unlink(missing_ok=True)
+    return name
@@ -0,0 +1,68 @@
+from pathlib import Path
+import json
+import logging
+import os
+
+from .ds import MANIFEST_PATH, SRC_PATH, TMP_SRC_PATH
+from .manifest import BuildManifest
+from .utils import profile_path
+
+logger = logging.getLogger(__name__)
+
+def to_src_path(pth: str) -> str:
+    """
+    build/tmp_src/x.h -> src/x.h, если файл пришел из src (а не сгенерирован хуком)
+    """
+    try:
+        rel = Path(pth).relative_to(TMP_SRC_PATH)
+    except ValueError:
+        return pth
+    src = SRC_PATH/rel
+    return str(src) if src.exists() else pth
+
+def norm_path(pth: str) -> str:
+    """
+    пути из depfile относительные, из -ftime-trace - как их открыл компилятор;
+    приводим к относительным от корня проекта, где это возможно
+    """
+    if os.path.isabs(pth):
+        rel: str = os.path.relpath(pth)
+        if not rel.startswith(".."): return os.path.normpath(rel)
+    return os.path.normpath(pth)
+
+def load_include_graph(manifest_path: Path|None = None) -> dict[str, list[str]]:
+    """
+    граф включений последней сборки из манифеста (входы компиляций берутся из depfile'ов -MMD,
+    поэтому системных заголовков там нет). покрывает и TU проекта, и TU из build_sf_libs пакетов
+    return { "build/objs/main.o": ["build/tmp_src/main.c", "build/tmp_src/util.h", ...] } - исходник первым
+    """
+    if manifest_path is None: manifest_path = profile_path(MANIFEST_PATH)
+    if not manifest_path.exists(): return {}
+    manifest = BuildManifest(manifest_path)
+    graph: dict[str, list[str]] = {}
+    for obj, entry in manifest.entries.items():
+        if "-c" not in entry.get("cmd", []): continue
+        inputs: list[str] = [norm_path(p) for p in entry.get("inputs", {})]
+        if inputs: graph[obj] = inputs
+    return graph
+
+def load_time_trace(pth: Path) -> dict[str, float]:
+    """
+    разбирает `-ftime-trace` clang'а (obj.json рядом с объектником):
+    return { заголовок: секунды фронтенда }. события Source вложены друг в друга,
+    так что время включительное - вместе с заголовками, которые подключил этот
+    """
+    try:
+        with open(pth) as fd:
+            events: list[dict] = json.load(fd).get("traceEvents", [])
+    except (OSError, ValueError, AttributeError):
+        return {}
+
+    times: dict[str, float] = {}
+    for e in events:
+        if e.get("name") != "Source" or e.get("ph") != "X": continue
+        detail: str|None = (e.get("args") or {}).get("detail")
+        if not detail: continue
+        detail = norm_path(detail)
+        times[detail] = times.get(detail, 0.0) + e.get("dur", 0)/1e6
+    return times
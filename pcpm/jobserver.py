@@ -0,0 +1,185 @@
+from contextlib import contextmanager
+import logging
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+
+logger = logging.getLogger(__name__)
+
+TOKEN = b"+"
+
+class JobServer:
+    """
+    GNU make jobserver: общий пул токенов на всю сборку.
+    у каждого участника есть один неявный токен, остальные N-1 лежат в канале.
+    pcpm берет токен на каждую свою компиляцию, а make/cmake внутри хуков пакетов
+    получают тот же канал через MAKEFLAGS, так что суммарно выполняется не больше N задач.
+
+    mode = "fifo" - `--jobserver-auth=fifo:PATH` (make >= 4.4, переживает close_fds у subprocess)
+    mode = "pipe" - `--jobserver-auth=R,W` (старые make): subprocess по умолчанию закрывает
+                    дескрипторы, поэтому MAKEFLAGS в окружение не выставляется, хук передает
+                    их сам через jobserver_popen_args()
+    """
+    def __init__(self, jobs: int, mode: str = "fifo"):
+        self.jobs = max(1, jobs)
+        self.mode = mode
+        self.owner = True
+        self.lock = threading.Lock()
+        self.implicit_free = True
+        self.tmp_dir: str|None = None
+        self.fifo: str|None = None
+
+        if mode == "fifo":
+            self.tmp_dir = tempfile.mkdtemp(prefix="pcpm-js-")
+            self.fifo = os.path.join(self.tmp_dir, "fifo")
+            os.mkfifo(self.fifo, 0o600)
+            self.rfd = os.open(self.fifo, os.O_RDONLY | os.O_NONBLOCK)
+            self.wfd = os.open(self.fifo, os.O_WRONLY)
+            os.set_blocking(self.rfd, True)
+        else:
+            self.rfd, self.wfd = os.pipe()
+            os.set_inheritable(self.rfd, True)
+            os.set_inheritable(self.wfd, True)
+
+        if self.jobs > 1:
+            os.write(self.wfd, TOKEN*(self.jobs-1))
+
+    @classmethod
+    def from_environ(cls) -> "JobServer|None":
+        """
+        pcpm запущен из make - становимся клиентом его jobserver'а
+        """
+        flags: str = os.environ.get("MAKEFLAGS", "")
+        m = re.search(r"--jobserver-(?:auth|fds)=(\S+)", flags)
+        if m is None: return None
+        auth: str = m.group(1)
+
+        js = cls.__new__(cls)
+        js.owner = False
+        js.lock = threading.Lock()
+        js.implicit_free = True
+        js.tmp_dir = None
+        js.fifo = None
+        js.jobs = 0
+        try:
+            if auth.startswith("fifo:"):
+                js.mode = "fifo"
+                js.fifo = auth[len("fifo:"):]
+                js.rfd = os.open(js.fifo, os.O_RDONLY | os.O_NONBLOCK)
+                js.wfd = os.open(js.fifo, os.O_WRONLY)
+                os.set_blocking(js.rfd, True)
+            else:
+                js.mode = "pipe"
+                r, w = auth.split(",")
+                js.rfd, js.wfd = int(r), int(w)
+                os.fstat(js.rfd); os.fstat(js.wfd)
+        except (OSError, ValueError) as e:
+            logger.warning(f"jobserver из MAKEFLAGS недоступен: {e}")
+            return None
+        return js
+
+    def makeflags(self) -> str:
+        auth = f"fifo:{self.fifo}" if self.mode == "fifo" else f"{self.rfd},{self.wfd}"
+        return f" -j{self.jobs} --jobserver-auth={auth}" if self.jobs else f" --jobserver-auth={auth}"
+
+    def acquire(self) -> bytes|None:
+        """
+        return None - занят неявный токен, иначе прочитанный из канала токен
+        """
+        with self.lock:
+            if self.implicit_free:
+                self.implicit_free = False
+                return None
+        while True:
+            try:
+                token = os.read(self.rfd, 1)
+            except InterruptedError:
+                continue
+            if token: return token
+
+    def release(self, token: bytes|None):
+        if token is None:
+            with self.lock:
+                self.implicit_free = True
+            return
+        os.write(self.wfd, token)
+
+    def close(self):
+        if not self.owner: return
+        for fd in (self.rfd, self.wfd):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+        if self.tmp_dir is not None:
+            shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+_active: JobServer|None = None
+
+@contextmanager
+def jobserver_env(js: JobServer|None):
+    """
+    на время сборки выставляет MAKEFLAGS, чтобы хуки и их дочерние процессы
+    пользовались тем же пулом токенов. в режиме pipe - не выставляет: make, которому
+    subprocess закрыл дескрипторы, откатился бы на -j1 даже с явным -jN
+    """
+    global _active
+    prev_active, _active = _active, js
+    if js is None or not js.owner or js.mode == "pipe":
+        try:
+            yield
+        finally:
+            _active = prev_active
+        return
+    prev: str|None = os.environ.get("MAKEFLAGS")
+    os.environ["MAKEFLAGS"] = js.makeflags()
+    try:
+        yield
+    finally:
+        _active = prev_active
+        if prev is None:
+            os.environ.pop("MAKEFLAGS", None)
+        else:
+            os.environ["MAKEFLAGS"] = prev
+
+def jobserver_popen_args() -> dict:
+    """
+    для make/cmake из хука пакета: subprocess.run(["make"], **jobserver_popen_args()).
+    в режиме pipe - MAKEFLAGS и pass_fds с дескрипторами jobserver'а,
+    в режиме fifo (или без jobserver'а) - {}: MAKEFLAGS уже в окружении
+    """
+    js: JobServer|None = _active
+    if js is None or js.mode != "pipe": return {}
+    env: dict[str, str] = dict(os.environ)
+    if js.owner: env["MAKEFLAGS"] = js.makeflags()
+    return {"env": env, "pass_fds": (js.rfd, js.wfd)}
+
+def make_supports_fifo() -> bool:
+    make: str|None = shutil.which("make")
+    if make is None: return True
+    try:
+        out: str = subprocess.run([make, "--version"], capture_output=True, text=True).stdout
+    except OSError:
+        return True
+    m = re.search(r"GNU Make (\d+)\.(\d+)", out)
+    if m is None: return True
+    return (int(m.group(1)), int(m.group(2))) >= (4, 4)
+
+def make_jobserver(jobs: int, mode: str|bool = "auto") -> JobServer|None:
+    """
+    mode: "auto" (fifo, если make >= 4.4, иначе pipe), "fifo", "pipe", False - выключен
+    """
+    if mode is False or sys.platform.startswith("win"): return None
+    js = JobServer.from_environ()
+    if js is not None: return js
+    if mode == "auto":
+        mode = "fifo" if make_supports_fifo() else "pipe"
+    try:
+        return JobServer(jobs, "pipe" if mode == "pipe" else "fifo")
+    except OSError as e:
+        logger.warning(f"не удалось создать jobserver: {e}")
+        return None
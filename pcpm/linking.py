@@ -0,0 +1,131 @@
+from pathlib import Path
+import functools
+import logging
+import shutil
+import subprocess
+import sys
+
+from .ds import LIBS_PATH, MANIFEST_PATH, Config, LinkConfig, ProfileConfig
+from .manifest import BuildManifest
+from .utils import get_compiler_id, get_compiler_kind, get_linker, load_config, profile_path
+
+logger = logging.getLogger(__name__)
+
+# в порядке предпочтения для "fast_linker": "auto"
+FAST_LINKERS = ["mold", "lld"]
+# --gdb-index умеют только эти (GNU ld - нет)
+GDB_INDEX_LINKERS = {"mold", "lld", "gold"}
+
+def link_config(config: Config) -> LinkConfig:
+    return config.get("link", {})
+
+@functools.lru_cache(maxsize=None)
+def linker_accepts(ln: str, name: str) -> bool:
+    """
+    драйвер (gcc/clang) находит ld.<name>: пробная `-fuse-ld=<name> -Wl,--version`
+    """
+    try:
+        return subprocess.run(
+            [ln, f"-fuse-ld={name}", "-Wl,--version"],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        ).returncode == 0
+    except OSError:
+        return False
+
+def user_fuse_ld(config: Config) -> str|None:
+    for arg in config.get("linking_args", []):
+        if arg.startswith("-fuse-ld="): return arg[len("-fuse-ld="):]
+    return None
+
+def pick_fast_linker(ln: str, conf: LinkConfig) -> str|None:
+    wanted: str|bool = conf.get("fast_linker", "auto")
+    if wanted is False: return None
+    names: list[str] = FAST_LINKERS if wanted is True or wanted == "auto" else [str(wanted)]
+    for name in names:
+        if linker_accepts(ln, name): return name
+    if wanted not in (True, "auto"):
+        logger.warning(f"{ln}: линкер {wanted} не найден, линковка стандартным")
+    return None
+
+def link_overlay() -> ProfileConfig:
+    """
+    быстрый линкер через -fuse-ld (если его не задали в linking_args сами),
+    -gsplit-dwarf (отладочная информация остается в .dwo рядом с объектниками и не копируется
+    линкером в бинарник) и -Wl,--gdb-index (gdb не строит индекс при каждом запуске)
+    """
+    config: Config|None = load_config()
+    if config is None: return {}
+    ln: str|None = get_linker()
+    if ln is None or get_compiler_kind(ln) is None: return {}
+    conf: LinkConfig = link_config(config)
+
+    overlay: ProfileConfig = {"compilation_args": [], "linking_args": []}
+    used: str|None = user_fuse_ld(config)
+    if used is None:
+        used = pick_fast_linker(ln, conf)
+        if used is not None: overlay["linking_args"].append(f"-fuse-ld={used}")
+    if conf.get("split_dwarf", False):
+        if sys.platform == "darwin":
+            logger.warning("split_dwarf не поддерживается на macOS (там и так dSYM)")
+        else:
+            overlay["compilation_args"].append("-gsplit-dwarf")
+    if conf.get("gdb_index", False):
+        if used in GDB_INDEX_LINKERS:
+            overlay["linking_args"].append("-Wl,--gdb-index")
+        else:
+            logger.warning(f"--gdb-index умеют только {', '.join(sorted(GDB_INDEX_LINKERS))}, индекс не строится")
+    return overlay
+
+def get_archiver(ln: str) -> str|None:
+    """
+    gcc-ar/llvm-ar понимают LTO-объектники, обычный ar - запасной вариант
+    """
+    kind: str|None = get_compiler_kind(ln)
+    if kind is None: return None
+    for name in (["gcc-ar"] if kind == "gcc" else ["llvm-ar"])+["ar"]:
+        if shutil.which(name) is not None: return name
+    return None
+
+def whole_archive_args(archive: Path) -> list[str]:
+    # все объектники пакета, как и раньше, а не только те, на которые есть ссылки
+    if sys.platform == "darwin":
+        return [f"-Wl,-force_load,{archive}"]
+    return ["-Wl,--whole-archive", str(archive), "-Wl,--no-whole-archive"]
+
+def archive_package(pkg: str, objs: list[str]) -> list[str]|None:
+    """
+    объектники пакета -> build/[<профиль>/]libs/lib<pkg>.a, пересобирается только
+    при изменении объектников (по манифесту). готовые библиотеки (.a, .so) из objs
+    передаются как есть. return что передать линкеру вместо objs
+    """
+    config: Config|None = load_config()
+    if config is None: return None
+    rest: list[str] = [o for o in objs if Path(o).suffix != ".o"]
+    objs = [o for o in objs if Path(o).suffix == ".o"]
+    if not objs or not link_config(config).get("archives", True): return objs+rest
+    ln: str|None = get_linker()
+    if ln is None: return None
+    ar: str|None = get_archiver(ln)
+    if ar is None: return objs+rest
+
+    archive: Path = profile_path(LIBS_PATH)/f"lib{pkg}.a"
+    cmd: list[str] = [ar, "rcs", str(archive)]+objs
+    manifest: BuildManifest|None = BuildManifest(profile_path(MANIFEST_PATH)) if config.get("incremental", True) else None
+    ar_id: str = get_compiler_id(ar) if manifest is not None else ""
+    if manifest is not None and manifest.is_fresh(str(archive), cmd, ar_id):
+        return whole_archive_args(archive)+rest
+
+    archive.parent.mkdir(parents=True, exist_ok=True)
+    # ar r только добавляет и заменяет, удаленные объектники остались бы в архиве
+    archive.unlink(missing_ok=True)
+    result = subprocess.run(cmd)
+    if result.returncode != 0:
+        logger.error(f"{pkg}: не удалось собрать {archive}")
+        if manifest is not None:
+            manifest.forget(str(archive))
+            manifest.save()
+        return None
+    if manifest is not None:
+        manifest.record(str(archive), cmd, ar_id, objs)
+        manifest.save()
+    return whole_archive_args(archive)+rest
@@ -0,0 +1,160 @@
+from pathlib import Path
+import hashlib
+import json
+import logging
+import os
+import threading
+import uuid
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_VERSION = 1
+# несколько экземпляров манифеста в одной сборке (параллельные compile() и линковки) сохраняются по очереди
+_save_lock = threading.Lock()
+
+def hash_file(pth: Path|str) -> str|None:
+    h = hashlib.sha256()
+    try:
+        with open(pth, "rb") as fd:
+            for chunk in iter(lambda: fd.read(1 << 20), b""):
+                h.update(chunk)
+    except OSError:
+        return None
+    return h.hexdigest()
+
+def parse_depfile(pth: Path|str) -> list[str]|None:
+    """
+    разбирает depfile в формате make (`-MMD -MF`):
+        build/objs/main.o: build/tmp_src/main.c \\
+            build/tmp_src/util.h
+
+    return список зависимостей (без цели)
+    """
+    try:
+        with open(pth) as fd:
+            text = fd.read()
+    except OSError:
+        return None
+
+    text = text.replace("\\\n", " ")
+    deps: list[str] = []
+    for line in text.splitlines():
+        # фиктивные цели `header.h:` из -MP пропускаем
+        head, sep, tail = line.partition(": ")
+        if not sep:
+            if line.rstrip().endswith(":"): continue
+            head, sep, tail = line.partition(":")
+            if not sep: continue
+        token = ""
+        i = 0
+        while i < len(tail):
+            c = tail[i]
+            if c == "\\" and i+1 < len(tail) and tail[i+1] == " ":
+                token += " "
+                i += 2
+                continue
+            if c.isspace():
+                if token: deps.append(token)
+                token = ""
+            else:
+                token += c
+            i += 1
+        if token: deps.append(token)
+
+    return list(dict.fromkeys(deps))
+
+class BuildManifest:
+    """
+    манифест инкрементальной сборки:
+    {
+        "version": 1,
+        "files": { "path": [mtime_ns, size, sha256] },   - кэш хэшей по stat
+        "entries": { "build/objs/main.o": {
+            "cmd": [...],           - полная командная строка
+            "compiler": "...",      - идентичность компилятора
+            "inputs": { "path": sha256 }
+        }}
+    }
+    """
+    def __init__(self, pth: Path):
+        self.pth = pth
+        self.files: dict[str, list] = {}
+        self.entries: dict[str, dict] = {}
+        # свои изменения: при сохранении они накладываются на то, что успели сохранить другие
+        self.changed: set[str] = set()
+        self.lock = threading.RLock()
+        self.files, self.entries = self._read()
+
+    def _read(self) -> tuple[dict[str, list], dict[str, dict]]:
+        if not self.pth.exists(): return {}, {}
+        try:
+            with open(self.pth) as fd:
+                data = json.load(fd)
+        except (OSError, ValueError) as e:
+            logger.warning(f"манифест сборки '{self.pth}' поврежден, полная пересборка: {e}")
+            return {}, {}
+        if data.get("version") != MANIFEST_VERSION: return {}, {}
+        return data.get("files", {}), data.get("entries", {})
+
+    def save(self):
+        self.pth.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.pth.with_name(f".{uuid.uuid4().hex}.tmp")
+        with _save_lock, self.lock:
+            files, entries = self._read()
+            files.update(self.files)
+            for key in self.changed:
+                if key in self.entries: entries[key] = self.entries[key]
+                else: entries.pop(key, None)
+            self.files, self.entries = files, entries
+            self.changed.clear()
+            with open(tmp, "w") as fd:
+                json.dump({"version": MANIFEST_VERSION, "files": self.files, "entries": self.entries}, fd)
+            os.replace(tmp, self.pth)
+
+    def file_hash(self, pth: str) -> str|None:
+        try:
+            st = os.stat(pth)
+        except OSError:
+            with self.lock:
+                self.files.pop(pth, None)
+            return None
+
+        with self.lock:
+            cached = self.files.get(pth)
+        if cached is not None and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+            return cached[2]
+
+        digest = hash_file(pth)
+        if digest is None: return None
+        with self.lock:
+            self.files[pth] = [st.st_mtime_ns, st.st_size, digest]
+        return digest
+
+    def is_fresh(self, key: str, cmd: list[str], compiler: str) -> bool:
+        entry = self.entries.get(key)
+        if entry is None: return False
+        if not os.path.exists(key): return False
+        if entry.get("cmd") != cmd or entry.get("compiler") != compiler: return False
+
+        for pth, digest in entry.get("inputs", {}).items():
+            if self.file_hash(pth) != digest:
+                return False
+        return True
+
+    def record(self, key: str, cmd: list[str], compiler: str, inputs: list[str]):
+        hashes: dict[str, str] = {}
+        for pth in inputs:
+            digest = self.file_hash(pth)
+            if digest is None:
+                # вход пропал - запись не сохраняем, в следующий раз пересоберем
+                self.forget(key)
+                return
+            hashes[pth] = digest
+        with self.lock:
+            self.entries[key] = {"cmd": cmd, "compiler": compiler, "inputs": hashes}
+            self.changed.add(key)
+
+    def forget(self, key: str):
+        with self.lock:
+            self.entries.pop(key, None)
+            self.changed.add(key)
@@ -0,0 +1,259 @@
+from pathlib import Path
+import hashlib
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+import http.client
+import threading
+import time
+import uuid
+
+from .manifest import hash_file
+from .netpool import HTTPPool, get_http_pool
+
+logger = logging.getLogger(__name__)
+
+INDEX_NAME = "index.json"
+STATS_NAME = "stats.json"
+EWMA_ALPHA = 0.3
+FAILURE_COOLDOWN = 300
+
+def is_http(mirror: str) -> bool:
+    return mirror.startswith(("http", "https"))
+
+def make_index(mirror_dir: Path) -> dict:
+    """
+    index.json зеркала:
+    {
+        "packages": {
+            "pjim": { "size": 12345, "sha256": "..." }
+        },
+        "prebuilt": {                   - готовые артефакты (pcpm pack), prebuilt/<пакет>/<ключ>.tar.gz
+            "pjim": { "<ключ>": { "size": 123, "sha256": "..." } }
+        }
+    }
+    """
+    packages: dict[str, dict] = {}
+    for tarball in sorted(mirror_dir.glob("*.tar.gz")):
+        digest = hash_file(tarball)
+        if digest is None: continue
+        packages[tarball.name[:-len(".tar.gz")]] = {"size": tarball.stat().st_size, "sha256": digest}
+
+    prebuilt: dict[str, dict] = {}
+    for tarball in sorted(mirror_dir.glob("prebuilt/*/*.tar.gz")):
+        digest = hash_file(tarball)
+        if digest is None: continue
+        prebuilt.setdefault(tarball.parent.name, {})[tarball.name[:-len(".tar.gz")]] = {"size": tarball.stat().st_size, "sha256": digest}
+    index: dict = {"packages": packages}
+    if prebuilt: index["prebuilt"] = prebuilt
+    return index
+
+class MirrorIndexes:
+    """
+    индексы зеркал, каждый загружается лениво и один раз за установку.
+    индекс HTTP зеркала кэшируется в <config_dir>/mirrors/<sha1(url)>/
+    и перепроверяется условным запросом (If-None-Match / If-Modified-Since)
+    """
+    def __init__(
+        self,
+        mirrors: list[str],
+        cache_dir: Path|None,
+        timeout: float = 10,
+        pool: HTTPPool|None = None,
+        ranker: "MirrorRanker|None" = None
+    ):
+        self.mirrors = mirrors
+        self.cache_dir = cache_dir
+        self.timeout = timeout
+        self.pool = pool if pool is not None else get_http_pool()
+        self.ranker = ranker
+        self.lock = threading.Lock()
+        self.indexes: dict[str, dict|None] = {}
+
+    def _cache_path(self, mirror: str) -> Path|None:
+        if self.cache_dir is None: return None
+        return self.cache_dir / hashlib.sha1(mirror.encode()).hexdigest()
+
+    def _load_local(self, mirror: str) -> dict|None:
+        try:
+            with open(Path(mirror)/INDEX_NAME) as fd:
+                return json.load(fd)
+        except (OSError, ValueError):
+            return None
+
+    def _load_http(self, mirror: str) -> dict|None:
+        cache: Path|None = self._cache_path(mirror)
+        cached: dict|None = None
+        meta: dict = {}
+        if cache is not None and (cache/INDEX_NAME).exists():
+            try:
+                with open(cache/INDEX_NAME) as fd:
+                    cached = json.load(fd)
+                with open(cache/"meta.json") as fd:
+                    meta = json.load(fd)
+            except (OSError, ValueError):
+                cached, meta = None, {}
+
+        if self.ranker is not None:
+            self.ranker.ensure_probed()
+            # до мертвого зеркала не стучимся, пользуемся кэшем
+            if not self.ranker.healthy(mirror): return cached
+
+        headers: dict[str, str] = {}
+        if cached is not None:
+            if meta.get("etag"): headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"): headers["If-Modified-Since"] = meta["last_modified"]
+
+        try:
+            with self.pool.request(f"{mirror}/{INDEX_NAME}", headers, timeout=self.timeout) as response:
+                body: bytes = response.read()
+                if response.status == 304: return cached
+                if response.status >= 400:
+                    return cached if response.status >= 500 else None
+                index: dict = json.loads(body)
+                meta = {
+                    "etag": response.headers.get("ETag"),
+                    "last_modified": response.headers.get("Last-Modified"),
+                }
+        except (http.client.HTTPException, OSError, ValueError):
+            # зеркало недоступно - работаем по кэшу
+            return cached
+
+        if cache is not None:
+            cache.mkdir(parents=True, exist_ok=True)
+            for name, data in ((INDEX_NAME, index), ("meta.json", meta)):
+                tmp = cache/f".{uuid.uuid4().hex}.tmp"
+                with open(tmp, "w") as fd:
+                    json.dump(data, fd)
+                os.replace(tmp, cache/name)
+        return index
+
+    def get(self, mirror: str) -> dict|None:
+        with self.lock:
+            if mirror not in self.indexes:
+                self.indexes[mirror] = self._load_http(mirror) if is_http(mirror) else self._load_local(mirror)
+            return self.indexes[mirror]
+
+    def lookup(self, pkg: str) -> tuple[str, dict]|None:
+        """
+        return (зеркало, запись индекса) первого зеркала, где есть пакет
+        """
+        for m in self.mirrors:
+            index = self.get(m)
+            if index is None: continue
+            entry = index.get("packages", {}).get(pkg)
+            if entry is not None: return m, entry
+        return None
+
+    def has(self, mirror: str, pkg: str, digest: str) -> bool|None:
+        """
+        True/False - есть ли у зеркала именно этот архив, None - индекса нет
+        """
+        index = self.get(mirror)
+        if index is None: return None
+        entry = index.get("packages", {}).get(pkg)
+        return entry is not None and entry.get("sha256") == digest
+
+class MirrorRanker:
+    """
+    выбор зеркала: все HTTP зеркала опрашиваются параллельно (запрос index.json),
+    задержка и скорость скачивания копятся (EWMA) в <config_dir>/mirrors/stats.json.
+    для пакета зеркала сортируются по ожидаемому времени: задержка + размер / скорость,
+    недавно упавшие зеркала уходят в конец списка
+    """
+    def __init__(self, mirrors: list[str], stats_path: Path|None, timeout: float = 5, pool: HTTPPool|None = None):
+        self.mirrors = mirrors
+        self.stats_path = stats_path
+        self.timeout = timeout
+        self.pool = pool if pool is not None else get_http_pool()
+        self.lock = threading.Lock()
+        self.probe_lock = threading.Lock()
+        self.probed = False
+        self.stats: dict[str, dict] = self._load()
+
+    def _load(self) -> dict[str, dict]:
+        if self.stats_path is None: return {}
+        try:
+            with open(self.stats_path) as fd:
+                return json.load(fd)
+        except (OSError, ValueError):
+            return {}
+
+    def save(self):
+        if self.stats_path is None: return
+        self.stats_path.parent.mkdir(parents=True, exist_ok=True)
+        with self.lock:
+            tmp = self.stats_path.with_name(f".{uuid.uuid4().hex}.tmp")
+            with open(tmp, "w") as fd:
+                json.dump(self.stats, fd, indent=4)
+            os.replace(tmp, self.stats_path)
+
+    def _ewma(self, old: float|None, new: float) -> float:
+        return new if old is None else old*(1-EWMA_ALPHA) + new*EWMA_ALPHA
+
+    def record_latency(self, mirror: str, seconds: float):
+        with self.lock:
+            st = self.stats.setdefault(mirror, {})
+            st["latency"] = self._ewma(st.get("latency"), seconds)
+            st["failures"] = 0
+
+    def record_transfer(self, mirror: str, size: int, seconds: float):
+        if seconds <= 0 or size <= 0: return
+        with self.lock:
+            st = self.stats.setdefault(mirror, {})
+            st["throughput"] = self._ewma(st.get("throughput"), size/seconds)
+            st["failures"] = 0
+
+    def record_failure(self, mirror: str):
+        with self.lock:
+            st = self.stats.setdefault(mirror, {})
+            st["failures"] = st.get("failures", 0) + 1
+            st["last_failure"] = time.time()
+
+    def _probe_one(self, mirror: str):
+        t = time.perf_counter()
+        try:
+            with self.pool.request(f"{mirror}/{INDEX_NAME}", method="HEAD", timeout=self.timeout) as response:
+                response.read()
+                # любой ответ, кроме ошибок шлюза/перегрузки, значит что зеркало живо
+                if response.status in (502, 503, 504): raise http.client.HTTPException(f"HTTP {response.status}")
+        except (http.client.HTTPException, OSError):
+            self.record_failure(mirror)
+            return
+        self.record_latency(mirror, time.perf_counter() - t)
+
+    def probe(self):
+        """
+        параллельный опрос всех HTTP зеркал, соединения остаются в пуле
+        """
+        http_mirrors: list[str] = [m for m in self.mirrors if is_http(m)]
+        if not http_mirrors: return
+        with ThreadPoolExecutor(max_workers=len(http_mirrors)) as executor:
+            list(executor.map(self._probe_one, http_mirrors))
+        self.save()
+
+    def ensure_probed(self):
+        with self.probe_lock:
+            if self.probed: return
+            self.probed = True
+            self.probe()
+
+    def healthy(self, mirror: str) -> bool:
+        st = self.stats.get(mirror, {})
+        return st.get("failures", 0) == 0 or time.time() - st.get("last_failure", 0) > FAILURE_COOLDOWN
+
+    def expected_time(self, mirror: str, size: int) -> float:
+        if not is_http(mirror): return 0.0
+        st = self.stats.get(mirror, {})
+        latency: float = st.get("latency", self.timeout)
+        throughput: float|None = st.get("throughput")
+        return latency + (size/throughput if throughput else 0.0)
+
+    def order(self, mirrors: list[str], size: int = 0) -> list[str]:
+        self.ensure_probed()
+        with self.lock:
+            return sorted(
+                mirrors,
+                key=lambda m: (not self.healthy(m), self.expected_time(m, size))
+            )
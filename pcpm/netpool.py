@@ -0,0 +1,143 @@
+from urllib.parse import urlsplit, urljoin
+import http.client
+import logging
+import queue
+import threading
+
+logger = logging.getLogger(__name__)
+
+MAX_REDIRECTS = 5
+MAX_IDLE_PER_HOST = 8
+
+class PooledResponse:
+    """
+    ответ из пула: соединение возвращается в пул только после полного чтения тела
+    """
+    def __init__(self, pool: "HTTPPool", key: tuple, conn: http.client.HTTPConnection, response: http.client.HTTPResponse, url: str):
+        self.pool = pool
+        self.key = key
+        self.conn = conn
+        self.response = response
+        self.url = url
+        self.status: int = response.status
+        self.headers = response.headers
+        self._closed = False
+
+    def read(self, n: int = -1) -> bytes:
+        data = self.response.read() if n is None or n < 0 else self.response.read(n)
+        if (not data or n is None or n < 0) and self.response.isclosed():
+            self._release(reuse=not self.response.will_close)
+        return data
+
+    def _release(self, reuse: bool):
+        if self._closed: return
+        self._closed = True
+        if reuse:
+            self.pool._put(self.key, self.conn)
+        else:
+            self.conn.close()
+
+    def close(self):
+        if not self.response.isclosed():
+            # тело не дочитано - соединение переиспользовать нельзя
+            self.response.close()
+            self._release(reuse=False)
+        else:
+            self._release(reuse=not self.response.will_close)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class HTTPPool:
+    """
+    пул keep-alive соединений: одна очередь соединений на (схема, хост, порт),
+    общая для всех пакетов одной установки
+    """
+    def __init__(self, timeout: float = 30):
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.idle: dict[tuple, queue.LifoQueue] = {}
+
+    def _key(self, url: str) -> tuple:
+        parts = urlsplit(url)
+        port = parts.port or (443 if parts.scheme == "https" else 80)
+        return (parts.scheme, parts.hostname, port)
+
+    def _get(self, key: tuple, timeout: float) -> tuple[http.client.HTTPConnection, bool]:
+        with self.lock:
+            q = self.idle.setdefault(key, queue.LifoQueue())
+        try:
+            conn = q.get_nowait()
+            if conn.sock is not None: conn.sock.settimeout(timeout)
+            conn.timeout = timeout
+            return conn, True
+        except queue.Empty:
+            pass
+        scheme, host, port = key
+        if scheme == "https":
+            return http.client.HTTPSConnection(host, port, timeout=timeout), False
+        return http.client.HTTPConnection(host, port, timeout=timeout), False
+
+    def _put(self, key: tuple, conn: http.client.HTTPConnection):
+        with self.lock:
+            q = self.idle.setdefault(key, queue.LifoQueue())
+        if q.qsize() >= MAX_IDLE_PER_HOST:
+            conn.close()
+            return
+        q.put(conn)
+
+    def request(self, url: str, headers: dict[str, str]|None = None, method: str = "GET", timeout: float|None = None) -> PooledResponse:
+        """
+        отправляет запрос по переиспользуемому соединению, следует редиректам.
+        статус не проверяется - это делает вызывающий
+        """
+        if timeout is None: timeout = self.timeout
+        for _ in range(MAX_REDIRECTS+1):
+            key = self._key(url)
+            parts = urlsplit(url)
+            path = parts.path or "/"
+            if parts.query: path += "?"+parts.query
+
+            # переиспользованное соединение могло быть закрыто сервером - одна повторная попытка
+            for attempt in range(2):
+                conn, reused = self._get(key, timeout)
+                try:
+                    conn.request(method, path, headers=headers or {})
+                    response = conn.getresponse()
+                    break
+                except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                    conn.close()
+                    if not reused or attempt == 1: raise
+                except Exception:
+                    conn.close()
+                    raise
+
+            if response.status in (301, 302, 303, 307, 308) and response.getheader("Location"):
+                response.read()
+                if response.will_close: conn.close()
+                else: self._put(key, conn)
+                url = urljoin(url, response.getheader("Location"))
+                continue
+            return PooledResponse(self, key, conn, response, url)
+
+        raise http.client.HTTPException(f"слишком много редиректов: {url}")
+
+    def close(self):
+        with self.lock:
+            queues = list(self.idle.values())
+            self.idle = {}
+        for q in queues:
+            while not q.empty():
+                q.get_nowait().close()
+
+_pool: HTTPPool|None = None
+_pool_lock = threading.Lock()
+
+def get_http_pool() -> HTTPPool:
+    global _pool
+    with _pool_lock:
+        if _pool is None: _pool = HTTPPool()
+        return _pool
@@ -0,0 +1,166 @@
+from pathlib import Path
+import hashlib
+import json
+import logging
+import os
+import shutil
+import subprocess
+import threading
+import uuid
+
+logger = logging.getLogger(__name__)
+
+CACHE_VERSION = "1"
+DEFAULT_MAX_SIZE_MB = 5*1024
+
+class ObjectCache:
+    """
+    кэш объектных файлов в духе ccache, ключ - sha256 от:
+        препроцессированного исходника, идентичности компилятора, аргументов
+        (и рабочей директории при `-g`, т.к. она попадает в отладочную информацию)
+
+    локальное хранилище: <config_dir>/cache/objects/ab/abcdef....o
+    вторичное (например NFS): <secondary>/objects/ab/abcdef....o
+    """
+    def __init__(self, root: Path, max_size_mb: int = DEFAULT_MAX_SIZE_MB, secondary: Path|None = None):
+        self.root = root
+        self.max_size = max_size_mb * 1024 * 1024
+        self.secondary = secondary
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.secondary_hits = 0
+        self.misses = 0
+        self.stored = 0
+
+    def reset_stats(self):
+        with self.lock:
+            self.hits = self.secondary_hits = self.misses = self.stored = 0
+
+    def _obj_path(self, root: Path, key: str) -> Path:
+        return root / "objects" / key[:2] / f"{key}.o"
+
+    def make_key(self, cc: str, cc_id: str, args: list[str], c_file: Path, depfile: Path|None, dst: Path) -> str|None:
+        cmd: list[str] = [cc]+args+["-E", str(c_file)]
+        if depfile is not None:
+            cmd += ["-MMD", "-MF", str(depfile), "-MT", str(dst)]
+        try:
+            result = subprocess.run(cmd, capture_output=True)
+        except OSError:
+            return None
+        if result.returncode != 0: return None
+
+        h = hashlib.sha256()
+        h.update(CACHE_VERSION.encode())
+        h.update(b"\0"+cc_id.encode())
+        for arg in args:
+            h.update(b"\0"+arg.encode())
+        if any(arg.startswith("-g") for arg in args):
+            h.update(b"\0"+os.getcwd().encode())
+        h.update(b"\0")
+        h.update(result.stdout)
+        return h.hexdigest()
+
+    def get(self, key: str, dst: Path) -> bool:
+        local = self._obj_path(self.root, key)
+        if local.exists():
+            try:
+                shutil.copyfile(local, dst)
+                os.utime(local)
+                with self.lock: self.hits += 1
+                return True
+            except OSError:
+                pass
+
+        if self.secondary is not None:
+            remote = self._obj_path(self.secondary, key)
+            if remote.exists():
+                try:
+                    shutil.copyfile(remote, dst)
+                    with self.lock: self.secondary_hits += 1
+                except OSError:
+                    pass
+                else:
+                    # копия в локальном хранилище занимает место так же, как put
+                    self._store_local(key, dst)
+                    return True
+
+        with self.lock: self.misses += 1
+        return False
+
+    def _store_file(self, src: Path, dst: Path):
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        tmp = dst.with_name(f".{dst.name}.{uuid.uuid4().hex}.tmp")
+        shutil.copyfile(src, tmp)
+        os.replace(tmp, dst)
+
+    def _store_local(self, key: str, obj: Path):
+        try:
+            self._store_file(obj, self._obj_path(self.root, key))
+            with self.lock: self.stored += obj.stat().st_size
+        except OSError as e:
+            logger.warning(f"не удалось сохранить {obj} в кэш: {e}")
+
+    def put(self, key: str, obj: Path):
+        self._store_local(key, obj)
+
+        if self.secondary is not None:
+            try:
+                self._store_file(obj, self._obj_path(self.secondary, key))
+            except OSError as e:
+                logger.warning(f"не удалось сохранить {obj} во вторичный кэш: {e}")
+
+    def _load_size(self) -> int|None:
+        try:
+            with open(self.root/"stats.json") as fd:
+                return int(json.load(fd)["size"])
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _save_size(self, size: int):
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp = self.root/f".stats.{uuid.uuid4().hex}.tmp"
+        with open(tmp, "w") as fd:
+            json.dump({"size": size}, fd)
+        os.replace(tmp, self.root/"stats.json")
+
+    def cleanup(self):
+        """
+        LRU вытеснение: при превышении max_size удаляем самые давно использованные
+        объекты (по mtime, его обновляет get) пока не останется 90% лимита
+        """
+        size: int|None = self._load_size()
+        if size is not None:
+            size += self.stored
+            if size <= self.max_size:
+                self._save_size(size)
+                return
+
+        files: list[tuple[float, int, Path]] = []
+        for obj in (self.root/"objects").rglob("*.o"):
+            try:
+                st = obj.stat()
+            except OSError:
+                continue
+            files.append((st.st_mtime, st.st_size, obj))
+
+        size = sum(f[1] for f in files)
+        if size > self.max_size:
+            files.sort(key=lambda f: f[0])
+            limit = self.max_size * 0.9
+            for _, fsize, obj in files:
+                if size <= limit: break
+                try:
+                    os.remove(obj)
+                    size -= fsize
+                except OSError:
+                    pass
+        self._save_size(size)
+
+    def summary(self) -> str:
+        total = self.hits + self.secondary_hits + self.misses
+        rate = (self.hits + self.secondary_hits) / total * 100 if total else 0.0
+        return (
+            f"кэш объектов: попаданий {self.hits}"
+            f"{f' (+{self.secondary_hits} из вторичного)' if self.secondary is not None else ''}"
+            f", промахов {self.misses}, {rate:.0f}%"
+        )
@@ -0,0 +1,113 @@
+from pathlib import Path
+import hashlib
+import logging
+import re
+import shutil
+import subprocess
+import sys
+
+from .ds import PGO_PATH, Config, PgoConfig, ProfileConfig
+from .utils import get_compiler, get_compiler_id, get_compiler_kind, get_workers, load_config, profile_path
+
+logger = logging.getLogger(__name__)
+
+PROFDATA_NAME = "merged.profdata"
+
+def lto_overlay(lto: bool, jobs: int|None = None) -> ProfileConfig:
+    """
+    флаги LTO для компиляции и линковки, если LTO включен (--lto или "lto" в конфиге/профиле).
+    gcc: -flto=auto - под jobserver'ом pcpm (линковка идет внутри сборки) ltrans берет его токены,
+    иначе по числу ядер. clang: ThinLTO с -flto-jobs по числу воркеров
+    """
+    config: Config|None = load_config()
+    if config is None or not (lto or config.get("lto", False)): return {}
+    cc: str|None = get_compiler()
+    if cc is None: return {}
+    kind: str|None = get_compiler_kind(cc)
+    if kind == "gcc":
+        return {"compilation_args": ["-flto=auto"], "linking_args": ["-flto=auto"]}
+    if kind == "clang":
+        workers: int = jobs if jobs is not None and jobs > 0 else get_workers(config)
+        return {"compilation_args": ["-flto=thin"], "linking_args": ["-flto=thin", f"-flto-jobs={workers}"]}
+    logger.warning(f"{cc}: LTO поддерживается только для gcc и clang, сборка без него")
+    return {}
+
+def pgo_dir() -> Path:
+    # абсолютный путь: его видят и компилятор, и инструментированная цель, запущенная из build/bin
+    return profile_path(PGO_PATH).resolve()
+
+def pgo_gen_overlay(kind: str) -> ProfileConfig:
+    """
+    стадия 1: инструментированная сборка, профили пишутся в build/[<профиль>/]pgo/.
+    gcc кладет туда .gcda по пути объектника, поэтому обе стадии собираются в одно дерево
+    """
+    flag: str = f"-fprofile-generate={pgo_dir()}"
+    args: list[str] = [flag] if kind == "clang" else [flag, "-fprofile-update=prefer-atomic"]
+    return {"compilation_args": args, "linking_args": [flag]}
+
+def pgo_use_overlay(kind: str, digest: str) -> ProfileConfig:
+    """
+    стадия 3: сборка по профилю. данные профиля не видны ни манифесту, ни кэшу объектов
+    (их нет в depfile), поэтому их хэш идет в флаги: новое обучение - новая пересборка
+    """
+    if kind == "clang":
+        args: list[str] = [f"-fprofile-use={pgo_dir()/PROFDATA_NAME}", "-Wno-profile-instr-unprofiled"]
+    else:
+        args = [f"-fprofile-use={pgo_dir()}", "-fprofile-correction", "-Wno-missing-profile"]
+    return {"compilation_args": args+[f"-DPCPM_PGO_PROFILE={digest}"], "linking_args": args[:1]}
+
+def train_runs(conf: PgoConfig) -> list[list[str]]:
+    train = conf.get("train", [])
+    if train and all(isinstance(run, list) for run in train): return train
+    return [train]
+
+def reset_profiles():
+    shutil.rmtree(pgo_dir(), ignore_errors=True)
+    pgo_dir().mkdir(parents=True, exist_ok=True)
+
+def find_profdata(cc: str) -> list[str]|None:
+    """
+    llvm-profdata той же версии, что и clang (llvm-profdata-<N> в debian/ubuntu, xcrun на macOS)
+    """
+    candidates: list[str] = []
+    m = re.search(r"clang version (\d+)", get_compiler_id(cc))
+    if m is not None: candidates.append(f"llvm-profdata-{m.group(1)}")
+    candidates.append("llvm-profdata")
+    for name in candidates:
+        if shutil.which(name) is not None: return [name]
+    if sys.platform == "darwin" and shutil.which("xcrun") is not None:
+        return ["xcrun", "llvm-profdata"]
+    return None
+
+def merge_profiles(cc: str) -> bool:
+    """
+    clang: *.profraw обучающих запусков -> merged.profdata
+    """
+    raw: list[Path] = sorted(pgo_dir().glob("*.profraw"))
+    if not raw:
+        logger.error(f"обучающие запуски не оставили профилей в {pgo_dir()}")
+        return False
+    profdata: list[str]|None = find_profdata(cc)
+    if profdata is None:
+        logger.error("llvm-profdata не найден, он нужен для PGO с clang")
+        return False
+    cmd: list[str] = profdata+["merge", f"-output={pgo_dir()/PROFDATA_NAME}"]+[str(p) for p in raw]
+    if subprocess.run(cmd).returncode != 0:
+        logger.error("llvm-profdata merge не удался")
+        return False
+    return True
+
+def profile_digest(kind: str) -> str|None:
+    files: list[Path] = (
+        [pgo_dir()/PROFDATA_NAME] if kind == "clang"
+        else sorted(pgo_dir().rglob("*.gcda"))
+    )
+    files = [f for f in files if f.is_file()]
+    if not files:
+        logger.error(f"обучающие запуски не оставили профилей в {pgo_dir()}")
+        return None
+    h = hashlib.sha256()
+    for f in files:
+        h.update(f.name.encode())
+        h.update(f.read_bytes())
+    return h.hexdigest()[:16]
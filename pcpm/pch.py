@@ -0,0 +1,138 @@
+from pathlib import Path
+import logging
+import os
+
+from .ds import BUILD_PATH, PCH_PATH, PKGS_PATH, SRC_PATH, TMP_SRC_PATH, Config, PchConfig
+from .includes import load_include_graph
+from .utils import compile, get_compiler, get_compiler_kind
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MIN_TUS = 2
+
+def pch_config(config: Config) -> PchConfig|None:
+    conf: PchConfig|bool|None = config.get("pch")
+    if conf is None or conf is False: return None
+    if conf is True: return {}
+    if not conf.get("enabled", True): return None
+    return conf
+
+def package_of(pth: str) -> str|None:
+    parts = Path(pth).parts
+    if len(parts) >= 2 and parts[0] == PKGS_PATH.name: return parts[1]
+    return None
+
+def pick_package_header(deps: list[str]) -> tuple[str, str]|None:
+    """
+    deps TU в порядке включения (depfile): первый заголовок пакета - тот, что TU подключает сам,
+    следующие из того же пакета - вложенные. берется пакет с самым большим деревом заголовков
+    return (пакет, заголовок верхнего уровня)
+    """
+    top: dict[str, str] = {}
+    weight: dict[str, int] = {}
+    for dep in deps[1:]:
+        pkg: str|None = package_of(dep)
+        if pkg is None or not dep.endswith((".h", ".hpp", ".hh")): continue
+        top.setdefault(pkg, dep)
+        weight[pkg] = weight.get(pkg, 0) + 1
+    if not top: return None
+    pkg = max(weight, key=lambda p: (weight[p], p))
+    return pkg, top[pkg]
+
+def plan_pch(conf: PchConfig, dst_s: list[Path]) -> dict[int, tuple[str, Path]]:
+    """
+    return { индекс TU: (имя PCH, заголовок) }
+    prefix-заголовок из конфига идет во все TU, иначе - заголовок пакета, который TU подключал
+    в прошлой сборке (по манифесту), если его подключают хотя бы min_tus TU
+    """
+    if "header" in conf:
+        header = Path(conf["header"])
+        try:
+            # заголовок из src/ берется из build/tmp_src, как и сами TU
+            header = TMP_SRC_PATH/header.relative_to(SRC_PATH)
+        except ValueError:
+            pass
+        return {i: ("prefix", header) for i in range(len(dst_s))}
+
+    graph: dict[str, list[str]] = load_include_graph()
+    picks: dict[int, tuple[str, str]] = {}
+    for i, dst in enumerate(dst_s):
+        deps: list[str]|None = graph.get(str(dst))
+        if not deps: continue
+        pick = pick_package_header(deps)
+        if pick is not None: picks[i] = pick
+
+    counts: dict[tuple[str, str], int] = {}
+    for pick in picks.values(): counts[pick] = counts.get(pick, 0) + 1
+    min_tus: int = conf.get("min_tus", DEFAULT_MIN_TUS)
+    return {
+        i: (pkg, Path(header))
+        for i, (pkg, header) in picks.items()
+        if counts[(pkg, header)] >= min_tus
+    }
+
+def write_wrapper(name: str, header: Path, pch_root: Path) -> Path:
+    """
+    build/pch/.../<имя>/<заголовок>: обертка с #include настоящего заголовка.
+    gcc ищет <обертка>.gch рядом с ней, а при несовпадении флагов просто разбирает обертку
+    """
+    wrapper: Path = pch_root/name/header.name
+    wrapper.parent.mkdir(parents=True, exist_ok=True)
+    text: str = (
+        "// сгенерировано pcpm (precompiled header), не редактировать\n"
+        f'#include "{os.path.relpath(header, wrapper.parent).replace(os.sep, "/")}"\n'
+    )
+    if not wrapper.exists() or wrapper.read_text() != text:
+        wrapper.write_text(text)
+    return wrapper
+
+def pch_root(objs_path: Path) -> Path:
+    # для разных наборов флагов (обычная сборка, --hot) - свои PCH
+    return PCH_PATH/objs_path.relative_to(BUILD_PATH)
+
+def prepare_pch(config: Config, args: list[str], dst_s: list[Path], objs_path: Path) -> dict[int, list[str]]:
+    """
+    собирает PCH (теми же флагами, что и TU) и return { индекс TU: флаги подключения PCH }.
+    пересборку при изменении заголовков или флагов ведет манифест, как для обычных TU.
+    не вышло собрать PCH - TU компилируются без него
+    """
+    conf: PchConfig|None = pch_config(config)
+    if conf is None or not dst_s: return {}
+    cc: str|None = get_compiler()
+    if cc is None: return {}
+    # gcc: .gch рядом с оберткой (-include), clang: .pch (-include-pch)
+    kind: str|None = get_compiler_kind(cc)
+    if kind is None:
+        logger.info(f"{cc}: precompiled headers не поддерживаются, сборка без них")
+        return {}
+
+    plan: dict[int, tuple[str, Path]] = plan_pch(conf, dst_s)
+    if not plan: return {}
+
+    root: Path = pch_root(objs_path)
+    wrappers: dict[tuple[str, Path], Path] = {}
+    for name, header in set(plan.values()):
+        if not header.exists():
+            logger.warning(f"PCH: нет заголовка {header}")
+            continue
+        wrappers[(name, header)] = write_wrapper(name, header, root)
+    if not wrappers: return {}
+
+    order: list[tuple[str, Path]] = sorted(wrappers, key=str)
+    suffix: str = ".pch" if kind == "clang" else ".gch"
+    pch_files: list[Path] = [wrappers[k].with_name(wrappers[k].name+suffix) for k in order]
+    built: list[str]|None = compile([wrappers[k] for k in order], pch_files, args+["-x", "c-header"])
+    if built is None:
+        logger.warning("PCH не собраны, сборка без них")
+        return {}
+    logger.info(f"PCH: {', '.join(str(wrappers[k].relative_to(root)) for k in order)}")
+
+    out: dict[int, list[str]] = {}
+    for i, key in plan.items():
+        if key not in wrappers: continue
+        wrapper: Path = wrappers[key]
+        out[i] = (
+            ["-include-pch", str(wrapper.with_name(wrapper.name+suffix))] if kind == "clang"
+            else ["-include", str(wrapper)]
+        )
+    return out
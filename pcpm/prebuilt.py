@@ -0,0 +1,222 @@
+from pathlib import Path
+import hashlib
+import io
+import json
+import logging
+import os
+import shutil
+import tarfile
+import tempfile
+import uuid
+
+from .ds import COMPILE_ARGS, PKGS_MIRROR, PKGS_PATH, ROOT_PATH, BuildArgs, Config, HookSpec, LockEntry
+from .hookcache import HookCache, package_files
+from .manifest import hash_file
+from .mirror import MirrorIndexes, is_http
+from .utils import download, get_arch, get_compiler, get_compiler_id, get_config_dir, get_platform, load_config, load_lock
+
+logger = logging.getLogger(__name__)
+
+PREBUILT_VERSION = "2"
+PREBUILT_DIR = "prebuilt"
+# флаги, от которых зависит совместимость объектников (ABI, модель кода, LTO, санитайзеры)
+# и инструментирование (PGO, покрытие): иначе на первом этапе --pgo пакет выпал бы из профиля
+ABI_PREFIXES = (
+    "-m", "-fPIC", "-fpic", "-fPIE", "-fpie", "-fno-pic", "-fno-pie", "-fsanitize", "-flto", "-fshort-", "-fpack-struct",
+    "-fprofile-", "--coverage", "-ftest-coverage", "-pg",
+)
+# абсолютный путь проекта в BuildArgs артефакта
+ROOT_MARK = "@PCPM_ROOT@"
+
+def abi_flags(config: Config) -> list[str]:
+    return [a for a in config.get("compilation_args", COMPILE_ARGS) if a.startswith(ABI_PREFIXES)]
+
+def files_digest(pkg_path: Path) -> str:
+    """
+    содержимое pkgs/<pkg>: пакет, отредактированный на месте, уже не то, что архив из pcpm.lock
+    """
+    h = hashlib.sha256()
+    for pth in package_files(pkg_path):
+        h.update(pth.relative_to(pkg_path).as_posix().encode())
+        h.update(b":"+(hash_file(pth) or "-").encode()+b"\0")
+    return h.hexdigest()
+
+def eligible(spec: HookSpec|None) -> bool:
+    """
+    готовый артефакт годится только для хука, который не читает файлы проекта (inputs):
+    его результат зависит лишь от пакета, его конфига и компилятора
+    """
+    return spec is not None and not spec.get("inputs")
+
+def prebuilt_key(pkg: str, conf: dict, config: Config, lock: dict[str, LockEntry]|None = None) -> tuple[str, dict]|None:
+    """
+    return (ключ, его составляющие) или None, если архив пакета не зафиксирован в pcpm.lock.
+    ключ: хэш архива пакета, файлы pkgs/<pkg>, конфиг пакета, arch, platform, версия компилятора, ABI-флаги
+    """
+    entry: LockEntry|None = (lock if lock is not None else load_lock()).get(pkg)
+    if entry is None: return None
+    cc: str|None = get_compiler()
+    if cc is None: return None
+    meta: dict = {
+        "version": PREBUILT_VERSION,
+        "package": pkg,
+        "sha256": entry["sha256"],
+        "files": files_digest(PKGS_PATH/pkg),
+        "conf": conf,
+        "arch": get_arch(),
+        "platform": get_platform(),
+        # путь к компилятору у каждого свой, важна только версия
+        "compiler": get_compiler_id(cc).split(" | ")[-1],
+        "abi": abi_flags(config),
+    }
+    key: str = hashlib.sha256(json.dumps(meta, sort_keys=True, default=str).encode()).hexdigest()[:32]
+    return key, meta
+
+def local_path(key: str) -> Path|None:
+    config_dir: Path|None = get_config_dir()
+    if config_dir is None: return None
+    return config_dir/PREBUILT_DIR/f"{key}.tar.gz"
+
+def mirror_path(pkg: str, key: str) -> str:
+    return f"{PREBUILT_DIR}/{pkg}/{key}.tar.gz"
+
+def fetch_prebuilt(pkg: str, key: str, config: Config, indexes: MirrorIndexes|None = None) -> Path|None:
+    """
+    артефакт из локального кэша (<config_dir>/prebuilt) или с зеркала, в индексе которого он есть.
+    HTTP зеркала без индекса не опрашиваются: на каждый пакет был бы лишний 404
+    """
+    dst: Path|None = local_path(key)
+    if dst is None: return None
+    if dst.exists(): return dst
+
+    mirrors: list[str] = config.get("mirrors", []) + [PKGS_MIRROR]
+    if indexes is None:
+        config_dir: Path|None = get_config_dir()
+        indexes = MirrorIndexes(mirrors, config_dir/"mirrors" if config_dir is not None else None, config.get("mirror_timeout", 5))
+
+    for m in mirrors:
+        index: dict|None = indexes.get(m)
+        entry: dict|None = (index or {}).get(PREBUILT_DIR, {}).get(pkg, {}).get(key)
+        if entry is None and (is_http(m) or not (Path(m)/mirror_path(pkg, key)).exists()): continue
+
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        tmp: Path = dst.with_name(f".{uuid.uuid4().hex}.tmp")
+        if is_http(m):
+            if not download(f"{m}/{mirror_path(pkg, key)}", tmp): continue
+        else:
+            try:
+                shutil.copyfile(Path(m)/mirror_path(pkg, key), tmp)
+            except OSError:
+                continue
+        if entry is not None and hash_file(tmp) != entry.get("sha256"):
+            logger.warning(f"{pkg}: хэш готового артефакта с {m} не совпал с индексом")
+            tmp.unlink(missing_ok=True)
+            continue
+        os.replace(tmp, dst)
+        return dst
+    return None
+
+def _to_mark(args: list[str], root: str) -> list[str]:
+    return [a.replace(root, ROOT_MARK) for a in args]
+
+def _from_mark(args: list[str], root: str) -> list[str]:
+    return [a.replace(ROOT_MARK, root) for a in args]
+
+def restore_prebuilt(pkg: str, tarball: Path, hook_cache: HookCache, fingerprint: str, tmp_src: Path) -> BuildArgs|None:
+    """
+    раскладывает артефакт: объектники - на их места в проекте (pkgs/<pkg>/...),
+    выходы хука и BuildArgs - записью кэша хука с текущим отпечатком
+    """
+    root: str = str(ROOT_PATH.resolve())
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tmp = Path(tmp_dir)
+        try:
+            with tarfile.open(tarball, "r:gz") as tar:
+                tar.extractall(path=tmp, filter="data")
+            with open(tmp/"build_args.json") as fd:
+                ba: BuildArgs = json.load(fd)
+        except (OSError, ValueError, tarfile.TarError) as e:
+            logger.warning(f"{pkg}: готовый артефакт {tarball} поврежден: {e}")
+            tarball.unlink(missing_ok=True)
+            return None
+
+        ba = {k: _from_mark(v, root) for k, v in ba.items()}
+        objs: Path = tmp/"objs"
+        if objs.exists():
+            for pth in objs.rglob("*"):
+                if not pth.is_file(): continue
+                rel: Path = pth.relative_to(objs)
+                if not rel.is_relative_to(PKGS_PATH/pkg):
+                    logger.warning(f"{pkg}: {rel} вне pkgs/{pkg}, пропущен")
+                    continue
+                dst: Path = ROOT_PATH/rel
+                dst.parent.mkdir(parents=True, exist_ok=True)
+                shutil.copy2(pth, dst)
+        hook_cache.import_entry(fingerprint, tmp/"outputs", ba)
+    return hook_cache.restore(fingerprint, tmp_src)
+
+def try_prebuilt(pkg: str, conf: dict, spec: HookSpec, hook_cache: HookCache, fingerprint: str, tmp_src: Path) -> BuildArgs|None:
+    """
+    вместо запуска хука: подходящий готовый артефакт из локального кэша <config_dir>/prebuilt.
+    с зеркал их скачивает pcpm install (prefetch_prebuilt), сборка в сеть не ходит:
+    иначе офлайн или с медленным зеркалом каждый пакет ждал бы таймаута
+    """
+    config: Config|None = load_config()
+    if config is None or not config.get("prebuilt", True) or not eligible(spec): return None
+    found = prebuilt_key(pkg, conf, config)
+    if found is None: return None
+    key: str = found[0]
+    tarball: Path|None = local_path(key)
+    if tarball is None or not tarball.exists(): return None
+    ba: BuildArgs|None = restore_prebuilt(pkg, tarball, hook_cache, fingerprint, tmp_src)
+    if ba is not None: logger.info(f"{pkg}: готовый артефакт {key[:12]}, сборка из исходников не нужна")
+    return ba
+
+def pack_prebuilt(pkg: str, key: str, meta: dict, hook_cache: HookCache, out_dir: Path) -> Path|None:
+    """
+    артефакт из записи кэша хука и объектников из ее BuildArgs:
+    <out_dir>/prebuilt/<pkg>/<ключ>.tar.gz
+    """
+    root: str = str(ROOT_PATH.resolve())
+    try:
+        with open(hook_cache.root/"build_args.json") as fd:
+            ba: BuildArgs = json.load(fd)
+    except (OSError, ValueError):
+        logger.error(f"{pkg}: нет результата хука, сначала pcpm build")
+        return None
+
+    objs: list[Path] = []
+    for obj in ba.get("objs", []):
+        pth = Path(obj)
+        if pth.is_absolute():
+            try:
+                pth = pth.relative_to(root)
+            except ValueError:
+                logger.error(f"{pkg}: объектник {obj} вне проекта, артефакт не переносим")
+                return None
+        if not pth.is_relative_to(PKGS_PATH/pkg):
+            logger.error(f"{pkg}: объектник {obj} вне pkgs/{pkg}, артефакт не переносим")
+            return None
+        if not pth.is_file():
+            logger.error(f"{pkg}: нет объектника {obj}, сначала pcpm build")
+            return None
+        objs.append(pth)
+
+    dst: Path = out_dir/mirror_path(pkg, key)
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    tmp: Path = dst.with_name(f".{uuid.uuid4().hex}.tmp")
+    with tarfile.open(tmp, "w:gz") as tar:
+        data: bytes = json.dumps({k: _to_mark(v, root) for k, v in ba.items()}).encode()
+        _add_bytes(tar, "build_args.json", data)
+        _add_bytes(tar, "meta.json", json.dumps(meta, indent=4, default=str).encode())
+        if (hook_cache.root/"outputs").exists():
+            tar.add(hook_cache.root/"outputs", "outputs")
+        for pth in objs:
+            tar.add(pth, f"objs/{pth.as_posix()}")
+    os.replace(tmp, dst)
+    return dst
+
+def _add_bytes(tar: tarfile.TarFile, name: str, data: bytes):
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    tar.addfile(info, io.BytesIO(data))
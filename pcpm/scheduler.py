@@ -0,0 +1,363 @@
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable
+import json
+import logging
+import os
+import threading
+import time
+
+from .jobserver import JobServer
+from .trace import Tracer, get_tracer
+
+logger = logging.getLogger(__name__)
+
+EWMA_ALPHA = 0.5
+DEFAULT_CPU_COST = 1.0
+DEFAULT_LIGHT_COST = 0.1
+
+class BuildTimings:
+    """
+    телеметрия узлов из прошлых сборок:
+    {
+        "durations": { "build/tmp_src/main.c": 0.42, "hook:pjim": 0.1, "link": 0.3 },
+        "usage": { "build/tmp_src/main.c": { "rss": 120.5, "cpu": 0.4 } }   - пиковый RSS (MB) и CPU время (с)
+    }
+    """
+    def __init__(self, pth: Path|None):
+        self.pth = pth
+        self.lock = threading.Lock()
+        self.data: dict[str, float] = {}
+        self.usage: dict[str, dict[str, float]] = {}
+        if pth is not None and pth.exists():
+            try:
+                with open(pth) as fd:
+                    raw: dict = json.load(fd)
+                self.data = raw.get("durations", {})
+                self.usage = raw.get("usage", {})
+            except (OSError, ValueError, AttributeError):
+                self.data, self.usage = {}, {}
+
+    def get(self, key: str) -> float|None:
+        return self.data.get(key)
+
+    def get_rss(self, key: str) -> float|None:
+        u = self.usage.get(key)
+        return u.get("rss") if u is not None else None
+
+    def _ewma(self, old: float|None, new: float) -> float:
+        return new if old is None else old*(1-EWMA_ALPHA) + new*EWMA_ALPHA
+
+    def record(self, key: str, seconds: float):
+        with self.lock:
+            self.data[key] = self._ewma(self.data.get(key), seconds)
+
+    def record_usage(self, key: str, rss_mb: float, cpu: float):
+        with self.lock:
+            u = self.usage.setdefault(key, {})
+            # RSS берем по максимуму из последних, чтобы не недооценить тяжелый TU
+            u["rss"] = max(rss_mb, u.get("rss", 0.0)*(1-EWMA_ALPHA))
+            u["cpu"] = self._ewma(u.get("cpu"), cpu)
+
+    def save(self):
+        if self.pth is None: return
+        self.pth.parent.mkdir(parents=True, exist_ok=True)
+        with self.lock:
+            tmp = self.pth.with_suffix(".tmp")
+            with open(tmp, "w") as fd:
+                json.dump({"durations": self.data, "usage": self.usage}, fd, indent=4)
+            os.replace(tmp, self.pth)
+
+class Node:
+    """
+    узел графа сборки.
+    cpu=True  - занимает слот воркера (компиляция, линковка),
+    cpu=False - легкий узел (хуки пакетов, копирование ассетов), слот не занимает
+                и может сам ждать вложенные узлы (build_sf_libs внутри хука)
+    offload=True - cpu-узел, который можно выполнить на удаленном воркере (компиляция TU):
+                когда локальные слоты заняты, он занимает удаленный слот (node.remote)
+    job=True - легкий узел, который все равно держит токен jobserver'а (хук пакета):
+                make, запущенный из хука, работает на своем неявном токене, и его нужно оплатить
+    """
+    def __init__(self, name: str, fn: Callable[[], bool], deps: list[str]|None = None, key: str|None = None, cpu: bool = True, offload: bool = False, job: bool = False):
+        self.name = name
+        self.fn = fn
+        self.deps: list[str] = deps or []
+        self.key: str = key if key is not None else name
+        self.cpu = cpu
+        self.offload = offload
+        self.job = job
+        self.token: bytes|None = None
+        self.holding: bool = False
+        self.remote: bool = False
+        self.succs: list["Node"] = []
+        self.waiting: int = 0
+        self.started: bool = False
+        self.ok: bool|None = None
+        self.rss: float|None = None
+        self.reserved: float = 0.0
+        self.lane: int = 0
+        self.duration: float|None = None
+        self.done = threading.Event()
+
+_active: "Scheduler|None" = None
+_current = threading.local()
+
+def get_active_scheduler() -> "Scheduler|None":
+    return _active
+
+def in_remote_slot() -> bool:
+    """
+    текущий узел запущен в удаленном слоте: его работа должна уйти на воркер
+    """
+    node: Node|None = getattr(_current, "node", None)
+    return node is not None and node.remote
+
+def report_usage(rss_mb: float, cpu: float):
+    """
+    процесс, запущенный из узла (компилятор, линковщик), сообщает свой пиковый RSS и CPU время
+    """
+    node: Node|None = getattr(_current, "node", None)
+    sched: Scheduler|None = getattr(_current, "scheduler", None)
+    if node is None or sched is None: return
+    node.rss = max(node.rss or 0.0, rss_mb)
+    sched.timings.record_usage(node.key, rss_mb, cpu)
+
+class Scheduler:
+    """
+    единый DAG сборки: узел стартует как только готовы его входы,
+    из готовых cpu-узлов первым берется тот, у которого длиннее оставшийся
+    путь до конца графа (по длительностям из прошлых сборок).
+    при заданном memory_budget (MB) cpu-узел допускается, только если его
+    пиковый RSS из прошлых сборок помещается в остаток бюджета
+    (один узел запускается всегда, чтобы сборка не встала).
+    remote - слоты удаленных воркеров: в них идут offload-узлы, когда локальные слоты
+    заняты, без токена jobserver'а и без резерва памяти
+    """
+    def __init__(
+        self,
+        workers: int,
+        timings: BuildTimings|None = None,
+        jobserver: JobServer|None = None,
+        memory_budget: float|None = None,
+        remote: int = 0
+    ):
+        self.workers = max(1, workers)
+        self.remote = max(0, remote)
+        self.timings = timings if timings is not None else BuildTimings(None)
+        self.jobserver = jobserver
+        self.memory_budget = memory_budget
+        self.memory_used = 0.0
+        self.cond = threading.Condition()
+        self.nodes: dict[str, Node] = {}
+        self.ready: list[Node] = []
+        self.running_cpu = 0
+        self.running_remote = 0
+        self.outstanding = 0
+        self.failed = False
+        self._prio: dict[str, float] = {}
+        # дорожки трассы: 1..workers - слоты cpu-узлов, дальше - легкие узлы и удаленные слоты
+        self.free_lanes: dict[str, list[int]] = {"cpu": [], "light": [], "remote": []}
+        self.next_light_lane = self.workers + 1
+
+    def cost(self, node: Node) -> float:
+        t = self.timings.get(node.key)
+        if t is not None: return t
+        return DEFAULT_CPU_COST if node.cpu else DEFAULT_LIGHT_COST
+
+    def memory(self, node: Node) -> float:
+        rss = self.timings.get_rss(node.key)
+        if rss is not None: return rss
+        # неизвестный TU оцениваем средним по известным
+        known = [u["rss"] for u in self.timings.usage.values() if "rss" in u]
+        return sum(known)/len(known) if known else 0.0
+
+    def priority(self, node: Node) -> float:
+        p = self._prio.get(node.name)
+        if p is None:
+            p = self.cost(node) + max((self.priority(s) for s in node.succs), default=0.0)
+            self._prio[node.name] = p
+        return p
+
+    def add(self, node: Node) -> Node:
+        with self.cond:
+            if node.name in self.nodes:
+                raise ValueError(f"узел {node.name} уже есть в графе")
+            self.nodes[node.name] = node
+            self.outstanding += 1
+            self._prio.clear()
+            for d in node.deps:
+                dep = self.nodes.get(d)
+                if dep is None:
+                    raise ValueError(f"{node.name}: неизвестная зависимость {d}")
+                if dep.ok is None:
+                    dep.succs.append(node)
+                    node.waiting += 1
+                elif dep.ok is False:
+                    self._finish(node, False)
+                    return node
+            if node.waiting == 0:
+                self.ready.append(node)
+            self.cond.notify_all()
+        return node
+
+    def _finish(self, node: Node, ok: bool):
+        # вызывается под self.cond
+        node.ok = ok
+        self.outstanding -= 1
+        if not ok: self.failed = True
+        node.done.set()
+        for s in node.succs:
+            if s.ok is not None: continue
+            if not ok:
+                self._finish(s, False)
+                continue
+            s.waiting -= 1
+            if s.waiting == 0: self.ready.append(s)
+        self.cond.notify_all()
+
+    def _execute(self, node: Node):
+        # локальные cpu-узлы и хуки берут токен jobserver'а, общий с make внутри хуков
+        local_cpu: bool = node.cpu and not node.remote
+        if (local_cpu or node.job) and self.jobserver is not None:
+            node.token = self.jobserver.acquire()
+            node.holding = True
+        tracer: Tracer|None = get_tracer()
+        start: float = tracer.now() if tracer is not None else 0.0
+        t = time.perf_counter()
+        ok: bool = False
+        prev_node, prev_sched = getattr(_current, "node", None), getattr(_current, "scheduler", None)
+        _current.node, _current.scheduler = node, self
+        try:
+            ok = bool(node.fn())
+        except Exception as e:
+            logger.error(f"{node.name}: {e}")
+            ok = False
+        finally:
+            _current.node, _current.scheduler = prev_node, prev_sched
+            if node.holding and self.jobserver is not None:
+                self.jobserver.release(node.token)
+                node.holding = False
+        node.duration = time.perf_counter() - t
+        if ok: self.timings.record(node.key, node.duration)
+        if tracer is not None:
+            args: dict = {"ok": ok}
+            if node.rss is not None: args["rss_mb"] = round(node.rss, 1)
+            tracer.complete(node.name, node.name.split(":")[0], start, node.duration, node.lane, args)
+        with self.cond:
+            self._release_lane(node)
+            if node.remote:
+                self.running_remote -= 1
+            elif node.cpu:
+                self.running_cpu -= 1
+                self.memory_used -= node.reserved
+            self._finish(node, ok)
+
+    def _lane_kind(self, node: Node) -> str:
+        return "remote" if node.remote else "cpu" if node.cpu else "light"
+
+    def _take_lane(self, node: Node):
+        # под self.cond
+        kind: str = self._lane_kind(node)
+        free: list[int] = self.free_lanes[kind]
+        if free:
+            node.lane = min(free)
+            free.remove(node.lane)
+        elif kind == "cpu":
+            node.lane = self.running_cpu
+        else:
+            node.lane = self.next_light_lane
+            self.next_light_lane += 1
+        tracer: Tracer|None = get_tracer()
+        if tracer is not None:
+            name: str = {"cpu": "воркер", "remote": "удаленный", "light": "легкие"}[kind]
+            tracer.lane_name(node.lane, f"{name} {node.lane}" if kind == "cpu" else f"{name} {node.lane - self.workers}")
+
+    def _release_lane(self, node: Node):
+        # под self.cond
+        self.free_lanes[self._lane_kind(node)].append(node.lane)
+
+    def wait(self, nodes: list[Node]) -> bool:
+        # узел, ждущий вложенные узлы (build_sf_libs внутри хука), отдает им свой токен,
+        # иначе при -j1 они ждали бы его вечно
+        node: Node|None = getattr(_current, "node", None)
+        lend: bool = node is not None and node.holding and self.jobserver is not None
+        if lend:
+            self.jobserver.release(node.token)
+            node.holding = False
+        for n in nodes:
+            n.done.wait()
+        if lend:
+            node.token = self.jobserver.acquire()
+            node.holding = True
+        return all(n.ok for n in nodes)
+
+    def _pick(self) -> Node|None:
+        # под self.cond
+        for n in self.ready:
+            if not n.cpu:
+                self.ready.remove(n)
+                return n
+        cpu_ready = [n for n in self.ready if n.cpu]
+        if not cpu_ready: return None
+        if self.running_cpu < self.workers:
+            local = cpu_ready
+            if self.memory_budget is not None and self.running_cpu > 0:
+                free = self.memory_budget - self.memory_used
+                local = [n for n in local if self.memory(n) <= free]
+            if local:
+                best = max(local, key=self.priority)
+                self.ready.remove(best)
+                if self.memory_budget is not None:
+                    best.reserved = self.memory(best)
+                    self.memory_used += best.reserved
+                return best
+        if self.running_remote < self.remote:
+            offload = [n for n in cpu_ready if n.offload]
+            if offload:
+                best = max(offload, key=self.priority)
+                self.ready.remove(best)
+                best.remote = True
+                return best
+        return None
+
+    def run(self) -> bool:
+        global _active
+        prev, _active = _active, self
+        # легким узлам отдельный запас потоков, чтобы ожидающие хуки не забирали слоты компиляции
+        executor = ThreadPoolExecutor(max_workers=self.workers + self.remote + 8)
+        try:
+            with self.cond:
+                while self.outstanding > 0:
+                    if self.failed:
+                        # новых узлов не запускаем, не начатые считаем упавшими
+                        for n in list(self.ready):
+                            self.ready.remove(n)
+                            self._finish(n, False)
+                    node = None if self.failed else self._pick()
+                    if node is None:
+                        self.cond.wait()
+                        continue
+                    node.started = True
+                    if node.remote: self.running_remote += 1
+                    elif node.cpu: self.running_cpu += 1
+                    self._take_lane(node)
+                    executor.submit(self._execute, node)
+        finally:
+            executor.shutdown(wait=True)
+            _active = prev
+        return not self.failed
+
+def run_nodes(nodes: list[Node], workers: int, timings: BuildTimings|None = None, memory_budget: float|None = None) -> bool:
+    """
+    выполняет узлы в активном планировщике (если вызваны из узла идущей сборки)
+    или в отдельном
+    """
+    sched: Scheduler|None = get_active_scheduler()
+    if sched is not None:
+        for n in nodes: sched.add(n)
+        return sched.wait(nodes)
+
+    sched = Scheduler(workers, timings, memory_budget=memory_budget)
+    for n in nodes: sched.add(n)
+    return sched.run()
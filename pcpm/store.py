@@ -0,0 +1,164 @@
+from pathlib import Path
+import errno
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sys
+import threading
+import uuid
+
+from .manifest import hash_file
+
+logger = logging.getLogger(__name__)
+
+LINK_MODES = ["auto", "reflink", "hardlink", "symlink", "copy"]
+
+FICLONE = 0x40049409
+
+def _reflink(src: Path, dst: Path) -> bool:
+    if not sys.platform.startswith("linux"): return False
+    try:
+        import fcntl
+    except ImportError:
+        return False
+    try:
+        with open(src, "rb") as s, open(dst, "wb") as d:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+    except OSError:
+        if dst.exists(): os.remove(dst)
+        return False
+    shutil.copystat(src, dst)
+    return True
+
+def link_file(src: Path, dst: Path, mode: str) -> str:
+    """
+    материализует файл из хранилища: reflink/hardlink/symlink,
+    копирование только если ссылка невозможна (другая ФС и т.п.)
+
+    return каким способом файл оказался на месте
+    """
+    if mode in ("auto", "reflink") and _reflink(src, dst):
+        return "reflink"
+    if mode in ("auto", "reflink", "hardlink"):
+        try:
+            os.link(src, dst)
+            return "hardlink"
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP):
+                raise
+    if mode == "symlink":
+        try:
+            os.symlink(src.resolve(), dst)
+            return "symlink"
+        except OSError:
+            pass
+    shutil.copy2(src, dst)
+    return "copy"
+
+class PackageStore:
+    """
+    пользовательское content-addressed хранилище пакетов (рядом с шаблоном конфига):
+        <config_dir>/store/tarballs/<sha256>.tar.gz   - скачанные архивы
+        <config_dir>/store/trees/<sha256>/<pkg>/...   - распакованные деревья
+        <config_dir>/store/refs.json                  - { "pkg": sha256 } последняя скачанная версия
+    """
+    def __init__(self, root: Path):
+        self.root = root
+        self.tarballs = root/"tarballs"
+        self.trees = root/"trees"
+        self.tmp = root/"tmp"
+        self.lock = threading.Lock()
+        for d in (self.tarballs, self.trees, self.tmp):
+            d.mkdir(parents=True, exist_ok=True)
+
+    def tmp_path(self, suffix: str = "") -> Path:
+        return self.tmp/f"{uuid.uuid4().hex}{suffix}"
+
+    def part_path(self, url: str) -> Path:
+        """
+        стабильный путь недокачанного архива, чтобы докачка пережила перезапуск
+        """
+        return self.tmp/f"{hashlib.sha1(url.encode()).hexdigest()}.part"
+
+    def load_refs(self) -> dict[str, str]:
+        try:
+            with open(self.root/"refs.json") as fd:
+                return json.load(fd)
+        except (OSError, ValueError):
+            return {}
+
+    def get_ref(self, pkg: str) -> str|None:
+        return self.load_refs().get(pkg)
+
+    def set_ref(self, pkg: str, digest: str):
+        with self.lock:
+            refs = self.load_refs()
+            refs[pkg] = digest
+            tmp = self.tmp_path(".json")
+            with open(tmp, "w") as fd:
+                json.dump(refs, fd, indent=4)
+            os.replace(tmp, self.root/"refs.json")
+
+    def tarball_path(self, digest: str) -> Path:
+        return self.tarballs/f"{digest}.tar.gz"
+
+    def tree_path(self, digest: str) -> Path:
+        return self.trees/digest
+
+    def has_tree(self, digest: str, pkg: str) -> bool:
+        return (self.tree_path(digest)/pkg).is_dir()
+
+    def add_tarball(self, tmp_file: Path, digest: str|None = None) -> str|None:
+        """
+        переносит скачанный архив в хранилище, return sha256
+        """
+        if digest is None:
+            digest = hash_file(tmp_file)
+            if digest is None: return None
+        dst = self.tarball_path(digest)
+        if dst.exists():
+            os.remove(tmp_file)
+        else:
+            os.replace(tmp_file, dst)
+        return digest
+
+    def add_tree(self, digest: str, extracted: Path):
+        dst = self.tree_path(digest)
+        if dst.exists():
+            shutil.rmtree(extracted, ignore_errors=True)
+            return
+        try:
+            os.replace(extracted, dst)
+        except OSError:
+            # параллельная установка успела раньше
+            shutil.rmtree(extracted, ignore_errors=True)
+
+    def materialize(self, digest: str, pkg: str, dst: Path, mode: str = "auto") -> bool:
+        src = self.tree_path(digest)/pkg
+        if not src.is_dir():
+            logger.error(f"в хранилище нет дерева пакета {pkg} ({digest[:12]})")
+            return False
+
+        if dst.is_symlink() or dst.is_file():
+            os.remove(dst)
+        elif dst.exists():
+            shutil.rmtree(dst)
+
+        used: dict[str, int] = {}
+        for dirpath, dirnames, filenames in os.walk(src):
+            rel = Path(dirpath).relative_to(src)
+            (dst/rel).mkdir(parents=True, exist_ok=True)
+            for name in dirnames + filenames:
+                item = Path(dirpath)/name
+                if item.is_symlink():
+                    # относительные симлинки внутри пакета переносим как есть
+                    os.symlink(os.readlink(item), dst/rel/name)
+                    continue
+                if item.is_dir(): continue
+                how = link_file(item, dst/rel/name, mode)
+                used[how] = used.get(how, 0) + 1
+
+        logger.debug(f"{pkg}: {used}")
+        return True
@@ -0,0 +1,156 @@
+from pathlib import Path
+from xml.etree import ElementTree as ET
+import logging
+import os
+import re
+import shutil
+import signal
+import socket
+import subprocess
+import time
+
+from .ds import TESTS_BUILD_PATH, TESTS_PATH, Config, TestResult, TestsConfig
+from .scheduler import BuildTimings
+from .utils import get_bin_suffix, get_compiler_kind, profile_path
+
+logger = logging.getLogger(__name__)
+
+TEST_SUFFIXES = (".c", ".cc", ".cpp", ".cxx")
+DEFAULT_TIMEOUT = 60.0
+# код возврата "тест пропущен", как в automake
+SKIP_CODE = 77
+# символы, недопустимые в XML 1.0 (вывод тестов бывает бинарным)
+XML_INVALID = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]")
+
+def tests_config(config: Config) -> TestsConfig:
+    return config.get("tests", {})
+
+def tests_dir(config: Config) -> Path:
+    return Path(tests_config(config).get("dir", TESTS_PATH))
+
+def discover_tests(config: Config) -> list[Path]:
+    """
+    каждый исходник в tests/ (рекурсивно) - отдельный тест со своим main
+    """
+    root: Path = tests_dir(config)
+    if not root.is_dir(): return []
+    return sorted(p for p in root.rglob("*") if p.suffix in TEST_SUFFIXES and p.is_file())
+
+def test_name(config: Config, src: Path) -> str:
+    return src.relative_to(tests_dir(config)).with_suffix("").as_posix()
+
+def test_obj(config: Config, src: Path) -> Path:
+    return profile_path(TESTS_BUILD_PATH)/"objs"/f"{test_name(config, src)}.o"
+
+def test_bin(config: Config, src: Path) -> Path:
+    return profile_path(TESTS_BUILD_PATH)/"bin"/f"{test_name(config, src)}{get_bin_suffix()}"
+
+def parse_shard(shard: str) -> tuple[int, int]|None:
+    """
+    "i/n" -> (i, n), i от 1 до n
+    """
+    try:
+        i, n = (int(x) for x in shard.split("/"))
+    except ValueError:
+        return None
+    if n < 1 or not 1 <= i <= n: return None
+    return i, n
+
+def pick_shard(names: list[str], i: int, n: int) -> list[str]:
+    # только по именам: на разных машинах CI своя история длительностей, а шарды не должны пересекаться
+    return sorted(names)[i-1::n]
+
+def order_by_history(names: list[str], timings: BuildTimings) -> list[str]:
+    """
+    от самых долгих по прошлым запускам; новые тесты - в начало, их длительность неизвестна
+    """
+    known: list[float] = [t for t in (timings.get(n) for n in names) if t is not None]
+    unknown: float = max(known, default=0.0) + 1.0
+    return sorted(names, key=lambda n: (-(timings.get(n) or unknown), n))
+
+def get_nm(ln: str) -> str|None:
+    """
+    gcc-nm/llvm-nm понимают LTO-объектники, обычный nm - запасной вариант
+    """
+    kind: str|None = get_compiler_kind(ln)
+    for name in (["gcc-nm"] if kind == "gcc" else ["llvm-nm"] if kind == "clang" else [])+["nm"]:
+        if shutil.which(name) is not None: return name
+    return None
+
+def defines_main(obj: str, nm: str|None) -> bool:
+    if nm is None: return Path(obj).stem == "main"
+    try:
+        result = subprocess.run([nm, "-g", "--defined-only", obj], capture_output=True, text=True)
+    except OSError:
+        return Path(obj).stem == "main"
+    if result.returncode != 0: return Path(obj).stem == "main"
+    # macOS добавляет к символам C "_"
+    return any(line.split()[-1] in ("main", "_main") for line in result.stdout.splitlines() if line.split())
+
+def without_main(objs: list[str], ln: str) -> list[str]:
+    """
+    объектники проекта для линковки с тестом: все, кроме того, где определен main
+    """
+    nm: str|None = get_nm(ln)
+    return [o for o in objs if not defines_main(o, nm)]
+
+def _text(data: bytes|str|None) -> str:
+    if data is None: return ""
+    text: str = data if isinstance(data, str) else data.decode(errors="replace")
+    return XML_INVALID.sub("\ufffd", text)
+
+def run_test(name: str, exe: Path, cwd: Path, timeout: float) -> TestResult:
+    started: float = time.perf_counter()
+    try:
+        proc = subprocess.run(
+            [str(exe.resolve())], cwd=cwd, capture_output=True, timeout=timeout,
+            stdin=subprocess.DEVNULL, env={**os.environ, "PCPM_TEST": name}
+        )
+    except subprocess.TimeoutExpired as e:
+        return {
+            "name": name, "status": "timeout", "time": time.perf_counter() - started, "code": None,
+            "stdout": _text(e.stdout), "stderr": _text(e.stderr),
+        }
+    except OSError as e:
+        return {"name": name, "status": "failed", "time": 0.0, "code": None, "stdout": "", "stderr": str(e)}
+
+    status: str = "passed" if proc.returncode == 0 else "skipped" if proc.returncode == SKIP_CODE else "failed"
+    return {
+        "name": name, "status": status, "time": time.perf_counter() - started, "code": proc.returncode,
+        "stdout": _text(proc.stdout), "stderr": _text(proc.stderr),
+    }
+
+def describe(result: TestResult, timeout: float) -> str:
+    if result["status"] == "timeout": return f"не завершился за {timeout:g}с"
+    code: int|None = result["code"]
+    if code is not None and code < 0:
+        try:
+            return f"убит сигналом {signal.Signals(-code).name}"
+        except ValueError:
+            return f"убит сигналом {-code}"
+    return f"код возврата {code}"
+
+def write_junit(results: list[TestResult], suite: str, pth: Path, timeout: float):
+    """
+    JUnit XML: timeout и ненулевой код - <failure>, код 77 - <skipped>
+    """
+    failures: int = sum(r["status"] in ("failed", "timeout") for r in results)
+    skipped: int = sum(r["status"] == "skipped" for r in results)
+    root = ET.Element("testsuites", tests=str(len(results)), failures=str(failures), time=f"{sum(r['time'] for r in results):.3f}")
+    ts = ET.SubElement(
+        root, "testsuite", name=suite, tests=str(len(results)), failures=str(failures), errors="0",
+        skipped=str(skipped), time=f"{sum(r['time'] for r in results):.3f}",
+        timestamp=time.strftime("%Y-%m-%dT%H:%M:%S"), hostname=socket.gethostname()
+    )
+    for r in sorted(results, key=lambda r: r["name"]):
+        classname: str = ".".join([suite]+r["name"].split("/")[:-1])
+        case = ET.SubElement(ts, "testcase", classname=classname, name=r["name"].split("/")[-1], time=f"{r['time']:.3f}")
+        if r["status"] in ("failed", "timeout"):
+            ET.SubElement(case, "failure", message=describe(r, timeout), type=r["status"]).text = r["stderr"][-4096:] or None
+        elif r["status"] == "skipped":
+            ET.SubElement(case, "skipped")
+        if r["stdout"]: ET.SubElement(case, "system-out").text = r["stdout"]
+        if r["stderr"]: ET.SubElement(case, "system-err").text = r["stderr"]
+    pth.parent.mkdir(parents=True, exist_ok=True)
+    ET.indent(root)
+    ET.ElementTree(root).write(pth, encoding="utf-8", xml_declaration=True)
@@ -0,0 +1,84 @@
+from contextlib import contextmanager
+from pathlib import Path
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+class Tracer:
+    """
+    таймлайн сборки в формате Chrome trace (chrome://tracing, ui.perfetto.dev):
+    одна дорожка (tid) на слот воркера, легкие узлы (хуки, ассеты) - на своих дорожках
+    """
+    def __init__(self):
+        self.t0 = time.perf_counter()
+        self.pid = os.getpid()
+        self.lock = threading.Lock()
+        self.events: list[dict] = []
+        self.lanes: dict[int, str] = {}
+
+    def now(self) -> float:
+        return time.perf_counter() - self.t0
+
+    def lane_name(self, lane: int, name: str):
+        with self.lock:
+            self.lanes.setdefault(lane, name)
+
+    def complete(self, name: str, cat: str, start: float, dur: float, lane: int = 0, args: dict|None = None):
+        event: dict = {
+            "name": name, "cat": cat, "ph": "X",
+            "ts": round(start*1e6), "dur": round(dur*1e6),
+            "pid": self.pid, "tid": lane
+        }
+        if args: event["args"] = args
+        with self.lock:
+            self.events.append(event)
+
+    @contextmanager
+    def span(self, name: str, cat: str, lane: int = 0, args: dict|None = None):
+        start: float = self.now()
+        try:
+            yield
+        finally:
+            self.complete(name, cat, start, self.now() - start, lane, args)
+
+    def save(self, pth: Path) -> bool:
+        meta: list[dict] = [
+            {"name": "process_name", "ph": "M", "pid": self.pid, "tid": 0, "args": {"name": "pcpm build"}}
+        ] + [
+            {"name": "thread_name", "ph": "M", "pid": self.pid, "tid": lane, "args": {"name": name}}
+            for lane, name in sorted(self.lanes.items())
+        ]
+        try:
+            pth.parent.mkdir(parents=True, exist_ok=True)
+            with open(pth, "w") as fd:
+                json.dump({"traceEvents": meta + self.events, "displayTimeUnit": "ms"}, fd)
+        except OSError as e:
+            logger.error(f"не удалось записать трассу '{pth}': {e}")
+            return False
+        logger.info(f"трасса сборки: {pth}")
+        return True
+
+_tracer: Tracer|None = None
+
+def get_tracer() -> Tracer|None:
+    return _tracer
+
+def set_tracer(tracer: Tracer|None):
+    global _tracer
+    _tracer = tracer
+
+@contextmanager
+def span(name: str, cat: str, lane: int = 0, args: dict|None = None):
+    """
+    участок сборки в трассе, без активной трассы ничего не делает
+    """
+    tracer: Tracer|None = _tracer
+    if tracer is None:
+        yield
+        return
+    with tracer.span(name, cat, lane, args):
+        yield
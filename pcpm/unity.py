@@ -0,0 +1,96 @@
+from pathlib import Path
+import fnmatch
+import logging
+import os
+import re
+import statistics
+
+from .ds import SRC_PATH, TMP_SRC_PATH, UNITY_PATH, UnityConfig
+from .scheduler import BuildTimings
+
+logger = logging.getLogger(__name__)
+
+def is_excluded(src: Path, exclude: list[str]) -> bool:
+    """
+    exclude - glob'ы от src/ (build/tmp_src): "legacy/*.c", "gen_*.c"
+    """
+    try:
+        rel: str = src.relative_to(TMP_SRC_PATH).as_posix()
+    except ValueError:
+        rel = src.as_posix()
+    return any(fnmatch.fnmatch(rel, pattern) for pattern in exclude)
+
+def estimate_costs(srcs: list[Path], timings: BuildTimings) -> dict[Path, float]:
+    """
+    время компиляции TU из прошлых обычных сборок; для неизвестных - по размеру файла
+    со скоростью, посчитанной по известным
+    """
+    sizes: dict[Path, int] = {}
+    for src in srcs:
+        try:
+            sizes[src] = max(1, os.path.getsize(src))
+        except OSError:
+            sizes[src] = 1
+    known: dict[Path, float] = {src: t for src in srcs if (t := timings.get(str(src))) is not None}
+    rate: float = statistics.median(known[s]/sizes[s] for s in known) if known else 1e-6
+    return {src: known.get(src, sizes[src]*rate) for src in srcs}
+
+def plan_batches(srcs: list[Path], costs: dict[Path, float], n: int) -> list[list[Path]]:
+    """
+    LPT: самые дорогие TU первыми в наименее загруженную пачку.
+    внутри пачки порядок по пути, чтобы текст пачки не менялся от сборки к сборке
+    """
+    n = max(1, min(n, len(srcs)))
+    batches: list[list[Path]] = [[] for _ in range(n)]
+    loads: list[float] = [0.0]*n
+    for src in sorted(srcs, key=lambda s: (-costs[s], str(s))):
+        i: int = loads.index(min(loads))
+        batches[i].append(src)
+        loads[i] += costs[src]
+    return [sorted(b, key=str) for b in batches if b]
+
+def write_batches(batches: list[list[Path]]) -> list[Path]:
+    """
+    build/unity/unity_<i>.c из #include исходников: диагностика компилятора сама
+    указывает на исходный файл. файл переписывается, только если его текст изменился
+    """
+    UNITY_PATH.mkdir(parents=True, exist_ok=True)
+    out: list[Path] = []
+    for i, batch in enumerate(batches):
+        pth: Path = UNITY_PATH/f"unity_{i}.c"
+        text: str = "// сгенерировано pcpm (unity build), не редактировать\n" + "".join(
+            f'#include "{os.path.relpath(src, UNITY_PATH).replace(os.sep, "/")}"\n' for src in batch
+        )
+        if not pth.exists() or pth.read_text() != text:
+            pth.write_text(text)
+        out.append(pth)
+    for stale in UNITY_PATH.glob("unity_*.c"):
+        if stale not in out: stale.unlink()
+    return out
+
+# build/unity/../tmp_src/x.c - так компилятор называет файл, подключенный из пачки
+_TMP_SRC_RE = re.compile(
+    "(?:" + re.escape(f"{UNITY_PATH.as_posix()}/{Path(os.path.relpath(TMP_SRC_PATH, UNITY_PATH)).as_posix()}/")
+    + "|" + re.escape(TMP_SRC_PATH.as_posix()+"/") + r")([^\s:]+)"
+)
+
+def map_diagnostics(line: str) -> str:
+    """
+    ../tmp_src/x.c:3:1: error -> src/x.c:3:1: error (если файл пришел из src, а не от хука)
+    """
+    def repl(m: re.Match) -> str:
+        src: Path = SRC_PATH/m.group(1)
+        return str(src) if src.exists() else TMP_SRC_PATH.as_posix()+"/"+m.group(1)
+    return _TMP_SRC_RE.sub(repl, line)
+
+def unity_config(config: dict, force: bool = False) -> UnityConfig|None:
+    """
+    return настройки unity-сборки или None, если она выключена.
+    force - `pcpm build --unity`: включить даже без ключа в конфиге
+    """
+    conf: UnityConfig|bool|None = config.get("unity")
+    if conf is None or conf is False:
+        return {} if force else None
+    if conf is True: return {}
+    if not conf.get("enabled", True) and not force: return None
+    return conf
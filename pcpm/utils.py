@@ -1,10 +1,12 @@
-from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 import logging
 from types import ModuleType
+from typing import Callable
 import urllib.request
 import urllib.error
 import tarfile
+import http.client
+import hashlib
 import sys
 import importlib
 import importlib.util
@@ -13,8 +15,18 @@ import json
 import os
 import shutil
 import subprocess
-
-from .ds import COMPILERS, Config, PKGS_PATH, ROOT_PATH, PackageConfig, BIN_PATH
+import functools
+import copy
+from contextlib import contextmanager
+
+from .ds import COMPILERS, COMPILE_ARGS, CacheConfig, Config, PKGS_PATH, ROOT_PATH, PackageConfig, BIN_PATH, MANIFEST_PATH, LOCK_PATH, LockEntry, BUILD_PATH, PROFILE_PATHS, ProfileConfig, TMP_SRC_PATH, HOOKS_PATH, UNITY_PATH, PCH_PATH, BENCH_PATH
+from .manifest import BuildManifest, parse_depfile
+from .objcache import ObjectCache, DEFAULT_MAX_SIZE_MB
+from .store import PackageStore
+from .netpool import HTTPPool, get_http_pool
+from .scheduler import Node, in_remote_slot, run_nodes, report_usage
+from .dist import DistPool, can_offload, get_dist_pool
+from .fswatch import FileState, FileStat, get_file_state, scan
 
 logger = logging.getLogger(__name__)
 
@@ -31,11 +43,127 @@ def download(url: str, dest: str|Path) -> bool:
         # logger.error(f"ошибка при скачивание url: {str(url)}, dest: {str(dest)}: {e}")
         return False
     
+class _TeeReader:
+    """
+    file-like обертка над HTTP ответом: все прочитанные байты пишутся в `sink`
+    и хэшируются, чтобы архив можно было распаковывать прямо из потока
+    """
+    def __init__(self, raw, sink, h):
+        self.raw = raw
+        self.sink = sink
+        self.h = h
+
+    def read(self, n: int = -1) -> bytes:
+        data = self.raw.read(n) if n is not None and n >= 0 else self.raw.read()
+        if data:
+            self.sink.write(data)
+            self.h.update(data)
+        return data
+
+def download_stream(
+    url: str,
+    part: Path,
+    extract_to: Path|None = None,
+    retries: int = 3,
+    timeout: float = 30,
+    pool: HTTPPool|None = None
+) -> tuple[str, bool]|None:
+    """
+    качает `url` в `part`, считая sha256 на лету.
+    если загрузка идет с нуля и задан `extract_to` - архив распаковывается
+    из потока (`r|gz`) без повторного чтения с диска.
+    оборванная загрузка докачивается через HTTP Range (с If-Range по ETag/Last-Modified),
+    в т.ч. в следующем запуске - недокачанный `part` и `part.json` остаются на диске.
+    соединения берутся из общего keep-alive пула.
+
+    return (sha256, распакован ли архив) или None
+    """
+    if pool is None: pool = get_http_pool()
+    meta_pth: Path = part.with_name(part.name+".json")
+    part.parent.mkdir(parents=True, exist_ok=True)
+
+    for attempt in range(retries+1):
+        validator: str|None = None
+        if part.exists() and meta_pth.exists():
+            try:
+                with open(meta_pth) as fd:
+                    validator = json.load(fd).get("validator")
+            except (OSError, ValueError):
+                validator = None
+        if validator is None and part.exists():
+            os.remove(part)
+
+        offset: int = part.stat().st_size if part.exists() else 0
+        h = hashlib.sha256()
+        if offset > 0:
+            with open(part, "rb") as fd:
+                for chunk in iter(lambda: fd.read(1 << 20), b""):
+                    h.update(chunk)
+
+        headers: dict[str, str] = {}
+        if offset > 0 and validator is not None:
+            headers["Range"] = f"bytes={offset}-"
+            headers["If-Range"] = validator
+
+        streamed: bool = False
+        try:
+            with pool.request(url, headers, timeout=timeout) as response:
+                if response.status == 416:
+                    # Range за пределами файла - часть битая
+                    os.remove(part)
+                    continue
+                if response.status >= 400:
+                    if response.status < 500: break
+                    logger.warning(f"{url}: HTTP {response.status}")
+                    continue
+                if offset > 0 and response.status != 206:
+                    # сервер не умеет Range или файл поменялся - начинаем заново
+                    offset = 0
+                    h = hashlib.sha256()
+                validator = response.headers.get("ETag") or response.headers.get("Last-Modified")
+                with open(meta_pth, "w") as fd:
+                    json.dump({"url": url, "validator": validator}, fd)
+
+                with open(part, "ab" if offset > 0 else "wb") as sink:
+                    reader = _TeeReader(response, sink, h)
+                    if offset == 0 and extract_to is not None:
+                        # хэш еще не проверен: filter="data" не пускает пути за пределы extract_to
+                        with tarfile.open(fileobj=reader, mode="r|gz") as tar:
+                            tar.extractall(path=extract_to, filter="data")
+                        streamed = True
+                    # дочитываем хвост (паддинг tar) или весь файл при докачке
+                    for _ in iter(lambda: reader.read(1 << 20), b""):
+                        pass
+
+            if meta_pth.exists(): os.remove(meta_pth)
+            return h.hexdigest(), streamed
+        except (http.client.HTTPException, tarfile.TarError, EOFError, OSError) as e:
+            if extract_to is not None and Path(extract_to).exists():
+                shutil.rmtree(extract_to, ignore_errors=True)
+            logger.warning(f"загрузка {url} прервана ({part.stat().st_size if part.exists() else 0} байт): {e}")
+
+    return None
+
 def untar(src: Path|str, dest: Path|str):
     with tarfile.open(src, "r:gz") as tar:
-        tar.extractall(path=dest, filter="fully_trusted")
+        tar.extractall(path=dest, filter="data")
+
+# модули пакетов, загруженные демоном сборки: перезагружаются, только если файлы пакета изменились
+_module_cache: dict[str, tuple[int, ModuleType]] = {}
 
 def get_module(p: str) -> ModuleType|None:
+    state: FileState|None = get_file_state()
+    signature: int|None = state.signature(PKGS_PATH/p) if state is not None else None
+    cached = _module_cache.get(p)
+    if signature is not None and cached is not None and cached[0] == signature:
+        return cached[1]
+
+    main_mod: ModuleType|None = _load_module(p)
+    if signature is not None and main_mod is not None:
+        _module_cache[p] = (signature, main_mod)
+    return main_mod
+
+def _load_module(p: str) -> ModuleType|None:
     try:
         PKG_DIR = PKGS_PATH / p
 
@@ -97,17 +225,107 @@ def check_config(root: Path = Path(".")) -> bool:
         return False
     return True
     
+# разобранные config.json по (путь, mtime_ns, size): конфиг читается из build, build_src,
+# compile, get_compiler, get_linker, а демон сборки держит его между сборками
+_config_cache: dict[str, tuple[FileStat, Config]] = {}
+
 def load_config(root: Path = Path(".")) -> Config|None:
     if not check_config(root):
         return None
-    
-    with open(root/"config.json") as fd:
-        return json.loads(fd.read()) 
+
+    pth: Path = root/"config.json"
+    st = os.stat(pth)
+    cached = _config_cache.get(str(pth))
+    if cached is not None and cached[0] == (st.st_mtime_ns, st.st_size):
+        return apply_profile(copy.deepcopy(cached[1]))
+
+    with open(pth) as fd:
+        config: Config = json.loads(fd.read())
+    _config_cache[str(pth)] = ((st.st_mtime_ns, st.st_size), config)
+    return apply_profile(copy.deepcopy(config))
+
+# активный профиль сборки (pcpm build --profile): флаги профиля подмешиваются в load_config,
+# объектники, бинарники и манифест лежат в build/<профиль>/
+_profile: str|None = None
+# флаги, которые pcpm добавляет сам на время сборки (--lto, стадии --pgo), поверх профиля
+_overlays: list[ProfileConfig] = []
+
+def get_profile() -> str|None:
+    return _profile
+
+def set_profile(name: str|None) -> bool:
+    global _profile
+    if name is None:
+        _profile = None
+        return True
+    _profile = None
+    config: Config|None = load_config()
+    if config is None: return False
+    profiles: dict[str, ProfileConfig] = config.get("profiles", {})
+    if name not in profiles:
+        logger.error(f"профиль '{name}' не найден в config.json, есть: {', '.join(profiles) or 'нет профилей'}")
+        return False
+    if Path(name).name != name or name in {p.relative_to(BUILD_PATH).parts[0] for p in PROFILE_PATHS+[TMP_SRC_PATH, HOOKS_PATH, UNITY_PATH, PCH_PATH, BENCH_PATH]}:
+        logger.error(f"недопустимое имя профиля '{name}'")
+        return False
+    _profile = name
+    return True
+
+@contextmanager
+def config_overlay(overlay: ProfileConfig):
+    _overlays.append(overlay)
+    try:
+        yield
+    finally:
+        _overlays.remove(overlay)
+
+def _merge_profile(config: Config, profile: ProfileConfig):
+    for key, value in profile.items():
+        if key == "compilation_args":
+            config["compilation_args"] = config.get("compilation_args", COMPILE_ARGS) + value
+        elif key == "linking_args":
+            config["linking_args"] = config.get("linking_args", []) + value
+        else:
+            config[key] = value
+
+def apply_profile(config: Config) -> Config:
+    if _profile is not None:
+        profile: ProfileConfig|None = config.get("profiles", {}).get(_profile)
+        if profile is not None: _merge_profile(config, profile)
+    for overlay in _overlays:
+        _merge_profile(config, overlay)
+    return config
+
+def profile_path(pth: Path) -> Path:
+    """
+    build/objs -> build/<профиль>/objs для путей из PROFILE_PATHS (и вложенных в них), остальные как есть
+    """
+    if _profile is None: return pth
+    for base in PROFILE_PATHS:
+        if pth == base or base in pth.parents:
+            return BUILD_PATH/_profile/pth.relative_to(BUILD_PATH)
+    return pth
 
 def write_config(config: Config, pth: Path = ROOT_PATH/"config.json"):
     with open(pth, "+w") as fd:
         fd.write(json.dumps(config, indent=4))
 
+def load_lock(pth: Path = LOCK_PATH) -> dict[str, LockEntry]:
+    """
+    pcpm.lock: { "version": 1, "packages": { "pjim": { "sha256": "...", "size": 123 } } }
+    """
+    if not pth.exists(): return {}
+    try:
+        with open(pth) as fd:
+            return json.load(fd).get("packages", {})
+    except (OSError, ValueError) as e:
+        logger.warning(f"'{pth}' поврежден: {e}")
+        return {}
+
+def write_lock(packages: dict[str, LockEntry], pth: Path = LOCK_PATH):
+    with open(pth, "+w") as fd:
+        fd.write(json.dumps({"version": 1, "packages": dict(sorted(packages.items()))}, indent=4))
+
 def check_cmd(cmd: str) -> bool:
     return shutil.which(cmd) is not None
 
@@ -309,7 +527,7 @@ def create_lib_symlink(src_name: str, dst_name: str):
     if config is None: return None
 
     if not "origin" in config: return
-    libs_dir = BIN_PATH / config["origin"]
+    libs_dir = profile_path(BIN_PATH) / config["origin"]
 
     target_name = src_name  
     soname = dst_name
@@ -321,25 +539,180 @@ def create_lib_symlink(src_name: str, dst_name: str):
 
     os.symlink(target_name, link_path)
 
+@functools.lru_cache(maxsize=None)
+def get_compiler_id(cc: str) -> str:
+    """
+    идентичность компилятора для манифеста сборки: путь + первая строка `--version`
+    """
+    ident: list[str] = [cc]
+    cc_path = shutil.which(cc)
+    if cc_path is not None:
+        ident.append(str(Path(cc_path).resolve()))
+    try:
+        result = subprocess.run([cc, "--version"], capture_output=True, text=True)
+        if result.stdout:
+            ident.append(result.stdout.splitlines()[0])
+    except OSError:
+        pass
+    return " | ".join(ident)
+
+def get_compiler_kind(cc: str) -> str|None:
+    """
+    семейство компилятора по `--version`: "clang", "gcc" или None (cl, tcc, ...)
+    """
+    ident: str = get_compiler_id(cc).lower()
+    if "clang" in ident: return "clang"
+    if "gcc" in ident or "free software foundation" in ident: return "gcc"
+    return None
+
+def supports_depfiles(cc: str) -> bool:
+    return Path(cc).stem.lower() != "cl"
+
+_object_cache: ObjectCache|None = None
+_object_cache_conf: CacheConfig|None = None
+
+def get_object_cache(config: Config) -> ObjectCache|None:
+    global _object_cache, _object_cache_conf
+    cache_conf: CacheConfig|None = config.get("cache")
+    if cache_conf is None or not cache_conf.get("enabled", True):
+        return None
+    if _object_cache is None or _object_cache_conf != cache_conf:
+        _object_cache_conf = cache_conf
+        config_dir: Path|None = get_config_dir()
+        if config_dir is None: return None
+        _object_cache = ObjectCache(
+            config_dir/"cache",
+            cache_conf.get("max_size", DEFAULT_MAX_SIZE_MB),
+            Path(cache_conf["secondary"]) if "secondary" in cache_conf else None
+        )
+    return _object_cache
+
+def run_measured(cmd: list[str], map_stderr: Callable[[str], str]|None = None) -> int:
+    """
+    запускает процесс и сообщает планировщику его пиковый RSS и CPU время (os.wait4).
+    без wait4 (windows) - обычный subprocess.run без телеметрии.
+    map_stderr - переписывает строки stderr (пути в диагностике) перед выводом
+    return код возврата
+    """
+    stderr = subprocess.PIPE if map_stderr is not None else None
+    if not hasattr(os, "wait4"):
+        result = subprocess.run(cmd, text=True, stderr=stderr)
+        if map_stderr is not None and result.stderr:
+            sys.stderr.write("".join(map_stderr(line) for line in result.stderr.splitlines(keepends=True)))
+        return result.returncode
+
+    proc = subprocess.Popen(cmd, close_fds=False, stderr=stderr, text=map_stderr is not None)
+    if map_stderr is not None and proc.stderr is not None:
+        for line in proc.stderr:
+            sys.stderr.write(map_stderr(line))
+        proc.stderr.close()
+    while True:
+        try:
+            _, status, ru = os.wait4(proc.pid, 0)
+            break
+        except InterruptedError:
+            continue
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    # ru_maxrss: KB на linux, байты на macOS
+    rss_mb: float = ru.ru_maxrss / (1024*1024 if sys.platform == "darwin" else 1024)
+    report_usage(rss_mb, ru.ru_utime + ru.ru_stime)
+    return proc.returncode
+
+def get_memory_budget(config: Config) -> float|None:
+    """
+    memory_budget: MB или "auto" (80% физической памяти), по умолчанию без ограничения
+    """
+    budget = config.get("memory_budget")
+    if budget is None or budget is False: return None
+    if budget == "auto":
+        try:
+            total: int = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+        except (ValueError, OSError, AttributeError):
+            logger.warning("не удалось определить объем памяти, memory_budget не применяется")
+            return None
+        return total / (1024*1024) * 0.8
+    return float(budget)
+
 # @TODO compile - хуйня переделать 
 def _compile_one(
     c_file: Path,
     dst: Path,
     cc: str,
     args: list[str],
+    depfile: Path|None = None,
+    cache: ObjectCache|None = None,
+    cc_id: str = "",
+    map_stderr: Callable[[str], str]|None = None,
+    remote: DistPool|None = None,
 ) -> str|None:
-    cmd: list[str] = [cc]+args+["-c", str(c_file), "-o", str(dst)]
-    
-    result = subprocess.run(cmd, text=True)
-    if result.returncode != 0:
+    key: str|None = None
+    if cache is not None:
+        key = cache.make_key(cc, cc_id, args, c_file, depfile, dst)
+        if key is not None and cache.get(key, dst):
+            return str(dst)
+
+    # None - воркера нет или он отказал, компилируем сами
+    done: bool|None = remote.compile(c_file, dst, args, depfile, map_stderr) if remote is not None else None
+    if done is None:
+        cmd: list[str] = [cc]+args+["-c", str(c_file), "-o", str(dst)]
+        if depfile is not None:
+            cmd += ["-MMD", "-MF", str(depfile)]
+        done = run_measured(cmd, map_stderr) == 0
+
+    if not done:
         logger.error(f"Ошибка сборки {c_file}!")
         return None
 
+    if cache is not None and key is not None:
+        cache.put(key, dst)
+
     return str(dst)
 
+def copy_tree(src: Path, dst: Path):
+    """
+    copytree, но список файлов src берется из таблицы демона сборки (если она есть),
+    файлы с тем же (mtime, size) в dst не копируются, а файлы dst, которых больше нет в src, удаляются
+    """
+    state: FileState|None = get_file_state()
+    files: dict[str, FileStat]|None = state.tree(src) if state is not None else None
+    if files is None: files = scan(src)
+    wanted: set[Path] = {dst/Path(pth).relative_to(src) for pth in files}
+    prune_tree(dst, wanted)
+    for pth, (mtime_ns, size) in files.items():
+        target: Path = dst/Path(pth).relative_to(src)
+        try:
+            st = os.stat(target)
+            if st.st_mtime_ns == mtime_ns and st.st_size == size: continue
+        except OSError:
+            pass
+        target.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copy2(pth, target)
+
+def prune_tree(root: Path, keep: set[Path]):
+    """
+    удаляет из root файлы не из keep и оставшиеся пустыми директории
+    """
+    if not root.is_dir(): return
+    for dirpath, dirnames, filenames in os.walk(root, topdown=False):
+        for name in filenames:
+            pth = Path(dirpath)/name
+            if pth not in keep: pth.unlink(missing_ok=True)
+        if Path(dirpath) != root and not os.listdir(dirpath):
+            os.rmdir(dirpath)
+
+def get_workers(config: Config) -> int:
+    max_workers: int = config["workers"] if "workers" in config else -1
+    return os.cpu_count() or 1 if max_workers <= 0 else min(max_workers, os.cpu_count() or 1)
+
 # @TODO compile - хуйня переделать 
 #                                                                                       { 1: ["-Wall"] } - index: args
-def compile(src_s: list[Path], dst_s: list[Path], share_args: list[str], personal_args: dict[int, list[str]] = {}) -> list[str]|None:
+def compile(
+    src_s: list[Path],
+    dst_s: list[Path],
+    share_args: list[str],
+    personal_args: dict[int, list[str]] = {},
+    map_stderr: Callable[[str], str]|None = None
+) -> list[str]|None:
     config: Config | None = load_config()
     if config is None:
         return None
@@ -348,32 +721,64 @@ def compile(src_s: list[Path], dst_s: list[Path], share_args: list[str], persona
     if cc is None:
         return None
 
-    obj_files: list[str] = []
-    max_workers: int = config["workers"] if "workers" in config else -1
-    max_workers = os.cpu_count() or 1 if max_workers <= 0 else min(max_workers, os.cpu_count() or 1) 
-    max_workers = min(len(src_s), max_workers)
-
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        futures = [
-            executor.submit(
-                _compile_one,
-                c_file,
-                dst_s[i],
-                cc,
-                share_args+personal_args.get(i, []),
+    incremental: bool = config.get("incremental", True) and supports_depfiles(cc)
+    manifest: BuildManifest|None = BuildManifest(profile_path(MANIFEST_PATH)) if incremental else None
+    # с -gsplit-dwarf рядом с объектником пишется .dwo, а кэш хранит только объектник
+    cache: ObjectCache|None = get_object_cache(config) if supports_depfiles(cc) and "-gsplit-dwarf" not in share_args else None
+    cc_id: str = get_compiler_id(cc) if incremental or cache is not None else ""
+    pool: DistPool|None = get_dist_pool()
+
+    obj_files: list[str|None] = [None]*len(src_s)
+    jobs: dict[int, list[str]] = {}
+    for i, c_file in enumerate(src_s):
+        args: list[str] = share_args+personal_args.get(i, [])
+        if manifest is not None and manifest.is_fresh(str(dst_s[i]), [cc]+args+["-c", str(c_file), "-o", str(dst_s[i])], cc_id):
+            obj_files[i] = str(dst_s[i])
+            continue
+        jobs[i] = args
+
+    if manifest is not None and len(src_s) > 0:
+        logger.info(f"к пересборке {len(jobs)} из {len(src_s)} файлов")
+
+    def compile_node(i: int) -> bool:
+        result = _compile_one(
+            src_s[i],
+            dst_s[i],
+            cc,
+            jobs[i],
+            dst_s[i].with_suffix(".d") if manifest is not None else None,
+            cache,
+            cc_id,
+            map_stderr,
+            pool if in_remote_slot() else None,
+        )
+        if result is None:
+            if manifest is not None: manifest.forget(str(dst_s[i]))
+            return False
+        obj_files[i] = result
+        if manifest is not None:
+            deps: list[str]|None = parse_depfile(dst_s[i].with_suffix(".d"))
+            manifest.record(
+                str(dst_s[i]),
+                [cc]+jobs[i]+["-c", str(src_s[i]), "-o", str(dst_s[i])],
+                cc_id,
+                deps if deps else [str(src_s[i])]
             )
-            for i, c_file in enumerate(src_s)
-        ]
+        return True
 
-        for future in as_completed(futures):
-            result = future.result()
-            if result is None:
-                for f in futures:
-                    f.cancel()
-                return None
-            obj_files.append(result)
+    nodes: list[Node] = [
+        Node(
+            f"cc:{dst_s[i]}", functools.partial(compile_node, i), key=str(src_s[i]),
+            offload=pool is not None and can_offload(src_s[i], jobs[i])
+        )
+        for i in jobs
+    ]
+    ok: bool = run_nodes(nodes, get_workers(config), memory_budget=get_memory_budget(config)) if nodes else True
 
-    return obj_files
+    if manifest is not None: manifest.save()
+    if not ok: return None
+
+    return [o for o in obj_files if o is not None]
 
 def get_config_dir() -> Path | None:
     APP_NAME = "pcpm"
@@ -403,4 +808,14 @@ def get_config_dir() -> Path | None:
 def get_template_config() -> Config | None:
     config_dir: Path|None = get_config_dir()
     if config_dir is None: return None
-    return load_config(config_dir)
\ No newline at end of file
+    return load_config(config_dir)
+
+@functools.lru_cache(maxsize=None)
+def get_package_store() -> PackageStore | None:
+    config_dir: Path|None = get_config_dir()
+    if config_dir is None: return None
+    try:
+        return PackageStore(config_dir/"store")
+    except OSError as e:
+        logger.warning(f"хранилище пакетов недоступно: {e}")
+        return None